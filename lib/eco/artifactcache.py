@@ -0,0 +1,232 @@
+# Copyright (c) 2012--2014 King's College London
+# Created by the Software Development Team <http://soft-dev.org/>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to
+# deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+# sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+
+
+"""On-disk cache for generated parser and lexer artifacts (state graphs,
+syntax tables, automata and lexer matchers).
+
+Every artifact is stored under a key that is the SHA-1 of its inputs (e.g.
+the grammar text and options) and of FORMAT_VERSION, so that keys are the
+same in every interpreter and run. Files are written to a temporary name and
+renamed into place, so readers never see partial artifacts. Once the cache
+grows beyond its size limit, the least recently used artifacts are removed.
+Building and evicting artifacts happens under a lock file in the cache
+directory, which makes it safe to share the cache between processes (e.g. the
+workers of batch.py): a process that misses waits for any concurrent build
+and then reuses its result.
+
+The cache directory defaults to lib/eco/pickle. It and the size limit (in MB)
+can be set with the ECO_CACHE_DIR and ECO_CACHE_SIZE environment variables,
+or with `configure`."""
+
+import os, hashlib, logging, threading
+
+try:
+    import cPickle as pickle
+except:
+    import pickle
+
+try:
+    import fcntl
+except ImportError: # Windows: no locking
+    fcntl = None
+
+# Bump whenever the format of cached artifacts changes
+FORMAT_VERSION = 2
+
+DEFAULT_DIRECTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), "pickle")
+DEFAULT_MAX_SIZE = 256 # MB
+SUFFIX = ".art"
+
+def make_key(kind, *parts):
+    """Return the cache key for an artifact of the given kind that is derived
+    from `parts` (strings, or objects with a stable `str`)."""
+    h = hashlib.sha1()
+    for part in (FORMAT_VERSION, kind) + parts:
+        if isinstance(part, unicode):
+            part = part.encode("utf-8")
+        else:
+            part = str(part)
+        h.update("%d:" % len(part))
+        h.update(part)
+    return "%s-%s" % (kind, h.hexdigest())
+
+def pickle_dumps(value):
+    return pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+
+class ArtifactCache(object):
+
+    def __init__(self, directory=None, max_size=None):
+        self.configure(directory, max_size)
+        self.lock_depth = 0
+        self.lock_file = None
+        self.thread_lock = threading.RLock()
+
+    def configure(self, directory=None, max_size=None):
+        """Set the cache directory and the size limit in MB (0 disables
+        eviction). Unset values are read from the environment."""
+        if directory is None:
+            directory = os.environ.get("ECO_CACHE_DIR") or DEFAULT_DIRECTORY
+        if max_size is None:
+            max_size = int(os.environ.get("ECO_CACHE_SIZE", DEFAULT_MAX_SIZE))
+        self.directory = directory
+        self.max_bytes = max_size * 1024 * 1024
+
+    def path(self, key):
+        return os.path.join(self.directory, key + SUFFIX)
+
+    def contains(self, key):
+        """Return whether an artifact is stored under `key`."""
+        return os.path.exists(self.path(key))
+
+    def load(self, key, loads=pickle.loads):
+        """Return the artifact stored under `key`, or None if there is none."""
+        path = self.path(key)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+        except IOError:
+            return None
+        try:
+            value = loads(data)
+        except Exception:
+            logging.warning("Removing corrupt cache entry %s", path)
+            self.remove(path)
+            return None
+        try:
+            os.utime(path, None) # mark as recently used
+        except OSError:
+            pass
+        return value
+
+    def store(self, key, value, dumps=pickle_dumps):
+        """Write `value` under `key`. Returns whether it could be written."""
+        path = self.path(key)
+        tmpname = "%s.%s.tmp" % (path, os.getpid())
+        try:
+            if not os.path.isdir(self.directory):
+                os.makedirs(self.directory)
+            with open(tmpname, "wb") as f:
+                f.write(dumps(value))
+            os.rename(tmpname, path)
+        except (IOError, OSError) as e:
+            logging.warning("Could not write cache entry %s: %s", path, e)
+            self.remove(tmpname)
+            return False
+        self.evict(keep=path)
+        return True
+
+    def get(self, key, build, dumps=pickle_dumps, loads=pickle.loads):
+        """Return the artifact stored under `key`, calling `build` to create
+        (and store) it if necessary."""
+        value = self.load(key, loads)
+        if value is not None:
+            return value
+        with self:
+            # another process may have built it while we waited
+            value = self.load(key, loads)
+            if value is None:
+                value = build()
+                self.store(key, value, dumps)
+        return value
+
+    def __enter__(self):
+        """Take the cache lock. The lock is reentrant within a thread, and
+        excludes other threads as well as other processes."""
+        self.thread_lock.acquire()
+        if self.lock_depth == 0 and fcntl is not None:
+            try:
+                if not os.path.isdir(self.directory):
+                    os.makedirs(self.directory)
+                self.lock_file = open(os.path.join(self.directory, ".lock"), "a")
+                fcntl.flock(self.lock_file.fileno(), fcntl.LOCK_EX)
+            except (IOError, OSError) as e:
+                # e.g. a read-only cache directory: go on without the lock
+                logging.warning("Could not lock cache %s: %s", self.directory, e)
+                self.lock_file = None
+        self.lock_depth += 1
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.lock_depth -= 1
+        if self.lock_depth == 0 and self.lock_file is not None:
+            fcntl.flock(self.lock_file.fileno(), fcntl.LOCK_UN)
+            self.lock_file.close()
+            self.lock_file = None
+        self.thread_lock.release()
+
+    def entries(self):
+        """Return (last use, size, path) for every artifact, oldest first."""
+        result = []
+        try:
+            names = os.listdir(self.directory)
+        except OSError:
+            return result
+        for name in names:
+            if not name.endswith(SUFFIX):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            result.append((st.st_mtime, st.st_size, path))
+        result.sort()
+        return result
+
+    def size(self):
+        return sum(e[1] for e in self.entries())
+
+    def evict(self, keep=None):
+        """Remove the least recently used artifacts (except `keep`) until the
+        cache fits into its size limit. Returns the number of removed
+        artifacts."""
+        if not self.max_bytes:
+            return 0
+        removed = 0
+        with self:
+            entries = self.entries()
+            total = sum(e[1] for e in entries)
+            for _, size, path in entries:
+                if total <= self.max_bytes:
+                    break
+                if path == keep:
+                    continue
+                self.remove(path)
+                total -= size
+                removed += 1
+        return removed
+
+    def clear(self):
+        with self:
+            for _, _, path in self.entries():
+                self.remove(path)
+
+    def remove(self, path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+cache = ArtifactCache()
+
+def configure(directory=None, max_size=None):
+    cache.configure(directory, max_size)
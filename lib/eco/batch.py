@@ -0,0 +1,221 @@
+# Copyright (c) 2012--2014 King's College London
+# Created by the Software Development Team <http://soft-dev.org/>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to
+# deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+# sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+
+
+"""Headless batch export of Eco documents.
+
+Loads every given document with the JsonManager, builds its parse tree with a
+TreeManager and exports it, without ever creating a QApplication. Documents
+are spread over a pool of worker processes. Each worker keeps the grammars it
+has loaded in `grammars.grammars.registry`, so only the first document of a
+language pays for loading its parser and lexer. With grammar bundles (built
+by --bundles) that first load doesn't need to build anything either.
+
+Usage:
+
+    python2.7 lib/eco/batch.py -o OUTDIR [options] FILE_OR_DIR [FILE_OR_DIR ...]
+
+Grammars are found relative to lib/eco, so main() changes into it once all
+paths given on the command line have been made absolute.
+"""
+
+from __future__ import print_function
+
+import os, sys, time, traceback
+import multiprocessing
+from optparse import OptionParser
+
+class BatchResult(object):
+    def __init__(self, source, dest, ok, time, error=None, language=None):
+        self.source = source
+        self.dest = dest
+        self.ok = ok
+        self.time = time
+        self.error = error
+        self.language = language
+
+    def __repr__(self):
+        return "BatchResult(%r, %r, %s, %.3f)" % (self.source, self.dest, self.ok, self.time)
+
+def find_documents(paths, extensions=(".eco",)):
+    """Expand `paths` into a list of (document, relative name) tuples.
+
+    Directories are searched recursively for files ending in one of
+    `extensions`. Files given explicitly are always included."""
+    documents = []
+    for path in paths:
+        if os.path.isdir(path):
+            for dirpath, dirnames, filenames in os.walk(path):
+                dirnames.sort()
+                for f in sorted(filenames):
+                    if f.endswith(tuple(extensions)):
+                        full = os.path.join(dirpath, f)
+                        documents.append((full, os.path.relpath(full, path)))
+        else:
+            documents.append((path, os.path.basename(path)))
+    return documents
+
+def make_jobs(documents, outdir, ext, fast=False):
+    jobs = []
+    for source, relname in documents:
+        dest = os.path.join(outdir, os.path.splitext(relname)[0] + ext)
+        jobs.append((source, dest, fast))
+    return jobs
+
+def warm_grammars(names):
+    """Load the given languages so that later documents hit the grammar cache."""
+    from grammars.grammars import lang_dict
+    for name in names:
+        try:
+            lang_dict[name].load()
+        except KeyError:
+            print("Warning: unknown language '%s'" % (name,), file=sys.stderr)
+
+def export_document(job):
+    """Load, parse and export a single document. Never raises."""
+    source, dest, fast = job
+    from jsonmanager import JsonManager
+    from treemanager import TreeManager
+    start = time.time()
+    language = None
+    try:
+        language_boxes = JsonManager().load(source)
+        language = language_boxes[0][1]
+        destdir = os.path.dirname(dest)
+        if destdir and not os.path.isdir(destdir):
+            try:
+                os.makedirs(destdir)
+            except OSError:
+                # another worker may have created it in the meantime
+                if not os.path.isdir(destdir):
+                    raise
+        tm = TreeManager()
+        if fast:
+            ex = tm.fast_export(language_boxes, dest, source=source)
+        else:
+            tm.load_file(language_boxes)
+            ex = tm.export(dest, source=source)
+        if ex is False:
+            return BatchResult(source, dest, False, time.time() - start,
+                               "syntactically invalid", language)
+        return BatchResult(source, dest, True, time.time() - start, None, language)
+    except Exception:
+        return BatchResult(source, dest, False, time.time() - start,
+                           traceback.format_exc(), language)
+
+def run_batch(jobs, processes=None, preload=(), callback=None):
+    """Export all `jobs` and return their BatchResults in input order.
+
+    With `processes` set to 1 the jobs are run in the current process, which is
+    useful for debugging and testing."""
+    results = []
+    if processes == 1:
+        warm_grammars(preload)
+        for job in jobs:
+            r = export_document(job)
+            if callback:
+                callback(r)
+            results.append(r)
+        return results
+
+    pool = multiprocessing.Pool(processes, warm_grammars, (list(preload),))
+    try:
+        for r in pool.imap(export_document, jobs):
+            if callback:
+                callback(r)
+            results.append(r)
+    finally:
+        pool.close()
+        pool.join()
+    return results
+
+def print_summary(results, out=sys.stdout, verbose=False):
+    failed = [r for r in results if not r.ok]
+    total = sum(r.time for r in results)
+    print("", file=out)
+    print("%-6s %9s  %s" % ("Status", "Time (s)", "Document"), file=out)
+    for r in results:
+        status = "ok" if r.ok else "FAIL"
+        print("%-6s %9.3f  %s" % (status, r.time, r.source), file=out)
+    if failed:
+        print("", file=out)
+        print("Failures:", file=out)
+        for r in failed:
+            if verbose or "\n" not in r.error.strip():
+                msg = r.error.strip()
+            else:
+                # only show the exception line of the traceback
+                msg = r.error.strip().splitlines()[-1]
+            print("    %s: %s" % (r.source, msg), file=out)
+    print("", file=out)
+    print("%s documents, %s exported, %s failed, %.3fs total worker time" % (
+          len(results), len(results) - len(failed), len(failed), total), file=out)
+
+def main(argv=None):
+    parser = OptionParser(usage="usage: python2.7 %prog -o OUTDIR [options] FILE_OR_DIR...")
+    parser.add_option("-o", "--outdir", default=None, help="Directory to write exported files to")
+    parser.add_option("-x", "--ext", default=".txt", help="Extension of exported files, e.g. '.py' or '.aterms' [default: %default]")
+    parser.add_option("-j", "--jobs", type="int", default=None, help="Number of worker processes [default: number of CPUs]")
+    parser.add_option("-f", "--fast", action="store_true", default=False, help="Export without reparsing the documents")
+    parser.add_option("-p", "--preload", action="append", default=[], help="Load LANGUAGE in every worker before exporting (can be repeated)")
+    parser.add_option("-c", "--cache-dir", default=None, help="Directory for cached parser and lexer artifacts [default: $ECO_CACHE_DIR or lib/eco/pickle]")
+    parser.add_option("-b", "--bundles", action="store_true", default=False, help="Build grammar bundles for all languages (before exporting, if documents are given)")
+    parser.add_option("-v", "--verbose", action="store_true", default=False, help="Show full tracebacks of failed documents")
+    (options, args) = parser.parse_args(argv)
+    args = [os.path.abspath(arg) for arg in args]
+    if options.outdir:
+        options.outdir = os.path.abspath(options.outdir)
+    if options.cache_dir:
+        options.cache_dir = os.path.abspath(options.cache_dir)
+    os.chdir(os.path.dirname(os.path.abspath(__file__)))
+    if options.cache_dir:
+        # workers inherit the environment, whether they are forked or not
+        os.environ["ECO_CACHE_DIR"] = options.cache_dir
+        import artifactcache
+        artifactcache.configure(options.cache_dir)
+    if options.bundles:
+        from grammars.grammars import build_bundles
+        def building(l):
+            print("Building bundle for %s" % (l.name,))
+        build_bundles(callback=building)
+        if not args:
+            return 0
+    if not args or not options.outdir:
+        parser.print_help()
+        return 2
+
+    documents = find_documents(args)
+    jobs = make_jobs(documents, options.outdir, options.ext, options.fast)
+    print("Exporting %s documents to %s" % (len(jobs), options.outdir))
+
+    def progress(r):
+        print("%s %s" % ("." if r.ok else "F", r.source))
+
+    start = time.time()
+    results = run_batch(jobs, options.jobs, options.preload, progress)
+    print_summary(results, verbose=options.verbose)
+    print("Wall time: %.3fs" % (time.time() - start))
+    if [r for r in results if not r.ok]:
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
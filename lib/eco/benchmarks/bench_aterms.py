@@ -0,0 +1,76 @@
+# Copyright (c) 2012--2014 King's College London
+# Created by the Software Development Team <http://soft-dev.org/>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to
+# deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+# sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+
+
+"""Time the ATerms export on documents of doubling size.
+
+Run from lib/eco:
+
+    python2.7 -m benchmarks.bench_aterms [--start N] [--steps N] [language ...]
+
+Each document is imported, parsed and then exported to a temporary file with
+`TreeManager.export_aterms`. Since every node is visited once, the time per
+input character should stay roughly constant as the documents grow."""
+
+from __future__ import print_function
+
+import os, tempfile, time
+from optparse import OptionParser
+
+from benchmarks import corpus
+from benchmarks.editor import new_editor
+
+def bench_export(language, size, repeat):
+    tm = new_editor(language, corpus.sources[language](size))
+    assert tm.parsers[0][0].last_status, "%s input doesn't parse" % language
+    chars = len(tm.export_as_text("/dev/null"))
+    fd, path = tempfile.mkstemp(suffix=".aterms")
+    os.close(fd)
+    try:
+        best = None
+        for i in range(repeat):
+            start = time.time()
+            tm.export_aterms(path)
+            t = time.time() - start
+            if best is None or t < best:
+                best = t
+        return chars, os.path.getsize(path), best
+    finally:
+        os.remove(path)
+
+def main(argv=None):
+    parser = OptionParser(usage="usage: python2.7 -m benchmarks.bench_aterms [options] [language ...]")
+    parser.add_option("-s", "--start", type="int", default=10000, help="Size of the smallest document in characters")
+    parser.add_option("-n", "--steps", type="int", default=4, help="Number of times the size is doubled")
+    parser.add_option("-r", "--repeat", type="int", default=3, help="Number of exports per document (best is reported)")
+    options, args = parser.parse_args(argv)
+    languages = args or ["Java 1.5", "Python 2.7.5"]
+
+    print("%-14s %9s %11s %9s %12s" % ("language", "chars", "term bytes", "time", "us per char"))
+    for language in languages:
+        size = options.start
+        for i in range(options.steps + 1):
+            chars, termsize, t = bench_export(language, size, options.repeat)
+            print("%-14s %9d %11d %8.3fs %12.2f" % (language, chars, termsize, t, t * 1e6 / chars))
+            size *= 2
+
+if __name__ == "__main__":
+    main()
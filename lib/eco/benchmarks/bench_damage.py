@@ -0,0 +1,109 @@
+# Copyright (c) 2012--2014 King's College London
+# Created by the Software Development Team <http://soft-dev.org/>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to
+# deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+# sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+
+
+
+"""Damage caused by single keystrokes: tokens relexed and reused, and the work
+of the following reparse.
+
+Run from lib/eco:
+
+    python2.7 -m benchmarks.bench_damage [--size N] [--edits N] [--seed N] [language ...]
+
+A character is typed at a random position of the document and deleted again,
+`edits` times. Every keystroke is done once with the lexer leaving unchanged
+tokens at the ends of the relexed range untouched and once updating all of
+them, as it did before. Reported are the averages per keystroke."""
+
+from __future__ import print_function
+
+import gc, random, time
+from optparse import OptionParser
+
+from benchmarks.editor import new_editor
+from benchmarks import corpus
+from inclexer.inclexer import IncrementalLexerCF
+
+def tokens(tm):
+    node = tm.get_bos()
+    result = []
+    while node is not None:
+        result.append((node.symbol.name, node.lookup))
+        node = node.next_term
+    return result
+
+def session(name, text, edits, seed):
+    """Return the number of keystrokes, the total number of relexed and reused
+    tokens and of parser steps, the time taken, and the resulting tokens."""
+    tm = new_editor(name, text)
+    parser, lexer = tm.parsers[0][:2]
+    rnd = random.Random(seed)
+    relexed = reused = steps = 0
+    elapsed = 0.0
+    keys = 0
+    # the cyclic GC makes the timings far too noisy
+    gc.collect()
+    gc.disable()
+    try:
+        for i in range(edits):
+            tm.cursor.line = rnd.randrange(len(tm.lines))
+            tm.cursor.move_to_x(rnd.randrange(80))
+            for key in [lambda: tm.key_normal(rnd.choice("x1 .(")), tm.key_backspace]:
+                before = lexer.relexed, lexer.reused
+                start = time.time()
+                key()
+                elapsed += time.time() - start
+                relexed += lexer.relexed - before[0]
+                reused += lexer.reused - before[1]
+                steps += parser.loopcount
+                keys += 1
+    finally:
+        gc.enable()
+    return keys, relexed, reused, steps, elapsed, tokens(tm)
+
+def main(argv=None):
+    parser = OptionParser(usage="usage: python2.7 -m benchmarks.bench_damage [options] [language ...]")
+    parser.add_option("-s", "--size", type="int", default=5000, help="Approximate input size in characters")
+    parser.add_option("-e", "--edits", type="int", default=200, help="Number of characters typed (and deleted)")
+    parser.add_option("--seed", type="int", default=0, help="Seed for the edit positions")
+    options, args = parser.parse_args(argv)
+    languages = args or sorted(corpus.sources)
+
+    print("%-14s %6s %9s %8s %12s %12s %10s %10s" % ("language", "keys", "relexed", "reused",
+          "steps before", "steps", "ms before", "ms"))
+    for name in languages:
+        text = corpus.sources[name](options.size)
+        results = []
+        for reuse in [False, True]:
+            IncrementalLexerCF.reuse_tokens = reuse
+            try:
+                results.append(session(name, text, options.edits, options.seed))
+            finally:
+                IncrementalLexerCF.reuse_tokens = True
+        before, after = results
+        assert before[5] == after[5], "documents differ for %s" % name
+        keys = after[0]
+        print("%-14s %6d %9.2f %8.2f %12.1f %12.1f %10.2f %10.2f" % (name, keys,
+              after[1] / float(keys), after[2] / float(keys), before[3] / float(keys),
+              after[3] / float(keys), before[4] * 1000 / keys, after[4] * 1000 / keys))
+
+if __name__ == "__main__":
+    main()
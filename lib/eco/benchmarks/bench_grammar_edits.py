@@ -0,0 +1,120 @@
+# Copyright (c) 2012--2014 King's College London
+# Created by the Software Development Team <http://soft-dev.org/>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to
+# deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+# sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+
+
+"""Cost of rebuilding the syntax table after editing a single rule.
+
+Run from lib/eco:
+
+    python2.7 -m benchmarks.bench_grammar_edits [--edits N] [--check] [language ...]
+
+For every grammar, N rules are picked and edited in turn, by adding an
+alternative, removing one or changing an annotation. The table of each
+edited grammar is built once from scratch and once reusing the state graph
+of the unedited grammar, as happens when an edited grammar is reloaded.
+With --check, the two tables are compared."""
+
+from __future__ import print_function
+
+import sys, time, copy
+from optparse import OptionParser
+
+from benchmarks.bench_tables import grammar_rules
+from grammars.grammars import languages, lang_dict, EcoFile
+from grammar_parser.gparser import Terminal
+from grammar_parser.bootstrap import AstNode
+from incparser.stategraph import StateGraph
+from incparser.syntaxtable import SyntaxTable
+
+def edit_rule(rules, symbol, kind):
+    """Return a copy of `rules` in which the rule for `symbol` is edited."""
+    rule = copy.copy(rules[symbol])
+    rule.alternatives = list(rule.alternatives)
+    rule.annotations = list(rule.annotations)
+    rule.precs = list(rule.precs)
+    if kind == "add":
+        rule.alternatives.append([Terminal("edited")])
+        rule.annotations.append(None)
+        rule.precs.append(None)
+    elif kind == "remove":
+        del rule.alternatives[-1]
+        del rule.annotations[-1]
+        del rule.precs[-1]
+    elif kind == "annotate":
+        rule.annotations[0] = AstNode("Edited", {})
+    rules = dict(rules)
+    rules[symbol] = rule
+    return rules
+
+def edits(rules, n):
+    """Pick `n` rules spread over the grammar, and an edit for each."""
+    symbols = sorted(rules, key=lambda s: s.name)
+    step = max(1, len(symbols) // n)
+    kinds = ["add", "remove", "annotate"]
+    result = []
+    for symbol in symbols[::step][:n]:
+        kind = kinds[len(result) % len(kinds)]
+        if kind == "remove" and len(rules[symbol].alternatives) < 2:
+            kind = "add"
+        result.append((symbol, kind))
+    return result
+
+def build(bootstrap, rules, previous=None):
+    start = time.time()
+    graph = StateGraph(bootstrap.start_symbol, rules, 1, previous)
+    graph.build()
+    syntaxtable = SyntaxTable(1)
+    syntaxtable.build(graph, bootstrap.precedences)
+    return graph, syntaxtable, time.time() - start
+
+def main(argv=None):
+    parser = OptionParser(usage="usage: python2.7 -m benchmarks.bench_grammar_edits [options] [language ...]")
+    parser.add_option("-n", "--edits", type="int", default=5, help="Number of rules to edit per grammar")
+    parser.add_option("-c", "--check", action="store_true", default=False,
+                      help="Check that both tables are identical")
+    options, args = parser.parse_args(argv)
+    if args:
+        langs = [lang_dict[name] for name in args]
+    else:
+        langs = [lang for lang in languages if type(lang) is EcoFile]
+
+    print("%-28s %-32s %9s %9s %7s %s" % ("language", "edit", "scratch", "reuse", "reused", "check" if options.check else ""))
+    total_scratch = total_reuse = 0
+    for lang in langs:
+        bootstrap = grammar_rules(lang)
+        original, _, _ = build(bootstrap, bootstrap.rules)
+        for symbol, kind in edits(bootstrap.rules, options.edits):
+            rules = edit_rule(bootstrap.rules, symbol, kind)
+            _, table, scratch = build(bootstrap, rules)
+            graph, reused_table, reuse = build(bootstrap, rules, original)
+            total_scratch += scratch
+            total_reuse += reuse
+            check = ""
+            if options.check:
+                check = "same" if table.table == reused_table.table else "DIFFERENT"
+            reused = 100.0 * graph.helper.reused / max(1, graph.closure_count)
+            print("%-28s %-32s %8.2fs %8.2fs %6.0f%% %s" % (lang.name, "%s %s" % (kind, symbol.name[:25]),
+                  scratch, reuse, reused, check))
+            sys.stdout.flush()
+    print("total: scratch %.2fs, reusing the previous graph %.2fs" % (total_scratch, total_reuse))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+# Copyright (c) 2012--2014 King's College London
+# Created by the Software Development Team <http://soft-dev.org/>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to
+# deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+# sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+
+
+
+"""Cost of loading a grammar for a new language box.
+
+Run from lib/eco:
+
+    python2.7 -m benchmarks.bench_grammars [--boxes N] [language ...]
+
+The first load of a language reads the grammar file, builds the rules and
+lexer and loads (or builds) the syntax table. Later loads are served from
+`grammars.grammars.registry`. For comparison, the work the previous cache
+hit did on every load (re-reading and re-parsing the grammar JSON, parsing
+the rules and unpickling the syntax table) is timed as well."""
+
+from __future__ import print_function
+
+import time, hashlib
+from optparse import OptionParser
+
+from benchmarks.editor import new_editor
+from grammars.grammars import lang_dict, registry
+
+def legacy_load(lang):
+    """Repeat what EcoFile.load used to do on a cache hit."""
+    from grammar_parser.bootstrap import BootstrapParser
+    from jsonmanager import JsonManager
+    from incparser.incparser import IncParser
+    root, language, whitespaces = JsonManager(unescape=True).load(lang.filename)[0]
+    hashlib.sha1(file(lang.filename, "rb").read()).hexdigest()
+    pickle_id = lang.cache_key()
+    bootstrap = BootstrapParser(lr_type=1, whitespaces=whitespaces)
+    bootstrap.ast = root
+    bootstrap.parse_rules(root.children[1].children[1].children[0])
+    entry = registry.grammars[lang.name]
+    incparser = IncParser()
+    incparser.from_dict(bootstrap.rules, None, None, entry.whitespace, pickle_id, None)
+    incparser.init_ast()
+
+def timed(f, n):
+    start = time.time()
+    for i in range(n):
+        f()
+    return (time.time() - start) / n
+
+def main(argv=None):
+    parser = OptionParser(usage="usage: python2.7 -m benchmarks.bench_grammars [options] [language ...]")
+    parser.add_option("-n", "--loads", type="int", default=20, help="Number of warm loads to time")
+    parser.add_option("-b", "--boxes", type="int", default=20, help="Number of language boxes to create")
+    options, args = parser.parse_args(argv)
+    languages = args or ["Python 2.7.5", "Java 1.5", "SQL", "PHP"]
+
+    print("%-16s %10s %10s %10s" % ("language", "first", "warm", "previous"))
+    for name in languages:
+        lang = lang_dict[name]
+        registry.clear()
+        first = timed(lang.load, 1)
+        warm = timed(lang.load, options.loads)
+        previous = timed(lambda: legacy_load(lang), options.loads)
+        print("%-16s %8.1fms %8.2fms %8.1fms" % (name, first * 1000, warm * 1000, previous * 1000))
+
+    # language boxes created one after another in the same document
+    registry.clear()
+    tm = new_editor("Python + HTML + SQL")
+    times = []
+    for i in range(options.boxes):
+        start = time.time()
+        tm.add_languagebox(lang_dict["SQL"])
+        times.append(time.time() - start)
+    print()
+    print("SQL boxes:       first %.1f ms, then mean %.2f ms" % (
+          times[0] * 1000, sum(times[1:]) * 1000 / max(1, len(times) - 1)))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+# Copyright (c) 2012--2014 King's College London
+# Created by the Software Development Team <http://soft-dev.org/>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to
+# deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+# sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+
+
+"""Memory use and undo latency of the node history over a long editing
+session.
+
+Run from lib/eco:
+
+    python2.7 -m benchmarks.bench_history [--edits N] [--undos N] [--max-versions N]
+
+The size of the history is measured by walking all nodes that are reachable
+from the current tree or from any saved version. For comparison, the size the
+same history would take in the previous layout (one `(attribute, version)`
+dict entry per saved attribute) is estimated as well."""
+
+from __future__ import print_function
+
+import sys, time
+from optparse import OptionParser
+
+from benchmarks.editor import new_editor, python_session
+from incparser.history import ATTRIBUTES, RetentionPolicy
+
+def all_nodes(tm):
+    """Return every node of the document, including nodes that only survive
+    in old versions."""
+    seen = {}
+    todo = [p[0].previous_version.parent for p in tm.parsers]
+    while todo:
+        node = todo.pop()
+        if id(node) in seen:
+            continue
+        seen[id(node)] = node
+        todo.extend(node.children)
+        for snapshot in node.log.values:
+            todo.extend(snapshot[0])
+    return seen.values()
+
+def history_size(nodes):
+    size = 0
+    lists = {}
+    for node in nodes:
+        log = node.log
+        size += sys.getsizeof(log) + sys.getsizeof(log.versions)
+        size += sys.getsizeof(log.values) + sys.getsizeof(log.changes)
+        for snapshot in log.values:
+            size += sys.getsizeof(snapshot)
+            lists[id(snapshot[0])] = snapshot[0]
+    for l in lists.itervalues():
+        size += sys.getsizeof(l)
+    return size
+
+def legacy_size(nodes):
+    size = 0
+    for node in nodes:
+        log = node.log
+        d = {}
+        for version, snapshot in zip(log.versions, log.values):
+            for attr, value in zip(ATTRIBUTES, snapshot):
+                d[(attr, version)] = value
+            size += sys.getsizeof(list(snapshot[0]))
+        for version in log.changes:
+            d[("ns", version)] = True
+        size += sys.getsizeof(d) + len(d) * sys.getsizeof(("children", 1))
+    return size
+
+def main(argv=None):
+    parser = OptionParser(usage="usage: python2.7 -m benchmarks.bench_history [options]")
+    parser.add_option("-e", "--edits", type="int", default=10000, help="Number of keystrokes in the session")
+    parser.add_option("-u", "--undos", type="int", default=50, help="Number of undo/redo steps to time")
+    parser.add_option("-m", "--max-versions", type="int", help="Retain only this many versions (see RetentionPolicy)")
+    parser.add_option("-l", "--language", default="Python 2.7.5")
+    options, args = parser.parse_args(argv)
+
+    tm = new_editor(options.language)
+    reports = []
+    if options.max_versions:
+        tm.history_policy = RetentionPolicy(max_versions=options.max_versions)
+        enforce = tm.enforce_history_policy
+        def record():
+            report = enforce()
+            if report:
+                reports.append(report)
+            return report
+        tm.enforce_history_policy = record
+    start = time.time()
+    python_session(tm, options.edits)
+    edit_time = time.time() - start
+
+    nodes = all_nodes(tm)
+    size = history_size(nodes)
+    legacy = legacy_size(nodes)
+    print("edits:             %d (%.1f ms per keystroke)" % (options.edits, edit_time * 1000 / options.edits))
+    print("versions:          %d" % tm.get_max_version())
+    print("nodes:             %d" % len(nodes))
+    print("saved snapshots:   %d" % sum(len(n.log) for n in nodes))
+    print("history size:      %.1f KiB" % (size / 1024.0))
+    print("dict layout (est): %.1f KiB" % (legacy / 1024.0))
+    if reports:
+        print("compactions:       %d, %d snapshots, %.1f KiB reclaimed" % (
+              len(reports), sum(r["snapshots"] for r in reports),
+              sum(r["bytes"] for r in reports) / 1024.0))
+
+    for name, key in [("undo", tm.key_ctrl_z), ("redo", tm.key_shift_ctrl_z)]:
+        times = []
+        for i in range(options.undos):
+            start = time.time()
+            key()
+            times.append(time.time() - start)
+        times.sort()
+        print("%s latency:      mean %.2f ms, median %.2f ms, max %.2f ms" % (
+              name, sum(times) * 1000 / len(times), times[len(times) // 2] * 1000, times[-1] * 1000))
+
+if __name__ == "__main__":
+    main()
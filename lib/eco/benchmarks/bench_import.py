@@ -0,0 +1,141 @@
+# Copyright (c) 2012--2014 King's College London
+# Created by the Software Development Team <http://soft-dev.org/>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to
+# deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+# sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+
+
+"""Time and peak memory of opening a large Python file.
+
+Run from lib/eco:
+
+    python2.7 -m benchmarks.bench_import [--size N] [--no-parse]
+
+A Python document of about `size` characters (5 MB by default) is imported
+into an empty editor with the steps of TreeManager.import_file, once as they
+are now and once as they were before: lexing the whole text into a list of
+tokens, appending every terminal directly to the root, scanning the terminals
+for newlines to build the line list, all with the cyclic garbage collector
+running. With --no-parse only the terminal chain and the line list are
+built. The first parse is left out then, whose tree takes most of the memory
+of an opened file: several KB per character of Python, so parsing all of a
+5 MB file needs far more memory than most machines have.
+
+The peak RSS of a process can't be reset, so every import is run in a fresh
+interpreter."""
+
+from __future__ import print_function
+
+import gc, resource, subprocess, sys, time
+from optparse import OptionParser
+
+from benchmarks.editor import new_editor
+from benchmarks import corpus
+from grammar_parser.gparser import Terminal
+from incparser.astree import TextNode
+from treemanager import Line
+
+def legacy_relex_import(lexer, startnode, version):
+    """IncrementalLexerCF.relex_import as it was before it streamed tokens."""
+    success = lexer.lex(startnode.symbol.name)
+    bos = startnode.prev_term # bos
+    startnode.parent.remove_child(startnode)
+    parent = bos.parent
+    eos = parent.children.pop()
+    last_node = bos
+    for match in success:
+        node = TextNode(Terminal(match[0]))
+        node.version = version
+        node.lookup = match[1]
+        parent.children.append(node)
+        last_node.next_term = node
+        last_node.right = node
+        node.left = last_node
+        node.prev_term = last_node
+        node.parent = parent
+        last_node = node
+    parent.children.append(eos)
+    last_node.right = eos # link to eos
+    last_node.next_term = eos
+    eos.left = last_node
+    eos.prev_term = last_node
+
+def peak_rss():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+def open_file(text, legacy, parse):
+    """Import `text` into a new editor. Return the time taken, the peak RSS
+    in KB before and after, the number of terminals and lines, and whether
+    the document parsed."""
+    tm = new_editor("Python 2.7.5")
+    lexer = tm.parsers[0][1]
+    text = text.replace("\n", "\r")
+    before = peak_rss()
+    start = time.time()
+    if not legacy:
+        gc.disable()
+    try:
+        bos = tm.get_bos()
+        new = TextNode(Terminal(text))
+        bos.insert_after(new)
+        if legacy:
+            legacy_relex_import(lexer, new, tm.version + 1)
+            tm.rescan_linebreaks(0)
+        else:
+            newlines = lexer.relex_import(new, tm.version + 1)
+            tm.lines.extend(Line(node) for node in newlines)
+        status = None
+        if parse:
+            tm.reparse(bos)
+            status = tm.parsers[0][0].last_status
+    finally:
+        gc.enable()
+    elapsed = time.time() - start
+    after = peak_rss()
+    terminals = 0
+    node = bos.next_term
+    while node.next_term is not None:
+        terminals += 1
+        node = node.next_term
+    return elapsed, before, after, terminals, len(tm.lines), status
+
+def main(argv=None):
+    parser = OptionParser(usage="usage: python2.7 -m benchmarks.bench_import [options]")
+    parser.add_option("-s", "--size", type="int", default=5000000, help="Approximate file size in characters")
+    parser.add_option("--no-parse", action="store_false", dest="parse", default=True, help="Don't parse the imported file")
+    parser.add_option("--run", choices=["legacy", "streaming"], help="Do a single import in this process and print its results")
+    options, args = parser.parse_args(argv)
+
+    if options.run:
+        text = corpus.python_source(options.size)
+        result = open_file(text, options.run == "legacy", options.parse)
+        print(len(text), *result)
+        return
+
+    print("%-10s %9s %9s %8s %9s %11s %11s %7s" % ("import", "chars", "terminals", "lines",
+          "time", "RSS before", "peak RSS", "parsed"))
+    for mode in ["legacy", "streaming"]:
+        command = [sys.executable, "-m", "benchmarks.bench_import", "--run", mode, "--size", str(options.size)]
+        if not options.parse:
+            command.append("--no-parse")
+        chars, elapsed, before, after, terminals, lines, status = subprocess.check_output(command).split()
+        print("%-10s %9s %9s %8s %8.2fs %9.1fMB %9.1fMB %7s" % (mode, chars, terminals, lines,
+              float(elapsed), int(before) / 1024.0, int(after) / 1024.0, status))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+# Copyright (c) 2012--2014 King's College London
+# Created by the Software Development Team <http://soft-dev.org/>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to
+# deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+# sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+
+
+
+"""Replaying large input logs, edit by edit and as one batch.
+
+Run from lib/eco:
+
+    python2.7 -m benchmarks.bench_inputlog [--size N] [--edits N] [--seed N] [language ...]
+
+A log of `edits` random edits is generated for a document of about `size`
+characters: typing, deleting and pasting comments at the end of random
+lines. It is replayed with the previous apply_inputlog, which evaluated every
+line, with the current one, which parses and saves a version after every
+edit as well, and with the current one as a single batch (TreeManager.batch),
+which parses every changed tree and saves a version only once at the end.
+Reported are the times, the number of versions saved and the number of
+parser steps."""
+
+from __future__ import print_function
+
+import gc, random, time
+from optparse import OptionParser
+
+from benchmarks.editor import new_editor
+from benchmarks import corpus
+
+# line comments, so that the document stays valid whatever line is edited
+comments = {
+    "Java 1.5": "//",
+    "PHP": "//",
+    "Python 2.7.5": "#",
+}
+
+def make_log(name, text, edits, seed):
+    rnd = random.Random(seed)
+    # a comment on an empty line would be indented
+    lines = [i for i, line in enumerate(text.split("\r")) if line.strip()]
+    comment = comments[name]
+    log = []
+    for i in range(edits):
+        log.append("self.cursor.line = %d" % rnd.choice(lines))
+        log.append("self.key_end()")
+        kind = rnd.randrange(3)
+        if kind == 0:
+            for c in " %s x1" % comment:
+                log.append("self.key_normal(%r)" % c)
+        elif kind == 1:
+            log.append("self.pasteText(%r)" % (" %s note" % comment))
+        else:
+            for c in " %s yz" % comment:
+                log.append("self.key_normal(%r)" % c)
+            for j in range(2):
+                log.append("self.key_backspace()")
+    return "\n".join(log)
+
+def legacy_apply_inputlog(tm, inputlog):
+    """TreeManager.apply_inputlog before it compiled repeated lines once."""
+    self = tm
+    for l in inputlog.split("\n"):
+        l = l.replace("\r", "\\r")
+        if l.startswith("#"):
+            continue
+        try:
+            eval(l) # expressions
+        except SyntaxError:
+            exec(l) # statements
+
+def replay(name, text, log, mode):
+    tm = new_editor(name, text)
+    parsers = [p[0] for p in tm.parsers]
+    steps = [0]
+    inc_parse = [p.inc_parse for p in parsers]
+    def counting(parser, inc_parse):
+        def f(*args):
+            result = inc_parse(*args)
+            steps[0] += parser.loopcount
+            return result
+        return f
+    for parser, f in zip(parsers, inc_parse):
+        parser.inc_parse = counting(parser, f)
+    version = tm.version
+    # the cyclic GC makes the timings far too noisy
+    gc.collect()
+    gc.disable()
+    try:
+        start = time.time()
+        if mode == "legacy":
+            legacy_apply_inputlog(tm, log)
+        else:
+            tm.apply_inputlog(log, batch=(mode == "batch"))
+        elapsed = time.time() - start
+    finally:
+        gc.enable()
+    return elapsed, tm.version - version, steps[0], tm.export_as_text(), parsers[0].last_status
+
+def main(argv=None):
+    parser = OptionParser(usage="usage: python2.7 -m benchmarks.bench_inputlog [options] [language ...]")
+    parser.add_option("-s", "--size", type="int", default=20000, help="Approximate input size in characters")
+    parser.add_option("-e", "--edits", type="int", default=200, help="Number of edits in the log")
+    parser.add_option("--seed", type="int", default=0, help="Seed for the edits")
+    options, args = parser.parse_args(argv)
+    languages = args or sorted(corpus.sources)
+
+    print("%-14s %6s %11s %9s %9s %9s %8s %11s %11s" % ("language", "lines", "legacy", "replay",
+          "batch", "versions", "batched", "steps", "batched"))
+    for name in languages:
+        text = corpus.sources[name](options.size)
+        log = make_log(name, text, options.edits, options.seed)
+        legacy, single, batched = [replay(name, text, log, mode) for mode in ["legacy", "replay", "batch"]]
+        assert legacy[3:] == single[3:] == batched[3:], "replays differ for %s" % name
+        print("%-14s %6d %10.2fs %8.2fs %8.2fs %9d %8d %11d %11d" % (name, log.count("\n") + 1,
+              legacy[0], single[0], batched[0], single[1], batched[1], single[2], batched[2]))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+# Copyright (c) 2012--2014 King's College London
+# Created by the Software Development Team <http://soft-dev.org/>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to
+# deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+# sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+
+
+"""LALR(1) tables compared with the LR(1) tables of the bundled grammars.
+
+Run from lib/eco:
+
+    python2.7 -m benchmarks.bench_lalr [--size N] [--repeat N] [language ...]
+
+For every grammar, the LR(1) graph is built and then converted to LALR(1)
+with StateGraph.convert_lalr. Reported are the number of states, table
+entries and conflicts, and the size of the pickled compiled tables. For the
+languages with a corpus, a document is parsed with both tables; the parse
+times are the best of several full reparses, and the parse trees are
+compared."""
+
+from __future__ import print_function
+
+import gc, sys, time, StringIO
+from optparse import OptionParser
+
+from benchmarks.bench_tables import grammar_rules
+from benchmarks.editor import new_editor
+from benchmarks import corpus
+from grammars.grammars import languages, lang_dict, EcoFile
+from incparser.stategraph import StateGraph
+from incparser.syntaxtable import SyntaxTable
+from incparser.constants import LR1, LALR
+from artifactcache import pickle_dumps
+
+def build_table(graph, lr_type, precedences):
+    """Build the table, returning it with the number of conflicts that had
+    to be resolved."""
+    syntaxtable = SyntaxTable(lr_type)
+    stdout = sys.stdout
+    sys.stdout = out = StringIO.StringIO()
+    try:
+        syntaxtable.build(graph, precedences)
+    finally:
+        sys.stdout = stdout
+    return syntaxtable, out.getvalue().count("conflict")
+
+def tables(lang):
+    bootstrap = grammar_rules(lang)
+    graph = StateGraph(bootstrap.start_symbol, bootstrap.rules, LR1)
+    graph.build()
+    lr1 = build_table(graph, LR1, bootstrap.precedences) + (len(graph.state_sets),)
+    start = time.time()
+    graph.convert_lalr()
+    convert = time.time() - start
+    lalr = build_table(graph, LALR, bootstrap.precedences) + (len(graph.state_sets),)
+    return lr1, lalr, convert
+
+def tree(node):
+    """The symbols of a parse tree in preorder."""
+    result = []
+    todo = [node]
+    while todo:
+        node = todo.pop()
+        result.append(node.symbol.name)
+        todo.extend(reversed(node.children))
+    return result
+
+def parse_time(tm, repeat):
+    parser = tm.parsers[0][0]
+    best = None
+    for i in range(repeat):
+        gc.collect()
+        gc.disable()
+        try:
+            start = time.time()
+            parser.reparse()
+            t = time.time() - start
+        finally:
+            gc.enable()
+        best = t if best is None else min(best, t)
+    return best
+
+def parse(name, syntaxtable, text, repeat):
+    tm = new_editor(name)
+    parser = tm.parsers[0][0]
+    parser.syntaxtable = syntaxtable
+    tm.import_file(text)
+    return parser.last_status, parse_time(tm, repeat), tree(parser.previous_version.parent)
+
+def main(argv=None):
+    parser = OptionParser(usage="usage: python2.7 -m benchmarks.bench_lalr [options] [language ...]")
+    parser.add_option("-s", "--size", type="int", default=20000, help="Approximate input size in characters")
+    parser.add_option("-r", "--repeat", type="int", default=5, help="Number of reparses (best is reported)")
+    options, args = parser.parse_args(argv)
+    if args:
+        langs = [lang_dict[name] for name in args]
+    else:
+        langs = [lang for lang in languages if type(lang) is EcoFile]
+
+    print("%-28s %13s %15s %11s %15s %8s" % ("language", "states", "entries", "conflicts", "pickled KB", "convert"))
+    compiled = {}
+    for lang in langs:
+        (lr1, lr1_conflicts, lr1_states), (lalr, lalr_conflicts, lalr_states), convert = tables(lang)
+        compiled[lang.name] = lr1.compile(), lalr.compile()
+        sizes = [len(pickle_dumps(t)) / 1024.0 for t in compiled[lang.name]]
+        print("%-28s %6d %6d %7d %7d %5d %5d %7.0f %7.0f %7.3fs" % (lang.name,
+              lr1_states, lalr_states, len(lr1.table), len(lalr.table),
+              lr1_conflicts, lalr_conflicts, sizes[0], sizes[1], convert))
+        sys.stdout.flush()
+
+    print()
+    print("%-28s %8s %10s %10s %s" % ("language", "chars", "LR(1)", "LALR(1)", "trees"))
+    for name in sorted(corpus.sources):
+        if name not in compiled:
+            continue
+        text = corpus.sources[name](options.size)
+        lr1, lalr = compiled[name]
+        ok1, time1, tree1 = parse(name, lr1, text, options.repeat)
+        ok2, time2, tree2 = parse(name, lalr, text, options.repeat)
+        assert ok1, "%s corpus doesn't parse" % name
+        if not ok2:
+            print("%-28s %8d %9.3fs %10s" % (name, len(text), time1, "error"))
+            continue
+        print("%-28s %8d %9.3fs %9.3fs %s" % (name, len(text), time1, time2,
+              "same" if tree1 == tree2 else "DIFFERENT"))
+
+if __name__ == "__main__":
+    main()
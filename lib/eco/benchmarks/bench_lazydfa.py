@@ -0,0 +1,102 @@
+# Copyright (c) 2012--2014 King's College London
+# Created by the Software Development Team <http://soft-dev.org/>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to
+# deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+# sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+
+
+
+"""Time to open a document with the lexer built eagerly and lazily.
+
+Run from lib/eco:
+
+    python2.7 -m benchmarks.bench_lazydfa [--size N] [language ...]
+
+For every language a lexer is created with an empty artifact cache, as for a
+language that was never used before, and the document is tokenized twice.
+The "code" lexer builds and minimises the whole DFA and generates its code
+before it can lex anything. The "lazy" lexer (see LazyDFA) only builds the
+NFA, and creates DFA states while lexing. Reported are the times to create
+the lexer and of both runs, and how many states each automaton has."""
+
+from __future__ import print_function
+
+import gc, shutil, tempfile, time
+from optparse import OptionParser
+
+from grammars.grammars import lang_dict
+from cflexer.lexer import Lexer
+from artifactcache import cache
+from benchmarks import corpus
+
+def run(lexer, backend, text):
+    """Return the time to create the lexer, the times of two runs over
+    `text`, the number of DFA states and the tokens."""
+    # the cyclic GC makes the timings far too noisy
+    gc.collect()
+    gc.disable()
+    try:
+        return _run(lexer, backend, text)
+    finally:
+        gc.enable()
+
+def _run(lexer, backend, text):
+    start = time.time()
+    l = Lexer(lexer.token_regexs, lexer.names, lexer.ignore.keys(), backend=backend)
+    build = time.time() - start
+    start = time.time()
+    tokens = l.tokenize(text)
+    first = time.time() - start
+    start = time.time()
+    l.tokenize(text)
+    second = time.time() - start
+    if backend == "lazy":
+        states = len(l.automaton.sets)
+    else:
+        states = l.automaton.num_states
+    return build, first, second, states, tokens
+
+def main(argv=None):
+    parser = OptionParser(usage="usage: python2.7 -m benchmarks.bench_lazydfa [options] [language ...]")
+    parser.add_option("-s", "--size", type="int", default=20000, help="Approximate document size in characters")
+    options, args = parser.parse_args(argv)
+    languages = args or sorted(corpus.sources)
+
+    print("%-14s %7s %8s %8s %8s %7s %8s %8s %8s %7s" % ("language", "chars",
+          "build", "lex", "again", "states", "lazy", "lex", "again", "states"))
+    directory = tempfile.mkdtemp()
+    olddirectory = cache.directory
+    try:
+        for name in languages:
+            lexer = lang_dict[name].load()[1].lexer
+            text = corpus.sources[name](options.size)
+            cache.configure(directory)
+            try:
+                code = run(lexer, "code", text)
+                lazy = run(lexer, "lazy", text)
+            finally:
+                cache.clear()
+                cache.configure(olddirectory)
+            assert code[4] == lazy[4], "lexers disagree on %s" % name
+            print("%-14s %7d %7.3fs %7.3fs %7.3fs %7d %7.3fs %7.3fs %7.3fs %7d" % ((name,
+                  len(text)) + code[:4] + lazy[:4]))
+    finally:
+        shutil.rmtree(directory)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,261 @@
+# Copyright (c) 2012--2014 King's College London
+# Created by the Software Development Team <http://soft-dev.org/>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to
+# deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+# sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+
+
+
+"""Cost of building the lexers of the bundled grammars.
+
+Run from lib/eco:
+
+    python2.7 -m benchmarks.bench_lexbuild [--repeat N] [language ...]
+
+By default the lexer of every grammar file in grammars/ is built. Its
+automaton is built from the token definitions, made deterministic, minimised
+and turned into generated code. Reported are the best times of each step,
+the size of the transitions and of the pickled automaton, and the size of the
+generated code. The steps are also timed with their previous
+implementations: the subset construction computed the epsilon-closure of
+every target set from scratch, one character at a time; the states were
+refined Moore-style, starting over after every split; and both worked on one
+dict entry per character and state."""
+
+from __future__ import print_function
+
+import sys, time
+from optparse import OptionParser
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
+
+from grammars.grammars import lang_dict, languages, EcoFile
+from cflexer.deterministic import compress_char_set
+
+def legacy_make_deterministic(nfa, name_precedence):
+    """The subset construction of the previous NFA.make_deterministic.
+    Return the number of states and the transitions of the DFA."""
+    transitions = {}
+    set_to_state = {}
+    names = []
+    stack = []
+    def get_dfa_state(states):
+        states = nfa.epsilon_closure(states)
+        frozenstates = frozenset(states)
+        if frozenstates in set_to_state:
+            return set_to_state[frozenstates]
+        final = bool(filter(None, [state in nfa.final_states for state in states]))
+        name = ", ".join([nfa.names[state] for state in states])
+        name_index = len(name_precedence)
+        for state in states:
+            if state in nfa.unmergeable_states:
+                new_name = nfa.names[state]
+                try:
+                    index = name_precedence.index(new_name)
+                except ValueError:
+                    index = name_index
+                if index < name_index:
+                    name_index = index
+                    name = new_name
+        result = set_to_state[frozenstates] = len(names)
+        names.append((name, final))
+        stack.append((result, states))
+        return result
+    get_dfa_state(nfa.start_states)
+    while stack:
+        fdastate, ndastates = stack.pop()
+        chars_to_states = {}
+        for state in ndastates:
+            for char, next_states in nfa.transitions.get(state, {}).iteritems():
+                chars_to_states.setdefault(char, set()).update(next_states)
+        for char, states in chars_to_states.iteritems():
+            if char is None:
+                continue
+            transitions[fdastate, char] = get_dfa_state(states)
+    return len(names), transitions
+
+def legacy_optimize(num_states, transitions, final_states, unmergeable_states):
+    """The partition refinement of the previous DFA.optimize. Return the
+    number of states of the minimal automaton."""
+    all_chars = set([char for (state, char) in transitions])
+    non_final = frozenset(set(range(num_states)) - final_states - unmergeable_states)
+    final = frozenset(final_states - unmergeable_states)
+    state_to_set = {}
+    equivalence_sets = set()
+    if non_final:
+        equivalence_sets.add(non_final)
+    if final:
+        equivalence_sets.add(final)
+    for state in range(num_states):
+        if state in final:
+            state_to_set[state] = final
+        elif state in unmergeable_states:
+            singleset = frozenset([state])
+            state_to_set[state] = singleset
+            equivalence_sets.add(singleset)
+        else:
+            state_to_set[state] = non_final
+    while len(equivalence_sets) < num_states:
+        new_equivalence_sets = set()
+        changed = False
+        for equivalent in equivalence_sets:
+            for char in all_chars:
+                targets = {}
+                for state in equivalent:
+                    if (state, char) in transitions:
+                        target = state_to_set[transitions[state, char]]
+                    else:
+                        target = None
+                    targets.setdefault(target, set()).add(state)
+                if len(targets) != 1:
+                    for target, newequivalent in targets.iteritems():
+                        newequivalent = frozenset(newequivalent)
+                        new_equivalence_sets.add(newequivalent)
+                        for state in newequivalent:
+                            state_to_set[state] = newequivalent
+                    changed = True
+                    break
+            else:
+                new_equivalence_sets.add(equivalent)
+        if not changed:
+            break
+        equivalence_sets = new_equivalence_sets
+    return len(equivalence_sets)
+
+def legacy_lexing_code(transitions, final_states):
+    """Return the body of the state loop the previous generate_lexing_code
+    emitted: an if/elif chain per state, testing single characters and
+    runs of them, grouped by next state."""
+    lines = []
+    state_to_chars = {}
+    for (state, char), nextstate in transitions.iteritems():
+        state_to_chars.setdefault(state, {}).setdefault(nextstate, set()).add(char)
+    above = set()
+    for state, nextstates in sorted(state_to_chars.items()):
+        above.add(state)
+        lines.append("        if state == %s:" % (state, ))
+        if state in final_states:
+            lines.append("            runner.last_matched_index = i - 1")
+            lines.append("            runner.last_matched_state = state")
+        lines.append("            try:")
+        lines.append("                char = input[i]")
+        lines.append("                i += 1")
+        lines.append("            except IndexError:")
+        lines.append("                runner.state = %s" % (state, ))
+        lines.append("                return %s" % ("i" if state in final_states else "~i"))
+        elif_prefix = ""
+        for nextstate, chars in nextstates.iteritems():
+            body = ["                state = %s" % (nextstate, )]
+            if nextstate in above:
+                body.append("                continue")
+            for a, num in compress_char_set(chars):
+                if num < 3:
+                    for charord in range(ord(a), ord(a) + num):
+                        lines.append("            %sif char == %r:" % (elif_prefix, chr(charord)))
+                        lines.extend(body)
+                        elif_prefix = "el"
+                else:
+                    lines.append("            %sif %r <= char <= %r:" % (elif_prefix, a, chr(ord(a) + num - 1)))
+                    lines.extend(body)
+                    elif_prefix = "el"
+        lines.append("            else:")
+        lines.append("                break")
+    return "\n".join(lines)
+
+def deep_size(obj):
+    """Return the memory taken by a structure of dicts, lists and tuples,
+    not counting the (shared) small ints and characters in it."""
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        for key, value in obj.iteritems():
+            size += deep_size(key) + deep_size(value)
+    elif isinstance(obj, (list, tuple)):
+        for item in obj:
+            size += deep_size(item)
+    else:
+        size = 0
+    return size
+
+def best_of(repeat, f, *args):
+    best = None
+    for i in range(repeat):
+        start = time.time()
+        result = f(*args)
+        t = time.time() - start
+        if best is None or t < best:
+            best = t
+    return best, result
+
+def main(argv=None):
+    parser = OptionParser(usage="usage: python2.7 -m benchmarks.bench_lexbuild [options] [language ...]")
+    parser.add_option("-r", "--repeat", type="int", default=3, help="Number of builds timed")
+    options, args = parser.parse_args(argv)
+    if args:
+        names = args
+    else:
+        # one language per grammar file
+        names = []
+        filenames = set()
+        for language in languages:
+            if type(language) is EcoFile and language.filename not in filenames:
+                filenames.add(language.filename)
+                names.append(language.name)
+
+    print("%-24s %6s %5s %5s %7s %5s %7s %5s %8s %6s %9s %7s %6s %7s" % ("language",
+          "states", "NFA", "DFA", "DFA old", "min", "min old", "code", "code old",
+          "trans", "trans old", "pickle", "src", "src old"))
+    total = [0.0] * 6
+    for name in names:
+        lexer = lang_dict[name].load()[1].lexer
+        nfa_time, nfa = best_of(options.repeat, lexer.rex.make_automaton)
+        dfa_time, dfa = best_of(options.repeat, nfa.make_deterministic, lexer.names)
+        legacy_dfa_time, (legacy_states, legacy_transitions) = best_of(options.repeat,
+                legacy_make_deterministic, nfa, lexer.names)
+        transitions = dfa.transitions
+        # states are numbered in a different order
+        assert legacy_states == dfa.num_states
+        assert len(legacy_transitions) == len(transitions)
+        legacy_time, legacy_states = best_of(options.repeat, legacy_optimize,
+                dfa.num_states, transitions, dfa.final_states, dfa.unmergeable_states)
+        def optimize():
+            automaton = pickle.loads(pickle.dumps(dfa, 2))
+            automaton.optimize()
+            return automaton
+        # the copy isn't part of the time
+        copy_time = best_of(options.repeat, pickle.loads, pickle.dumps(dfa, 2))[0]
+        optimize_time, automaton = best_of(options.repeat, optimize)
+        optimize_time -= copy_time
+        assert automaton.num_states == legacy_states
+        code_time, source = best_of(options.repeat, automaton.generate_lexing_code)
+        transitions = automaton.transitions
+        legacy_code_time, legacy_source = best_of(options.repeat, legacy_lexing_code,
+                transitions, automaton.final_states)
+        print("%-24s %6d %5.3f %5.3f %7.3f %5.3f %7.3f %5.3f %8.3f %5dK %8dK %6dK %6dK %6dK" % (name,
+              automaton.num_states, nfa_time, dfa_time, legacy_dfa_time, optimize_time,
+              legacy_time, code_time, legacy_code_time, deep_size(automaton.ranges) // 1024,
+              deep_size(transitions) // 1024, len(pickle.dumps(automaton, 2)) // 1024,
+              len(source) // 1024, len(legacy_source) // 1024))
+        for i, t in enumerate([dfa_time, legacy_dfa_time, optimize_time, legacy_time,
+                               code_time, legacy_code_time]):
+            total[i] += t
+    print("%-24s %6s %5s %5.3f %7.3f %5.3f %7.3f %5.3f %8.3f" % (("total", "", "") + tuple(total)))
+
+if __name__ == "__main__":
+    main()
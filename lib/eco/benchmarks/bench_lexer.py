@@ -0,0 +1,84 @@
+# Copyright (c) 2012--2014 King's College London
+# Created by the Software Development Team <http://soft-dev.org/>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to
+# deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+# sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+
+
+"""Compare the lexer matcher backends on the bundled grammars.
+
+Run from lib/eco:
+
+    python2.7 -m benchmarks.bench_lexer [--size N] [--repeat N] [language ...]
+
+For every language the whole input is tokenized with the generated code
+matcher and with the table driven matcher, and the throughput of the best
+run is reported in characters per second."""
+
+from __future__ import print_function
+
+import sys, time
+from optparse import OptionParser
+
+from grammars.grammars import lang_dict
+from cflexer.lexer import Lexer
+from benchmarks import corpus
+
+def best_of(repeat, f, *args):
+    best = None
+    for i in range(repeat):
+        start = time.time()
+        f(*args)
+        t = time.time() - start
+        if best is None or t < best:
+            best = t
+    return best
+
+def bench_language(name, size, repeat):
+    _, inclexer = lang_dict[name].load()
+    code = inclexer.lexer
+    start = time.time()
+    table = Lexer(code.token_regexs, code.names, code.ignore.keys(), backend="table")
+    build = time.time() - start
+    text = corpus.sources[name](size)
+
+    expected = code.tokenize(text)
+    assert table.tokenize(text) == expected, "backends disagree on %s" % name
+    result = [name, len(text), len(expected), table.matcher.num_classes, build]
+    for lexer in [code, table]:
+        t = best_of(repeat, lexer.tokenize, text)
+        result.append(len(text) / t)
+    return result
+
+def main(argv=None):
+    parser = OptionParser(usage="usage: python2.7 -m benchmarks.bench_lexer [options] [language ...]")
+    parser.add_option("-s", "--size", type="int", default=200000, help="Approximate input size in characters")
+    parser.add_option("-r", "--repeat", type="int", default=3, help="Number of runs per backend (best is reported)")
+    options, args = parser.parse_args(argv)
+    languages = args or sorted(corpus.sources)
+    for name in languages:
+        if name not in corpus.sources:
+            parser.error("no input available for '%s' (choose from: %s)" % (name, ", ".join(sorted(corpus.sources))))
+
+    print("%-14s %9s %8s %8s %9s %12s %12s %8s" % ("language", "chars", "tokens", "classes", "build", "code c/s", "table c/s", "speedup"))
+    for name in languages:
+        name, chars, tokens, classes, build, code, table = bench_language(name, options.size, options.repeat)
+        print("%-14s %9d %8d %8d %8.3fs %12.0f %12.0f %7.2fx" % (name, chars, tokens, classes, build, code, table, table / code))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+# Copyright (c) 2012--2014 King's College London
+# Created by the Software Development Team <http://soft-dev.org/>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to
+# deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+# sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+
+
+"""Cost of the line bookkeeping per keystroke and per paint in large files.
+
+Run from lib/eco:
+
+    python2.7 -m benchmarks.bench_lines [--lines N] [--repeat N]
+
+For a document of `lines` lines, the operations the editor does on its lines
+are timed on a plain list, as TreeManager.lines was before, and on a
+LineIndex: inserting and deleting a line in the middle (typing and deleting
+a newline), saving the lines for the new version, finding the first visible
+line in the middle of the document and the height above the cursor (paint),
+and the total height and width (scroll bars)."""
+
+from __future__ import print_function
+
+import time
+from optparse import OptionParser
+
+from lineindex import LineIndex
+from treemanager import Line
+
+def make_lines(count):
+    lines = []
+    for i in range(count):
+        line = Line(i, height=2 if i % 10 == 0 else 1)
+        line.width = i % 80
+        lines.append(line)
+    return lines
+
+# The operations as TreeManager and NodeEditor did them on the list
+
+def list_save(lines, saved):
+    saved.append(list(lines))
+
+def list_find_height(lines, y):
+    visual_line = 0
+    internal_line = 0
+    for l in lines:
+        if visual_line + l.height > y:
+            break
+        visual_line += l.height
+        internal_line += 1
+    return internal_line, visual_line
+
+def list_height_before(lines, i):
+    y = 0
+    for l in lines[:i]:
+        y += l.height
+    return y
+
+def list_scroll_size(lines):
+    total_lines = 0
+    max_width = 0
+    for l in lines:
+        total_lines += l.height
+        max_width = max(max_width, l.width)
+    return total_lines, max_width
+
+def index_save(lines, saved):
+    saved.append(lines.root)
+
+def index_find_height(lines, y):
+    return lines.find_height(y)
+
+def index_height_before(lines, i):
+    return lines.height_before(i)
+
+def index_scroll_size(lines):
+    return lines.height, lines.width
+
+def run(lines, save, find_height, height_before, scroll_size, repeat):
+    """Return the average time in ms of every operation."""
+    middle = len(lines) // 2
+    y = sum(l.height for l in make_lines(middle))
+    saved = []
+    times = {}
+    def measure(name, f):
+        start = time.time()
+        for i in range(repeat):
+            f()
+        times[name] = (time.time() - start) * 1000 / repeat
+    def edit():
+        lines.insert(middle, Line(None))
+        del lines[middle]
+    measure("insert+delete", edit)
+    measure("save", lambda: save(lines, saved))
+    measure("first visible", lambda: find_height(lines, y))
+    measure("height above", lambda: height_before(lines, middle))
+    measure("scroll size", lambda: scroll_size(lines))
+    assert find_height(lines, y)[0] == middle
+    return times
+
+def main(argv=None):
+    parser = OptionParser(usage="usage: python2.7 -m benchmarks.bench_lines [options]")
+    parser.add_option("-l", "--lines", type="int", default=200000, help="Number of lines of the document")
+    parser.add_option("-r", "--repeat", type="int", default=20, help="Repetitions of every operation")
+    options, args = parser.parse_args(argv)
+
+    lines = make_lines(options.lines)
+    legacy = run(list(lines), list_save, list_find_height, list_height_before,
+                 list_scroll_size, options.repeat)
+    index = run(LineIndex(lines), index_save, index_find_height, index_height_before,
+                index_scroll_size, options.repeat)
+    print("%d lines" % options.lines)
+    print("%-15s %12s %12s" % ("operation", "list ms", "index ms"))
+    for name in ["insert+delete", "save", "first visible", "height above", "scroll size"]:
+        print("%-15s %12.3f %12.3f" % (name, legacy[name], index[name]))
+
+if __name__ == "__main__":
+    main()
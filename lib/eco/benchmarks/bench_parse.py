@@ -0,0 +1,124 @@
+# Copyright (c) 2012--2014 King's College London
+# Created by the Software Development Team <http://soft-dev.org/>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to
+# deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+# sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+
+
+
+"""Overhead of plugin dispatch while parsing.
+
+Run from lib/eco:
+
+    python2.7 -m benchmarks.bench_parse [--size N] [--repeat N] [language ...]
+
+Every document is reparsed from scratch, once with the parser's own plugin
+manager and once with the previous one, which looked up the hooks of all
+loaded plugins on every call. The difference divided by the number of parser
+steps is the dispatch overhead per shift/reduce."""
+
+from __future__ import print_function
+
+import gc, time
+from optparse import OptionParser
+
+from benchmarks.editor import new_editor
+from benchmarks import corpus
+
+class LegacyPluginManager(object):
+    """The plugin manager before dispatchers were resolved ahead of time."""
+
+    def __init__(self, loaded):
+        self.loaded = loaded
+
+    def __getattr__(self, attr):
+        funcs = []
+        if attr.startswith("do_"):
+            fname = attr[3:]
+            for p in self.loaded:
+                try:
+                    funcs.append(p.__getattribute__(fname))
+                except AttributeError:
+                    pass
+            def func(*args, **kwargs):
+                for f in funcs:
+                    f(*args, **kwargs)
+            return func
+        return object.__getattribute__(self, attr)
+
+def reparse_time(parser):
+    # the cyclic GC makes single runs far too noisy
+    gc.collect()
+    gc.disable()
+    try:
+        start = time.time()
+        parser.reparse()
+        return time.time() - start
+    finally:
+        gc.enable()
+
+def compare(parser, repeat):
+    """Return the best reparse times with the legacy and the parser's own
+    plugin manager. Runs alternate between both, so that both see the same
+    conditions."""
+    pm = parser.pm
+    legacy = LegacyPluginManager(pm.loaded)
+    times = {pm: [], legacy: []}
+    for i in range(repeat):
+        for m in [pm, legacy]:
+            parser.pm = m
+            times[m].append(reparse_time(parser))
+    parser.pm = pm
+    return min(times[legacy]), min(times[pm])
+
+def dispatch_time(pm, n=100000):
+    """Time per call of the reduce hook."""
+    from incparser.astree import TextNode
+    from grammar_parser.gparser import Nonterminal
+    node = TextNode(Nonterminal("x"))
+    start = time.time()
+    for i in xrange(n):
+        pm.do_incparse_reduce(node)
+    return (time.time() - start) / n
+
+def main(argv=None):
+    parser = OptionParser(usage="usage: python2.7 -m benchmarks.bench_parse [options] [language ...]")
+    parser.add_option("-s", "--size", type="int", default=20000, help="Approximate input size in characters")
+    parser.add_option("-r", "--repeat", type="int", default=5, help="Number of reparses (best is reported)")
+    options, args = parser.parse_args(argv)
+    languages = args or ["Java 1.5", "Python 2.7.5"]
+
+    print("%-14s %8s %8s %10s %10s %12s" % ("language", "chars", "steps", "legacy", "resolved", "us per step"))
+    for name in languages:
+        tm = new_editor(name, corpus.sources[name](options.size))
+        p = tm.parsers[0][0]
+        assert p.last_status, "%s corpus doesn't parse" % name
+        legacy, resolved = compare(p, options.repeat)
+        steps = p.loopcount
+        print("%-14s %8d %8d %9.3fs %9.3fs %12.2f" % (name, len(tm.export_as_text()), steps,
+              legacy, resolved, (legacy - resolved) * 1e6 / steps))
+
+    # a single hook call, for a language with and without indentation
+    print()
+    for name in ["Java 1.5", "Python 2.7.5"]:
+        pm = new_editor(name).parsers[0][0].pm
+        print("%-14s hook call: legacy %.2f us, resolved %.2f us" % (name,
+              dispatch_time(LegacyPluginManager(pm.loaded)) * 1e6, dispatch_time(pm) * 1e6))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,166 @@
+# Copyright (c) 2012--2014 King's College London
+# Created by the Software Development Team <http://soft-dev.org/>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to
+# deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+# sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+
+
+
+"""Mapping between offsets, lines and nodes in large documents.
+
+Run from lib/eco:
+
+    python2.7 -m benchmarks.bench_positions [--size N] [--queries N] [--seed N]
+
+A Python document of about `size` characters is imported and parsed. Timed are
+looking up the terminal at a random offset, the line of a random terminal (as
+jump_to_error does) and the start of a random line (as RubyParser does for the
+errors of its external parser), once by scanning the terminals and lines as
+before and once through the extents cached on the nonterminals. The indexed
+queries are also timed right after a keystroke, which invalidates the extents
+on the path from the changed token to the root. The first query, which
+computes the extents of the whole tree, is reported separately."""
+
+from __future__ import print_function
+
+import gc, random, time
+from optparse import OptionParser
+
+from benchmarks.editor import new_editor
+from benchmarks import corpus
+from incparser.astree import BOS, EOS
+from grammar_parser.gparser import IndentationTerminal
+
+# The scans as AST, TreeManager and RubyParser did them before (without
+# counting the names of indentation tokens as text)
+
+def legacy_node_at_pos(ast, pos):
+    progress = 0
+    node = ast.parent.children[0]
+    while node is not None:
+        if not isinstance(node.symbol, IndentationTerminal):
+            progress += len(node.symbol.name)
+        if pos <= progress:
+            return node
+        node = node.next_terminal()
+
+def legacy_line_of(tm, node):
+    linenode = node
+    while True:
+        if isinstance(linenode, BOS):
+            break
+        if linenode.symbol.name == "\r":
+            break
+        linenode = tm.cursor.find_previous_visible(linenode)
+    linenr = 0
+    for line in tm.lines:
+        if line.node is linenode:
+            break
+        linenr += 1
+    return linenr
+
+def legacy_line_start(ast, lineno):
+    node = ast.parent.children[0]
+    current_line = 0
+    offset = 0
+    while current_line < lineno:
+        node = node.next_term
+        if isinstance(node, EOS):
+            break
+        if node.symbol.name == "\r":
+            current_line += 1
+        if not isinstance(node.symbol, IndentationTerminal):
+            offset += len(node.symbol.name)
+    return offset
+
+def visible(tm):
+    result = []
+    node = tm.get_bos().next_term
+    while not isinstance(node, EOS):
+        if tm.cursor.is_visible(node):
+            result.append(node)
+        node = node.next_term
+    return result
+
+def measure(f, args):
+    start = time.time()
+    results = [f(*a) for a in args]
+    return (time.time() - start) * 1000 / len(args), results
+
+def main(argv=None):
+    parser = OptionParser(usage="usage: python2.7 -m benchmarks.bench_positions [options]")
+    parser.add_option("-s", "--size", type="int", default=100000, help="Approximate input size in characters")
+    parser.add_option("-q", "--queries", type="int", default=200, help="Number of queries of every kind")
+    parser.add_option("--seed", type="int", default=0, help="Seed for the queried positions")
+    options, args = parser.parse_args(argv)
+
+    tm = new_editor("Python 2.7.5", corpus.python_source(options.size))
+    # collect the garbage of the import, which would be collected later
+    gc.collect()
+    ast = tm.parsers[0][0].previous_version
+    text = tm.export_as_text()
+    nodes = visible(tm)
+    rnd = random.Random(options.seed)
+    offsets = [(rnd.randrange(1, len(text)),) for i in range(options.queries)]
+    terminals = [(rnd.choice(nodes),) for i in range(options.queries)]
+    lines = [(rnd.randrange(len(tm.lines)),) for i in range(options.queries)]
+
+    # the first query computes the extents of all nonterminals
+    start = time.time()
+    ast.parent.get_extent()
+    first = (time.time() - start) * 1000
+
+    rows = []
+    legacy = measure(lambda pos: legacy_node_at_pos(ast, pos), offsets)
+    index = measure(lambda pos: ast.find_node_at_pos(pos)[0], offsets)
+    assert legacy[1] == index[1]
+    rows.append(("node at offset", legacy[0], index[0]))
+    legacy = measure(lambda node: legacy_line_of(tm, node), terminals)
+    index = measure(tm.get_line_of, terminals)
+    assert legacy[1] == index[1]
+    rows.append(("line of node", legacy[0], index[0]))
+    legacy = measure(lambda line: legacy_line_start(ast, line), lines)
+    index = measure(ast.find_line_start, lines)
+    assert legacy[1] == index[1]
+    rows.append(("line start", legacy[0], index[0]))
+
+    # every query right after a keystroke in the middle of the document
+    tm.cursor.line = len(tm.lines) // 2
+    tm.cursor.move_to_x(4)
+    def edited(f):
+        def query(*args):
+            tm.key_normal("x")
+            tm.key_backspace()
+            start = time.time()
+            f(*args)
+            return time.time() - start
+        return query
+    after_edit = [
+        measure(edited(lambda pos: ast.find_node_at_pos(pos)), offsets)[1],
+        measure(edited(tm.get_line_of), terminals)[1],
+        measure(edited(ast.find_line_start), lines)[1],
+    ]
+
+    print("%d characters, %d lines, %d visible terminals" % (len(text), len(tm.lines), len(nodes)))
+    print("first query: %.1fms" % first)
+    print("%-15s %12s %12s %12s" % ("query", "scan ms", "index ms", "edited ms"))
+    for row, times in zip(rows, after_edit):
+        print("%-15s %12.3f %12.3f %12.3f" % (row + (sum(times) * 1000 / len(times),)))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,170 @@
+# Copyright (c) 2012--2014 King's College London
+# Created by the Software Development Team <http://soft-dev.org/>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to
+# deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+# sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+
+
+"""Relexing cost of typing inside long string literals and comments.
+
+Run from lib/eco:
+
+    python2.7 -m benchmarks.bench_relex [--size N] [--keys N]
+
+Every document contains a block of text of about `size` characters on many
+lines. The block is turned into a string literal (SimpleLanguage) or a
+multi-line comment (HTML) by typing its opening delimiter, which makes the
+lexer read through the whole block, and then some characters are typed in the
+middle of it. Both are timed with the lexer reading the tree through a
+NodeCursor and through the previous StringWrapper, which walked from the first
+node to the requested index on every character access."""
+
+from __future__ import print_function
+
+import sys, time
+from optparse import OptionParser
+
+from benchmarks.editor import new_editor, type_text
+from grammar_parser.gparser import MagicTerminal, IndentationTerminal
+from incparser.astree import EOS
+from utils import KEY_DOWN
+import inclexer.inclexer
+
+class LegacyStringWrapper(object):
+    """The text wrapper the lexer used before NodeCursor."""
+
+    def __init__(self, startnode):
+        self.node = startnode
+        self.length = sys.maxint
+
+    def __len__(self):
+        return self.length
+
+    def __getitem__(self, index):
+        startindex = index
+        node = self.node
+        if isinstance(node.symbol, IndentationTerminal):
+            node = node.next_term
+        if isinstance(node, EOS):
+            raise IndexError
+        while index > len(node.symbol.name) - 1:
+            index -= len(node.symbol.name)
+            node = node.next_term
+            if node is None:
+                raise IndexError
+            if isinstance(node.symbol, IndentationTerminal):
+                node = node.next_term
+            if isinstance(node, EOS):
+                raise IndexError
+        if node.next_term and (isinstance(node.next_term, EOS) or isinstance(node.next_term.symbol, IndentationTerminal) or node.next_term.symbol.name == "\r" or isinstance(node.next_term.symbol, MagicTerminal)):
+            self.length = startindex + len(node.symbol.name[index:])
+        return node.symbol.name[index]
+
+    def __getslice__(self, start, stop):
+        if stop <= start:
+            return ""
+
+        name = self.node.symbol.name
+        if start < len(name) and stop < len(name):
+            return name[start: stop]
+
+        text = []
+        node = self.node
+        i = 0
+        while i < stop:
+            text.append(node.symbol.name)
+            i += len(node.symbol.name)
+            node = node.next_term
+            if isinstance(node, EOS):
+                break
+            if isinstance(node.symbol, IndentationTerminal):
+                break
+            if node.symbol.name == "\r":
+                break
+            if isinstance(node.symbol, MagicTerminal):
+                break
+
+        return "".join(text)[start:stop]
+
+# (name, language, text before the block, text after the block, delimiter)
+scenarios = [
+    ("string literal", "SimpleLanguage", "function main() {\n  s = ", ";\n}\n", '"'),
+    ("comment", "HTML", "<html>\n", "\n</html>\n", "<!--"),
+]
+
+def block(size):
+    lines = []
+    chars = 0
+    while chars < size:
+        line = "line %d of a long block of text" % len(lines)
+        lines.append(line)
+        chars += len(line) + 1
+    return lines
+
+def tokens(tm):
+    node = tm.get_bos()
+    result = []
+    while node is not None:
+        result.append((node.symbol.name, node.lookup))
+        node = node.next_term
+    return result
+
+def run(scenario, lines, keys):
+    """Type the opening delimiter in front of the block and then `keys`
+    characters in its middle. Return the time of the first and the average
+    time of the other keystrokes, and the resulting tokens."""
+    name, language, before, after, delimiter = scenario
+    tm = new_editor(language, before + "\n".join(lines) + after)
+    tm.cursor_reset()
+    for i in range(before.count("\n")):
+        tm.key_cursors(KEY_DOWN)
+    tm.key_end()
+    start = time.time()
+    type_text(tm, delimiter)
+    opening = time.time() - start
+
+    for i in range(len(lines) // 2):
+        tm.key_cursors(KEY_DOWN)
+    start = time.time()
+    type_text(tm, "x" * keys)
+    typing = (time.time() - start) / keys
+    return opening, typing, tokens(tm)
+
+def main(argv=None):
+    parser = OptionParser(usage="usage: python2.7 -m benchmarks.bench_relex [options]")
+    parser.add_option("-s", "--size", type="int", default=10000, help="Approximate size of the text block in characters")
+    parser.add_option("-k", "--keys", type="int", default=10, help="Number of characters typed inside the block")
+    options, args = parser.parse_args(argv)
+    lines = block(options.size)
+
+    print("%-15s %6s %6s %12s %12s %12s %12s" % ("", "chars", "lines", "open legacy", "open", "key legacy", "key"))
+    cursor = inclexer.inclexer.NodeCursor
+    for scenario in scenarios:
+        try:
+            inclexer.inclexer.NodeCursor = LegacyStringWrapper
+            legacy = run(scenario, lines, options.keys)
+        finally:
+            inclexer.inclexer.NodeCursor = cursor
+        result = run(scenario, lines, options.keys)
+        assert result[2] == legacy[2], "relexing differs for %s" % scenario[0]
+        print("%-15s %6d %6d %11.3fs %11.3fs %10.2fms %10.2fms" % (scenario[0],
+              sum(len(l) + 1 for l in lines), len(lines),
+              legacy[0], result[0], legacy[1] * 1000, result[1] * 1000))
+
+if __name__ == "__main__":
+    main()
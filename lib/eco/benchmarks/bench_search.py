@@ -0,0 +1,137 @@
+# Copyright (c) 2012--2014 King's College London
+# Created by the Software Development Team <http://soft-dev.org/>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to
+# deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+# sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+
+
+
+"""Searching a document: selecting the next match (F3) and finding all
+matches, before and after an edit.
+
+Run from lib/eco:
+
+    python2.7 -m benchmarks.bench_search [--size N] [--repeat N] [language ...]
+
+Every document is searched for a frequent word, a word it doesn't contain
+and a phrase spanning several tokens. Find next is timed with TreeManager's
+search index and with the previous find_text, which walked the tokens from
+the cursor and only matched text inside a single token. The index is built
+by the first search after the import (after the nonterminals' extents,
+which other queries share, were computed). "after edit" is the next search
+after a keystroke, which refreshes the index first. "phrase" is the number
+of matches of a phrase spanning tokens, which find_text couldn't find. Times
+are in milliseconds."""
+
+from __future__ import print_function
+
+import gc, time
+from optparse import OptionParser
+
+from benchmarks.editor import new_editor
+from benchmarks import corpus
+from grammar_parser.gparser import MagicTerminal
+from incparser.astree import EOS
+
+frequent = "return"
+missing = "nowhere"
+phrase = "result +="
+
+def legacy_find_text(tm, text):
+    """TreeManager.find_text before the search index."""
+    startnode = tm.cursor.node
+    node = tm.cursor.node.next_term
+    line = tm.cursor.line
+    index = -1
+    while node is not tm.cursor.node:
+        if node is startnode:
+            break
+        if isinstance(node.symbol, MagicTerminal):
+            node = node.symbol.ast.children[0]
+            continue
+        if isinstance(node, EOS):
+            root = node.get_root()
+            lbox = root.get_magicterminal()
+            if lbox:
+                node = lbox.next_term
+                continue
+            else:
+                # start from beginning
+                node = tm.get_bos()
+                line = 0
+        index = node.symbol.name.find(text)
+        if index > -1:
+            break
+
+        if node.symbol.name == "\r":
+            line += 1
+        node = node.next_term
+    if index > -1:
+        tm.cursor.line = line
+        tm.cursor.node = node
+        tm.cursor.pos = index
+        tm.selection_start = tm.cursor.copy()
+        tm.cursor.pos += len(text)
+        tm.selection_end = tm.cursor.copy()
+    tm.last_search = text
+
+def timed(f, repeat):
+    start = time.time()
+    for i in range(repeat):
+        f()
+    return (time.time() - start) * 1000 / repeat
+
+def run(name, text, repeat):
+    tm = new_editor(name, text)
+    tm.get_bos().parent.get_extent()
+    # the cyclic GC makes the timings far too noisy
+    gc.collect()
+    gc.disable()
+    try:
+        index = timed(tm.get_search_index, 1)
+        results = []
+        for find in [lambda t: legacy_find_text(tm, t), tm.find_text]:
+            tm.cursor_reset()
+            results.append(timed(lambda: find(frequent), repeat))
+            results.append(timed(lambda: find(missing), repeat))
+        editing = 0.0
+        for i in range(repeat):
+            tm.key_normal("x")
+            tm.key_backspace()
+            editing += timed(lambda: tm.find_text(frequent), 1) / repeat
+        phrases = len(tm.find_all(phrase))
+    finally:
+        gc.enable()
+    return [index] + results + [editing, phrases]
+
+def main(argv=None):
+    parser = OptionParser(usage="usage: python2.7 -m benchmarks.bench_search [options] [language ...]")
+    parser.add_option("-s", "--size", type="int", default=50000, help="Approximate input size in characters")
+    parser.add_option("-r", "--repeat", type="int", default=50, help="Number of searches timed")
+    options, args = parser.parse_args(argv)
+    languages = args or sorted(corpus.sources)
+
+    print("%-14s %8s %12s %15s %8s %8s %11s %7s" % ("language", "index", "next legacy",
+          "missing legacy", "next", "missing", "after edit", "phrase"))
+    for name in languages:
+        text = corpus.sources[name](options.size)
+        print("%-14s %8.2f %12.3f %15.3f %8.3f %8.3f %11.3f %7d" % ((name,) +
+              tuple(run(name, text, options.repeat))))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+# Copyright (c) 2012--2014 King's College London
+# Created by the Software Development Team <http://soft-dev.org/>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to
+# deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+# sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+
+
+
+"""Cold start: time to load a language in a fresh process.
+
+Run from lib/eco:
+
+    python2.7 -m benchmarks.bench_startup [--runs N] [language ...]
+
+Each measurement starts a new interpreter, which imports the grammar registry
+and loads one language. It is done once with grammar bundles (building them
+first if necessary) and once without, in which case the grammar is parsed and
+the parser and lexer are created from it (their tables still come from the
+artifact cache)."""
+
+from __future__ import print_function
+
+import sys, time, subprocess
+from optparse import OptionParser, SUPPRESS_HELP
+
+def child(name, bundles):
+    start = time.time()
+    import grammars.grammars as g
+    g.use_bundles = bundles
+    imported = time.time()
+    g.lang_dict[name].load()
+    end = time.time()
+    print("%f %f" % (imported - start, end - imported))
+
+def measure(name, bundles, runs):
+    args = [sys.executable, "-m", "benchmarks.bench_startup", "--child", name]
+    if not bundles:
+        args.append("--no-bundles")
+    best = None
+    for i in range(runs):
+        output = subprocess.check_output(args, stderr=open("/dev/null", "w"))
+        times = tuple(float(t) for t in output.split()[-2:])
+        if best is None or sum(times) < sum(best):
+            best = times
+    return best
+
+def main(argv=None):
+    parser = OptionParser(usage="usage: python2.7 -m benchmarks.bench_startup [options] [language ...]")
+    parser.add_option("-r", "--runs", type="int", default=3, help="Best of N runs")
+    parser.add_option("--child", help=SUPPRESS_HELP)
+    parser.add_option("--no-bundles", action="store_true", default=False, help=SUPPRESS_HELP)
+    options, args = parser.parse_args(argv)
+    if options.child:
+        child(options.child, not options.no_bundles)
+        return
+
+    languages = args or ["Python 2.7.5", "Java 1.5", "PHP + Python", "Python + HTML + SQL", "HTML + Python + SQL"]
+    from grammars.grammars import build_bundles, lang_dict
+    build_bundles([lang_dict[name] for name in languages])
+
+    print("%-22s %10s %12s %12s" % ("language", "import", "no bundle", "bundle"))
+    for name in languages:
+        imported, without = measure(name, False, options.runs)
+        _, bundled = measure(name, True, options.runs)
+        print("%-22s %8.0fms %10.0fms %10.0fms" % (name, imported * 1000, without * 1000, bundled * 1000))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+# Copyright (c) 2012--2014 King's College London
+# Created by the Software Development Team <http://soft-dev.org/>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to
+# deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+# sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+
+
+"""Time building the LR(1) state graph and syntax table of every grammar in
+`grammars/`.
+
+Run from lib/eco:
+
+    python2.7 -m benchmarks.bench_tables [--check] [language ...]
+
+With --check, every table is compared against the one in the artifact cache
+(if the language has been loaded before), so changes to the table
+construction can be checked for producing identical tables."""
+
+from __future__ import print_function
+
+import sys, time
+from optparse import OptionParser
+
+from grammars.grammars import languages, lang_dict, EcoFile
+from grammar_parser.bootstrap import BootstrapParser
+from jsonmanager import JsonManager
+from incparser.stategraph import StateGraph
+from incparser.syntaxtable import SyntaxTable
+from artifactcache import cache, make_key
+
+def grammar_rules(lang):
+    """Return a BootstrapParser holding the complete rules of `lang`."""
+    root, language, whitespaces = JsonManager(unescape=True).load(lang.filename)[0]
+    bootstrap = BootstrapParser(lr_type=1, whitespaces=whitespaces)
+    bootstrap.ast = root
+    bootstrap.extra_alternatives = lang.alts
+    bootstrap.change_startrule = lang.extract
+    bootstrap.read_options()
+    bootstrap.parse_both()
+    bootstrap.add_implicit_rules()
+    return bootstrap
+
+def cached_table(lang, bootstrap):
+    key = make_key("syntaxtable", lang.cache_key(), bootstrap.implicit_ws(), 1)
+    return cache.load(key)
+
+def main(argv=None):
+    parser = OptionParser(usage="usage: python2.7 -m benchmarks.bench_tables [options] [language ...]")
+    parser.add_option("-c", "--check", action="store_true", default=False,
+                      help="Compare the tables with the cached ones")
+    options, args = parser.parse_args(argv)
+    if args:
+        langs = [lang_dict[name] for name in args]
+    else:
+        langs = [lang for lang in languages if type(lang) is EcoFile]
+
+    print("%-28s %6s %9s %9s %s" % ("language", "states", "graph", "table", "check" if options.check else ""))
+    total = 0
+    for lang in langs:
+        bootstrap = grammar_rules(lang)
+        start = time.time()
+        graph = StateGraph(bootstrap.start_symbol, bootstrap.rules, 1)
+        graph.build()
+        graph_time = time.time() - start
+        start = time.time()
+        syntaxtable = SyntaxTable(1)
+        syntaxtable.build(graph, bootstrap.precedences)
+        table_time = time.time() - start
+        total += graph_time + table_time
+
+        check = ""
+        if options.check:
+            cached = cached_table(lang, bootstrap)
+            if cached is None:
+                check = "not cached"
+            elif cached.table == syntaxtable.table:
+                check = "same"
+            else:
+                check = "DIFFERENT"
+        print("%-28s %6d %8.2fs %8.2fs %s" % (lang.name, len(graph.state_sets), graph_time, table_time, check))
+        sys.stdout.flush()
+    print("total %.2fs" % total)
+
+if __name__ == "__main__":
+    main()
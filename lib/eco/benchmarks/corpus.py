@@ -0,0 +1,119 @@
+# Copyright (c) 2012--2014 King's College London
+# Created by the Software Development Team <http://soft-dev.org/>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to
+# deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+# sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+
+
+"""Input texts shared by the benchmark scripts.
+
+All texts use "\\r" as line separator, which is what Eco stores in its parse
+trees (see `TreeManager.import_file`)."""
+
+java_class = """public class Example%(n)d extends Base implements Runnable {
+    private static final int LIMIT = 0x%(n)X;
+    protected String name = "example %(n)d";
+
+    /* a block comment
+       spanning two lines */
+    public int compute(int a, int b) {
+        int result = 0; // running total
+        for (int i = 0; i < LIMIT; i++) {
+            if (a > b && i %% 2 == 0) {
+                result += a * i - b / 3;
+            } else {
+                result -= 1.5e3f;
+            }
+        }
+        return result;
+    }
+
+    public void run() {
+        compute(%(n)d, 42);
+    }
+}
+"""
+
+php_function = """function compute%(n)d($a, $b) {
+    $result = 0; // running total
+    for ($i = 0; $i < %(n)d; $i++) {
+        if ($a > $b && $i %% 2 == 0) {
+            $result += $a * $i - $b / 3;
+        } else {
+            $result .= "value $i";
+        }
+    }
+    return array('result' => $result, "name" => 'compute%(n)d');
+}
+"""
+
+python_class = """class Example%(n)d(Base):
+    \"\"\"A docstring for example %(n)d.\"\"\"
+    limit = 0x%(n)X
+
+    def __init__(self, name):
+        Base.__init__(self)
+        self.name = name # the name
+        self.items = [i * 2 for i in range(10) if i %% 3]
+
+    def compute(self, a, b):
+        result = 0
+        for i in xrange(self.limit):
+            if a > b and i %% 2 == 0:
+                result += a * i - b / 3
+            elif not a:
+                result -= 1.5e3
+            else:
+                continue
+        try:
+            return {'result': result, "name": self.name}
+        except KeyError as e:
+            print "error", e
+            raise
+
+"""
+
+def to_eco(text):
+    return text.replace("\r\n", "\r").replace("\n", "\r")
+
+def scale(template, size):
+    """Repeat `template` until the result has at least `size` characters."""
+    buf = []
+    n = 0
+    length = 0
+    while length < size:
+        s = template % {"n": n}
+        buf.append(s)
+        length += len(s)
+        n += 1
+    return to_eco("".join(buf))
+
+def python_source(size):
+    return scale(python_class, size)
+
+def java_source(size):
+    return scale(java_class, size)
+
+def php_source(size):
+    return scale(php_function, size)
+
+sources = {
+    "Java 1.5": java_source,
+    "PHP": php_source,
+    "Python 2.7.5": python_source,
+}
@@ -0,0 +1,70 @@
+# Copyright (c) 2012--2014 King's College London
+# Created by the Software Development Team <http://soft-dev.org/>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to
+# deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+# sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+
+
+"""Headless editing sessions for the benchmark scripts."""
+
+import random
+
+from grammars.grammars import lang_dict
+from treemanager import TreeManager
+
+def new_editor(language, text=None):
+    """Return a TreeManager editing an empty (or imported) document."""
+    parser, lexer = lang_dict[language].load()
+    parser.init_ast()
+    tm = TreeManager()
+    tm.add_parser(parser, lexer, language)
+    tm.set_font_test(7, 17)
+    if text is not None:
+        tm.import_file(text)
+    return tm
+
+def type_text(tm, text):
+    for c in text:
+        tm.key_normal(c)
+
+python_statements = [
+    "x = 1",
+    "y = x + 2",
+    "print x, y",
+    "z = [x, y]",
+    "foo(x, y)",
+    "d = {'a': 1}",
+]
+
+def python_session(tm, edits, seed=0, snapshot_every=10, callback=None):
+    """Type roughly `edits` keystrokes of Python statements at the end of the
+    document. Every keystroke is one reparse and thus one version. An undo
+    snapshot is taken every `snapshot_every` keystrokes, like the editor does
+    when the user pauses."""
+    rnd = random.Random(seed)
+    done = 0
+    while done < edits:
+        line = rnd.choice(python_statements) + "\r"
+        for c in line[:edits - done]:
+            tm.key_normal(c)
+            done += 1
+            if done % snapshot_every == 0:
+                tm.undo_snapshot()
+            if callback:
+                callback(tm, done)
+    return tm
@@ -1,4 +1,5 @@
 from __future__ import with_statement
+import bisect, sys
 import py
 
 try:
@@ -32,6 +33,68 @@ def compress_char_set(chars):
     real_result.sort(key=lambda (l,c): (-c,l))
     return real_result
 
+def join_ranges(ranges):
+    """Join adjacent (lo, hi, target) ranges of a sorted list that have the
+    same target."""
+    result = []
+    for lo, hi, target in ranges:
+        if result and result[-1][2] == target and result[-1][1] == lo - 1:
+            result[-1] = (result[-1][0], hi, target)
+        else:
+            result.append((lo, hi, target))
+    return result
+
+def bitset(states):
+    """Return the set of states as an int with bit i set for state i."""
+    result = 0
+    for state in states:
+        result |= 1 << state
+    return result
+
+def bitset_members(bits):
+    """Return the sorted list of states in the bitset `bits`."""
+    result = []
+    while bits:
+        lowest = bits & -bits
+        result.append(lowest.bit_length() - 1)
+        bits ^= lowest
+    return result
+
+class StateNames(object):
+    """The state names of a DFA built by subset construction.
+
+    Only states containing unmergeable states, which lexers use as token
+    names, are named when they are created. The name of any other state
+    joins the names of its NFA states, which is only needed for debugging,
+    so it is kept as a tuple of those states and joined on first access.
+    Pickled, the names become a plain list."""
+
+    def __init__(self, nfa_names):
+        self.nfa_names = nfa_names
+        self.names = []
+
+    def append(self, name):
+        self.names.append(name)
+
+    def __getitem__(self, index):
+        name = self.names[index]
+        if isinstance(name, tuple):
+            name = self.names[index] = ", ".join([self.nfa_names[s] for s in name])
+        return name
+
+    def __len__(self):
+        return len(self.names)
+
+    def __iter__(self):
+        for index in range(len(self.names)):
+            yield self[index]
+
+    def __repr__(self):
+        return repr(list(self))
+
+    def __reduce__(self):
+        return (list, (list(self), ))
+
 def make_nice_charset_repr(chars):
     # Compress the letters & digits
     letters = set(chars) & set("0123456789abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ")
@@ -70,21 +133,31 @@ class LexerError(Exception):
         return self.nice_error_message()
 
 class DFA(object):
+    """A deterministic automaton over characters.
+
+    The transitions of a state are kept in `ranges`, a sorted list of
+    disjoint `(lo, hi, next_state)` tuples, where `lo` and `hi` are the
+    ordinals of the first and last character of a range. Ranges that are
+    adjacent and lead to the same state are joined, so a character class
+    like [^"] takes two entries instead of 255. `transitions` gives the
+    same information as a dict keyed by (state, char)."""
+
     def __init__(self, num_states=0, transitions=None, final_states=None,
                  unmergeable_states=None, names=None):
-        self.num_states = 0
-        if transitions is None:
-            transitions = {}
+        self.num_states = num_states
         if final_states is None:
             final_states = set()
         if unmergeable_states is None:
             unmergeable_states = set()
         if names is None:
             names = []
-        self.transitions = transitions
+        self.ranges = {}
         self.final_states = final_states
         self.unmergeable_states = unmergeable_states
         self.names = names
+        if transitions:
+            for (state, input), next_state in transitions.iteritems():
+                self[state, input] = next_state
 
     def __repr__(self):
         from pprint import pformat
@@ -104,104 +177,195 @@ class DFA(object):
         self.names.append(name)
         return state
 
+    @property
+    def transitions(self):
+        """A dict mapping (state, char) to the next state. It is built on
+        every access, so changing it doesn't change the automaton."""
+        result = {}
+        for state, ranges in self.ranges.iteritems():
+            for lo, hi, next_state in ranges:
+                for i in range(lo, hi + 1):
+                    result[state, chr(i)] = next_state
+        return result
+
+    def add_range(self, state, lo, hi, next_state):
+        """Make the characters with the ordinals `lo` to `hi` lead from
+        `state` to `next_state`, replacing their previous transitions."""
+        ranges = self.ranges.setdefault(state, [])
+        # ranges [start:stop] overlap or touch lo..hi
+        start = bisect.bisect_left(ranges, (lo, ))
+        if start > 0 and ranges[start - 1][1] >= lo - 1:
+            start -= 1
+        stop = bisect.bisect_left(ranges, (hi + 2, ), start)
+        pieces = []
+        for rlo, rhi, target in ranges[start:stop]:
+            if rlo < lo:
+                pieces.append((rlo, min(rhi, lo - 1), target))
+        pieces.append((lo, hi, next_state))
+        for rlo, rhi, target in ranges[start:stop]:
+            if rhi > hi:
+                pieces.append((max(rlo, hi + 1), rhi, target))
+        ranges[start:stop] = join_ranges(pieces)
+
+    def get_ranges(self, state):
+        return self.ranges.get(state, [])
+
+    def has_transitions(self, state):
+        return bool(self.ranges.get(state))
+
+    def get_next_state(self, state, input):
+        """Return the state `input` leads to from `state`, or None."""
+        ranges = self.ranges.get(state)
+        if ranges:
+            i = ord(input)
+            index = bisect.bisect_right(ranges, (i, sys.maxint)) - 1
+            if index >= 0 and ranges[index][1] >= i:
+                return ranges[index][2]
+        return None
+
     # DFA returns transitions like a dict()
     def __setitem__(self, (state, input), next_state):
-        self.transitions[state, input] = next_state
+        self.add_range(state, ord(input), ord(input), next_state)
 
     def __getitem__(self, (state, input)):
-        return self.transitions[state, input]
+        next_state = self.get_next_state(state, input)
+        if next_state is None:
+            raise KeyError((state, input))
+        return next_state
 
     def __contains__(self, (state, input)):
-        return (state, input) in self.transitions
+        return self.get_next_state(state, input) is not None
 
     def get_all_chars(self):
         all_chars = set()
-        for (state, input) in self.transitions:
-            all_chars.add(input)
+        for ranges in self.ranges.itervalues():
+            for lo, hi, next_state in ranges:
+                all_chars.update([chr(i) for i in range(lo, hi + 1)])
         return all_chars
 
-    def optimize(self):
-        all_chars = self.get_all_chars()
-        # find mergeable
-        non_final = frozenset(set(range(self.num_states)) - self.final_states -
-                              self.unmergeable_states)
-        final = frozenset(self.final_states - self.unmergeable_states)
-        state_to_set = {}
-        equivalence_sets = set()
-        if non_final:
-            equivalence_sets.add(non_final)
-        if final:
-            equivalence_sets.add(final)
-        for state in range(self.num_states):
-            if state in final:
-                state_to_set[state] = final
-            elif state in self.unmergeable_states:
-                singleset = frozenset([state])
-                state_to_set[state] = singleset
-                equivalence_sets.add(singleset)
+    def get_char_classes(self):
+        """Partition the characters that have transitions into classes of
+        characters that lead every state to the same next state. Return a
+        list of `(chars, targets)` pairs, ordered by their first character,
+        where `chars` is a list of (lo, hi) ordinal ranges and
+        `targets[state]` is the next state or -1."""
+        bounds = set()
+        for ranges in self.ranges.itervalues():
+            for lo, hi, next_state in ranges:
+                bounds.add(lo)
+                bounds.add(hi + 1)
+        bounds = sorted(bounds)
+        # the characters from bounds[k] to bounds[k + 1] - 1 are treated
+        # alike by every state
+        columns = [[-1] * self.num_states for k in range(len(bounds) - 1)]
+        for state, ranges in self.ranges.iteritems():
+            k = 0
+            for lo, hi, next_state in ranges:
+                k = bisect.bisect_left(bounds, lo, k)
+                while bounds[k] <= hi:
+                    columns[k][state] = next_state
+                    k += 1
+        result = []
+        by_targets = {}
+        for k, column in enumerate(columns):
+            if max(column) < 0:
+                continue
+            column = tuple(column)
+            lo, hi = bounds[k], bounds[k + 1] - 1
+            cls = by_targets.get(column)
+            if cls is None:
+                cls = by_targets[column] = len(result)
+                result.append(([], column))
+            chars = result[cls][0]
+            if chars and chars[-1][1] == lo - 1:
+                chars[-1] = (chars[-1][0], hi)
             else:
-                state_to_set[state] = non_final
-        assert len(equivalence_sets) <= self.num_states
-        while len(equivalence_sets) < self.num_states:
-            new_equivalence_sets = set()
-            changed = False
-            for equivalent in equivalence_sets:
-                for char in all_chars:
-                    targets = {}
-                    for state in equivalent:
-                        if (state, char) in self:
-                            nextstate = self[state, char]
-                            target = frozenset(state_to_set[nextstate])
-                        else:
-                            nextstate = None
-                            target = None
-                        targets.setdefault(target, set()).add(state)
-                    if len(targets) != 1:
-                        for target, newequivalent in targets.iteritems():
-                            newequivalent = frozenset(newequivalent)
-                            new_equivalence_sets.add(newequivalent)
-                            for state in newequivalent:
-                                state_to_set[state] = newequivalent
-                        changed = True
-                        break
-                else:
-                    new_equivalence_sets.add(equivalent)
-            if not changed:
-                break
-            equivalence_sets = new_equivalence_sets
-        if len(equivalence_sets) == self.num_states:
+                chars.append((lo, hi))
+        return result
+
+    def optimize(self):
+        """Merge equivalent states with Hopcroft's partition refinement,
+        which treats each character class of `get_char_classes` as a single
+        input. Final and unmergeable states are never merged with other
+        states, and a missing transition is only equivalent to a missing
+        one. Return whether any states were merged."""
+        num_states = self.num_states
+        classes = [targets for chars, targets in self.get_char_classes()]
+        # missing transitions lead to the extra state `dead`
+        dead = num_states
+        # inverse[cls][state] lists the states leading to state on cls
+        inverse = []
+        for targets in classes:
+            inv = {}
+            for state, target in enumerate(targets):
+                if target < 0:
+                    target = dead
+                inv.setdefault(target, []).append(state)
+            inverse.append(inv)
+        # initial partition
+        non_final = set(range(num_states)) - self.final_states - self.unmergeable_states
+        final = self.final_states - self.unmergeable_states
+        blocks = [block for block in [non_final, final] if block]
+        blocks.extend([set([state]) for state in sorted(self.unmergeable_states)])
+        blocks.append(set([dead]))
+        block_of = [None] * (num_states + 1)
+        for i, block in enumerate(blocks):
+            for state in block:
+                block_of[state] = i
+        waiting = set([(i, cls) for i in range(len(blocks))
+                                for cls in range(len(classes))])
+        while waiting:
+            splitter, cls = waiting.pop()
+            inv = inverse[cls]
+            # predecessors of the splitter, by block
+            touched = {}
+            for target in blocks[splitter]:
+                for state in inv.get(target, ()):
+                    touched.setdefault(block_of[state], []).append(state)
+            for i, states in touched.iteritems():
+                block = blocks[i]
+                if len(states) == len(block):
+                    continue
+                # split the block, keeping the larger part in place
+                moved = set(states)
+                if 2 * len(moved) > len(block):
+                    moved = block - moved
+                block -= moved
+                new = len(blocks)
+                blocks.append(moved)
+                for state in moved:
+                    block_of[state] = new
+                for cls in range(len(classes)):
+                    waiting.add((new, cls))
+        blocks = [sorted(block) for block in blocks if dead not in block]
+        if len(blocks) == num_states:
             return False
-        # merging the states
+        # merging the states, the start state stays in the first slot
+        blocks.sort()
+        newstate_of = [None] * num_states
+        for i, block in enumerate(blocks):
+            for state in block:
+                newstate_of[state] = i
         newnames = []
-        newtransitions = {}
-        newnum_states = len(equivalence_sets)
-        newstates = list(equivalence_sets)
-        newstate_to_index = {}
+        newranges = {}
         newfinal_states = set()
         newunmergeable_states = set()
-        for i, newstate in enumerate(newstates):
-            newstate_to_index[newstate] = i
-        # bring startstate into first slot
-        startstateindex = newstate_to_index[state_to_set[0]]
-        newstates[0], newstates[startstateindex] = newstates[startstateindex], newstates[0]
-        newstate_to_index[newstates[0]] = 0
-        newstate_to_index[newstates[startstateindex]] = startstateindex
-        for i, newstate in enumerate(newstates):
-            name = ", ".join([self.names[s] for s in newstate])
-            for state in newstate:
+        for i, block in enumerate(blocks):
+            name = ", ".join([self.names[s] for s in block])
+            for state in block:
                 if state in self.unmergeable_states:
                     newunmergeable_states.add(i)
                     name = self.names[state]
                 if state in self.final_states:
                     newfinal_states.add(i)
             newnames.append(name)
-        for (state, char), nextstate in self.transitions.iteritems():
-            newstate = newstate_to_index[state_to_set[state]]
-            newnextstate = newstate_to_index[state_to_set[nextstate]]
-            newtransitions[newstate, char] = newnextstate
+            ranges = [(lo, hi, newstate_of[target])
+                      for lo, hi, target in self.get_ranges(block[0])]
+            if ranges:
+                newranges[i] = join_ranges(ranges)
         self.names = newnames
-        self.transitions = newtransitions
-        self.num_states = newnum_states
+        self.ranges = newranges
+        self.num_states = len(blocks)
         self.final_states = newfinal_states
         self.unmergeable_states = newunmergeable_states
         return True
@@ -278,6 +442,15 @@ class DFA(object):
         return d['recognize']
 
     def make_lexing_code(self):
+        return load_lexing_code(self.compile_lexing_code())
+
+    def compile_lexing_code(self):
+        """Return the code object defining the `recognize` function built
+        by `make_lexing_code`. Code objects can be marshalled, which allows
+        the lexer to cache them on disk."""
+        return compile(self.generate_lexing_code(), "<recognize>", "exec")
+
+    def generate_lexing_code(self):
         from cflexer.codebuilder import Codebuilder
         result = Codebuilder()
         result.start_block("def recognize(runner, i):")
@@ -286,13 +459,8 @@ class DFA(object):
         result.emit("input = runner.text")
         result.emit("state = 0")
         result.start_block("while 1:")
-        state_to_chars = {}
-        for (state, char), nextstate in self.transitions.iteritems():
-            state_to_chars.setdefault(state, {}).setdefault(nextstate, set()).add(char)
-        state_to_chars_sorted = state_to_chars.items()
-        state_to_chars_sorted.sort()
         above = set()
-        for state, nextstates in state_to_chars_sorted:
+        for state in sorted(self.ranges):
             above.add(state)
             with result.block("if state == %s:" % (state, )):
                 if state in self.final_states:
@@ -307,35 +475,18 @@ class DFA(object):
                         result.emit("return i")
                     else:
                         result.emit("return ~i")
-                elif_prefix = ""
-                for nextstate, chars in nextstates.iteritems():
-                    final = nextstate in self.final_states
-                    compressed = compress_char_set(chars)
-                    if nextstate in above:
-                        continue_prefix = "continue"
-                    else:
-                        continue_prefix = ""
-                    for i, (a, num) in enumerate(compressed):
-                        if num < 3:
-                            for charord in range(ord(a), ord(a) + num):
-                                with result.block("%sif char == %r:"
-                                        % (elif_prefix, chr(charord))):
-                                    result.emit("state = %s" % (nextstate, ))
-                                    result.emit(continue_prefix)
-                                if not elif_prefix:
-                                    elif_prefix = "el"
-                        else:
-                            with result.block(
-                                "%sif %r <= char <= %r:" % (
-                                    elif_prefix, a, chr(ord(a) + num - 1))):
-                                    result.emit("state = %s" % (nextstate, ))
-                                    result.emit(continue_prefix)
-                            if not elif_prefix:
-                                elif_prefix = "el"
-                with result.block("else:"):
-                    result.emit("break")
+                segments = []
+                lower = 0
+                for lo, hi, nextstate in self.ranges[state]:
+                    if lo > lower:
+                        segments.append((lower, lo - 1, None))
+                    segments.append((lo, hi, nextstate))
+                    lower = hi + 1
+                if lower <= 255:
+                    segments.append((lower, 255, None))
+                self._emit_ranges(result, segments, above)
         for state in range(self.num_states):
-            if state in state_to_chars:
+            if state in self.ranges:
                 continue
             assert state in self.final_states
         result.emit("""
@@ -355,8 +506,66 @@ return ~i""")
         result = result.get_code()
         while "\n\n" in result:
             result = result.replace("\n\n", "\n")
-        exec py.code.Source(result).compile()
-        return recognize
+        return result
+
+    def _emit_ranges(self, result, segments, above):
+        """Emit the code choosing the transition for `char`, whose ordinal
+        is known to be within `segments`: a sorted list of contiguous
+        `(lo, hi, nextstate)` ranges, with `nextstate` None where there is
+        no transition. Segments leading to at most three different outcomes
+        get one test per outcome, the most frequent being the else branch.
+        Others are split in half by comparing `char`, so the outcome is
+        found after a logarithmic number of tests."""
+        outcomes = []
+        by_outcome = {}
+        for segment in segments:
+            if segment[2] not in by_outcome:
+                outcomes.append(segment[2])
+                by_outcome[segment[2]] = []
+            by_outcome[segment[2]].append(segment)
+        if len(outcomes) > 3:
+            mid = len(segments) // 2
+            with result.block("if char < %r:" % (chr(segments[mid][0]), )):
+                self._emit_ranges(result, segments[:mid], above)
+            with result.block("else:"):
+                self._emit_ranges(result, segments[mid:], above)
+            return
+        default = max(outcomes, key=lambda o: (len(by_outcome[o]), o is None))
+        lower, upper = segments[0][0], segments[-1][1]
+        prefix = "if"
+        for outcome in outcomes:
+            if outcome == default:
+                continue
+            tests = []
+            for lo, hi, nextstate in by_outcome[outcome]:
+                if lo == hi:
+                    tests.append("char == %r" % (chr(lo), ))
+                elif lo == lower:
+                    tests.append("char <= %r" % (chr(hi), ))
+                elif hi == upper:
+                    tests.append("char >= %r" % (chr(lo), ))
+                else:
+                    tests.append("%r <= char <= %r" % (chr(lo), chr(hi)))
+            with result.block("%s %s:" % (prefix, " or ".join(tests))):
+                self._emit_transition(result, outcome, above)
+            prefix = "elif"
+        if prefix == "if":
+            self._emit_transition(result, default, above)
+        else:
+            with result.block("else:"):
+                self._emit_transition(result, default, above)
+
+    def _emit_transition(self, result, nextstate, above):
+        if nextstate is None:
+            result.emit("break")
+            return
+        result.emit("state = %s" % (nextstate, ))
+        # states further down are reached without restarting the loop
+        if nextstate in above:
+            result.emit("continue")
+
+    def make_lexing_table(self):
+        return TableMatcher(self)
 
     def get_runner(self):
         return DFARunner(self)
@@ -367,8 +576,10 @@ return ~i""")
         result.names = self.names
         result.start_states = set([0])
         result.final_states = self.final_states.copy()
-        for (state, input), nextstate in self.transitions.iteritems():
-            result.add_transition(state, nextstate, input)
+        for state, ranges in self.ranges.iteritems():
+            for lo, hi, nextstate in ranges:
+                for i in range(lo, hi + 1):
+                    result.add_transition(state, nextstate, chr(i))
         return result
 
     def dot(self):
@@ -407,6 +618,75 @@ return ~i""")
             py.process.cmdexec("fdp -Tplain %s > %s" % (p, plainpath))
         graphclient.display_dot_file(str(plainpath))
 
+def load_lexing_code(code):
+    d = {}
+    exec code in d
+    return d['recognize']
+
+class TableMatcher(object):
+    """Table driven replacement for the code generated by
+    `DFA.make_lexing_code`.
+
+    Characters that behave identically in every state are mapped to the same
+    equivalence class. Each state then has one row in `rows`, indexed by
+    character class, holding the next state (or -1 if there is no
+    transition). Matching a character therefore costs two lookups, no matter
+    how many states the automaton has. A matcher is called like the generated
+    `recognize(runner, i)` function and updates the runner in exactly the same
+    way."""
+
+    def __init__(self, dfa):
+        char_classes = dfa.get_char_classes()
+        self.classes = {}
+        self.rows = [[] for state in range(dfa.num_states)]
+        for cls, (chars, targets) in enumerate(char_classes):
+            for lo, hi in chars:
+                for i in range(lo, hi + 1):
+                    self.classes[chr(i)] = cls
+            for state in range(dfa.num_states):
+                self.rows[state].append(targets[state])
+        self.num_classes = len(char_classes)
+        self.final = [state in dfa.final_states for state in range(dfa.num_states)]
+        # states without any outgoing transitions
+        self.dead = [max(row) < 0 if row else True for row in self.rows]
+
+    def __call__(self, runner, i):
+        assert i >= 0
+        input = runner.text
+        classes = self.classes
+        rows = self.rows
+        final = self.final
+        dead = self.dead
+        state = 0
+        while 1:
+            if dead[state]:
+                runner.last_matched_state = state
+                runner.last_matched_index = i - 1
+                runner.state = state
+                if i == len(input):
+                    return i
+                return ~i
+            if final[state]:
+                runner.last_matched_index = i - 1
+                runner.last_matched_state = state
+            try:
+                char = input[i]
+                i += 1
+            except IndexError:
+                runner.state = state
+                if final[state]:
+                    return i
+                return ~i
+            cls = classes.get(char)
+            if cls is None:
+                break
+            nextstate = rows[state][cls]
+            if nextstate < 0:
+                break
+            state = nextstate
+        runner.state = state
+        return ~i
+
 class DFARunner(object):
     def __init__(self, automaton):
         self.automaton = automaton
@@ -472,55 +752,78 @@ class NFA(object):
                     stack.append(next_state)    # Need to find eps-cl of next_state
         return closure
 
+    def epsilon_closures(self):
+        """Return the epsilon-closure of every state as a bitset: an int
+        with bit i set for state i."""
+        result = []
+        for state in range(self.num_states):
+            closure = 1 << state
+            stack = [state]
+            while stack:
+                for next_state in self.transitions.get(stack.pop(), {}).get(None, ()):
+                    bit = 1 << next_state
+                    if not closure & bit:
+                        closure |= bit
+                        stack.append(next_state)
+            result.append(closure)
+        return result
+
+    def get_char_classes(self):
+        """Partition the characters that have transitions into classes of
+        characters that every state treats alike. Return the classes, as
+        lists of (lo, hi) ordinal ranges, and a dict mapping every state to
+        its `(class, next states)` pairs, with the next states as a
+        bitset."""
+        by_char = {}
+        for state, subtransitions in self.transitions.iteritems():
+            for input, next_states in subtransitions.iteritems():
+                if input is None or not next_states:
+                    continue
+                by_char.setdefault(input, []).append((state, bitset(next_states)))
+        classes = []
+        moves = {}
+        by_signature = {}
+        for char in sorted(by_char):
+            signature = tuple(sorted(by_char[char]))
+            cls = by_signature.get(signature)
+            if cls is None:
+                cls = by_signature[signature] = len(classes)
+                classes.append([])
+                for state, next_states in signature:
+                    moves.setdefault(state, []).append((cls, next_states))
+            i = ord(char)
+            chars = classes[cls]
+            if chars and chars[-1][1] == i - 1:
+                chars[-1] = (chars[-1][0], i)
+            else:
+                chars.append((i, i))
+        return classes, moves
+
     def make_deterministic(self, name_precedence=None):
-        fda = DFA()
-        set_to_state = {}
-        stack = []
-        def get_dfa_state(states):
-            states = self.epsilon_closure(states)
-            frozenstates = frozenset(states)
-            if frozenstates in set_to_state:
-                return set_to_state[frozenstates]   # already created this state
-            if states == self.start_states:
-                assert not set_to_state
-            final = bool(
-                filter(None, [state in self.final_states for state in states]))
-            name = ", ".join([self.names[state] for state in states])
-            if name_precedence is not None:
-                name_index = len(name_precedence)
-            unmergeable = False
-            for state in states:
-                #print state
-                if state in self.unmergeable_states:
-                    new_name = self.names[state]
-                    if name_precedence is not None:
-                        try:
-                            index = name_precedence.index(new_name)
-                        except ValueError:
-                            index = name_index
-                        #print new_name, index, name_precedence
-                        if index < name_index:
-                            name_index = index
-                            name = new_name
-                    else:
-                        name = new_name
-                    unmergeable = True
-            result = set_to_state[frozenstates] = fda.add_state(
-                name, final, unmergeable)
-            stack.append((result, states))
-            return result
-        startstate = get_dfa_state(self.start_states)
+        """Return a DFA accepting the same language (see
+        SubsetConstruction)."""
+        subsets = SubsetConstruction(self, name_precedence)
+        ranges = {}
+        stack = [subsets.get_state(subsets.start)]
         while stack:
-            fdastate, ndastates = stack.pop()
-            chars_to_states = {}
-            for state in ndastates:
-                sub_transitions = self.transitions.get(state, {})
-                for char, next_states in sub_transitions.iteritems():
-                    chars_to_states.setdefault(char, set()).update(next_states)
-            for char, states in chars_to_states.iteritems():
-                if char is None:
-                    continue
-                fda[fdastate, char] = get_dfa_state(states)
+            fdastate = stack.pop()
+            targets = subsets.get_targets(subsets.sets[fdastate])
+            state_ranges = []
+            for cls in sorted(targets):
+                num_states = len(subsets.sets)
+                next_state = subsets.get_state(targets[cls])
+                if next_state == num_states:
+                    stack.append(next_state)
+                for lo, hi in subsets.classes[cls]:
+                    state_ranges.append((lo, hi, next_state))
+            if state_ranges:
+                state_ranges.sort()
+                ranges[fdastate] = join_ranges(state_ranges)
+        fda = DFA(len(subsets.sets), None,
+                  set([s for s, final in enumerate(subsets.final) if final]),
+                  set([s for s, unmergeable in enumerate(subsets.unmergeable) if unmergeable]),
+                  subsets.names)
+        fda.ranges = ranges
         return fda
 
     def update(self, other):
@@ -577,6 +880,284 @@ class NFA(object):
         result.append("}")
         return "\n".join(result)
 
+class SubsetConstruction(object):
+    """The DFA states made of sets of states of `nfa`, for the subset
+    construction of `NFA.make_deterministic` and for `LazyDFA`.
+
+    The epsilon-closures of all NFA states and the character classes are
+    computed once. Sets of NFA states are bitsets, and `get_state` numbers
+    each set the first time it is seen. A DFA state containing unmergeable
+    states is named after the one coming first in `name_precedence`; the
+    names of the other states are only joined when they are looked at (see
+    StateNames)."""
+
+    def __init__(self, nfa, name_precedence=None):
+        self.closures = nfa.epsilon_closures()
+        self.classes, moves = nfa.get_char_classes()
+        self.moves = {}
+        for state, state_moves in moves.iteritems():
+            self.moves[state] = dict(state_moves)
+        self.nfa_names = nfa.names
+        self.final_states = bitset(nfa.final_states)
+        self.unmergeable_states = bitset(nfa.unmergeable_states)
+        self.with_moves = bitset(self.moves)
+        self.name_precedence = name_precedence
+        if name_precedence is not None:
+            self.precedence = {}
+            for index, name in enumerate(name_precedence):
+                self.precedence.setdefault(name, index)
+        self.start = 0
+        for state in nfa.start_states:
+            self.start |= self.closures[state]
+        self.closed = {}
+        # per DFA state: its NFA states, name, and whether it is final,
+        # unmergeable or has no transitions at all
+        self.sets = []
+        self.ids = {}
+        self.names = StateNames(nfa.names)
+        self.final = []
+        self.unmergeable = []
+        self.dead = []
+
+    def get_state(self, states):
+        """Return the DFA state for the bitset `states`."""
+        result = self.ids.get(states)
+        if result is not None:
+            return result
+        name = tuple(bitset_members(states))
+        unmergeable = states & self.unmergeable_states
+        if unmergeable:
+            if self.name_precedence is None:
+                name = self.nfa_names[bitset_members(unmergeable)[-1]]
+            else:
+                name_index = len(self.name_precedence)
+                for state in bitset_members(unmergeable):
+                    index = self.precedence.get(self.nfa_names[state], name_index)
+                    if index < name_index:
+                        name_index = index
+                        name = self.nfa_names[state]
+        result = self.ids[states] = len(self.sets)
+        self.sets.append(states)
+        self.names.append(name)
+        self.final.append(bool(states & self.final_states))
+        self.unmergeable.append(bool(unmergeable))
+        self.dead.append(not states & self.with_moves)
+        return result
+
+    def closure(self, states):
+        """Return the epsilon-closure of the bitset `states`."""
+        closure = 0
+        for state in bitset_members(states):
+            closure |= self.closures[state]
+        return closure
+
+    def close(self, states):
+        """Like `closure`, but remembers the result."""
+        closure = self.closed.get(states)
+        if closure is None:
+            closure = self.closed[states] = self.closure(states)
+        return closure
+
+    def get_targets(self, states):
+        """Return a dict mapping every character class leading anywhere
+        from the bitset `states` to the (closed) bitset it leads to."""
+        targets = {}
+        for state in bitset_members(states & self.with_moves):
+            for cls, next_states in self.moves[state].iteritems():
+                targets[cls] = targets.get(cls, 0) | next_states
+        for cls, next_states in targets.iteritems():
+            targets[cls] = self.close(next_states)
+        return targets
+
+    def move(self, states, cls):
+        """Return the (unclosed) bitset that character class `cls` leads to
+        from the bitset `states`, which is 0 if there is no transition."""
+        next_states = 0
+        for state in bitset_members(states & self.with_moves):
+            next_states |= self.moves[state].get(cls, 0)
+        return next_states
+
+    def get_target(self, states, cls):
+        """Return the closed bitset that character class `cls` leads to from
+        the bitset `states`, which is 0 if there is no transition."""
+        return self.close(self.move(states, cls))
+
+class LazyDFA(SubsetConstruction):
+    """A DFA that is built from `nfa` while it is used, like the DFAs of
+    RE2: the first time input leads from a state to a new set of NFA
+    states, a state is created for it, and each transition is only worked
+    out when it is first taken. Lexers using it can therefore start right
+    away, and only ever build the part of the automaton their input needs.
+
+    A LazyDFA is the lexer's automaton (for token names and
+    `has_transitions`) and its matcher: it is called like the generated
+    `recognize(runner, i)` function and updates the runner in exactly the
+    same way.
+
+    At most `max_states` states (but at least the three a match needs) are
+    kept. When another one is needed, all states and transitions are
+    dropped except for the start state and the runner's last matched state
+    (see flush). If that happens again before `thrash` characters per state
+    have been matched, the cache is useless for this input, and the match
+    goes on by simulating the NFA on bitsets, without creating any states
+    but the ones it leaves in the runner."""
+
+    def __init__(self, nfa, name_precedence=None, max_states=1000, thrash=10):
+        SubsetConstruction.__init__(self, nfa, name_precedence)
+        self.nfa = nfa
+        self.max_states = max_states
+        self.thrash = thrash
+        self.class_of = {}
+        for cls, chars in enumerate(self.classes):
+            for lo, hi in chars:
+                for i in range(lo, hi + 1):
+                    self.class_of[chr(i)] = cls
+        # DFA state -> list of next states by class (None: not known yet,
+        # -1: no transition)
+        self.rows = {}
+        # number of characters matched before the current call since the
+        # cache was last cleared, and how often it was cleared
+        self.matched = 0
+        self.flushes = 0
+        self.get_state(self.start)
+
+    def __getstate__(self):
+        return (self.nfa, self.name_precedence, self.max_states, self.thrash)
+
+    def __setstate__(self, state):
+        self.__init__(*state)
+
+    def has_transitions(self, state):
+        return not self.dead[state]
+
+    def flush(self, runner, matched):
+        """Drop all states and transitions, except for the start state and
+        the runner's last matched state, which is renumbered. Return
+        whether the cache thrashes. `matched` is the number of characters
+        matched by the current call so far."""
+        since_flush = self.matched + matched
+        self.flushes += 1
+        self.matched = -matched
+        sets = self.sets
+        last_matched = runner.last_matched_state
+        self.sets = []
+        self.ids = {}
+        self.names = StateNames(self.nfa_names)
+        self.final = []
+        self.unmergeable = []
+        self.dead = []
+        self.rows = {}
+        self.closed = {}
+        self.get_state(self.start)
+        if 0 <= last_matched < len(sets):
+            runner.last_matched_state = self.get_state(sets[last_matched])
+        return since_flush < self.thrash * self.max_states
+
+    def lookup(self, runner, states):
+        """Return the DFA state for the bitset `states`, flushing the cache
+        first if it is full."""
+        state = self.ids.get(states)
+        if state is None:
+            if len(self.sets) >= self.max_states:
+                self.flush(runner, 0)
+            state = self.get_state(states)
+        return state
+
+    def __call__(self, runner, i):
+        assert i >= 0
+        start = i
+        input = runner.text
+        class_of = self.class_of
+        rows = self.rows
+        final = self.final
+        dead = self.dead
+        state = 0
+        try:
+            while 1:
+                if dead[state]:
+                    runner.last_matched_state = state
+                    runner.last_matched_index = i - 1
+                    runner.state = state
+                    if i == len(input):
+                        return i
+                    return ~i
+                if final[state]:
+                    runner.last_matched_index = i - 1
+                    runner.last_matched_state = state
+                try:
+                    char = input[i]
+                    i += 1
+                except IndexError:
+                    runner.state = state
+                    if final[state]:
+                        return i
+                    return ~i
+                cls = class_of.get(char)
+                if cls is None:
+                    break
+                row = rows.get(state)
+                if row is None:
+                    row = rows[state] = [None] * len(self.classes)
+                nextstate = row[cls]
+                if nextstate is None:
+                    next_states = self.get_target(self.sets[state], cls)
+                    if not next_states:
+                        row[cls] = -1
+                        break
+                    nextstate = self.ids.get(next_states)
+                    if nextstate is None:
+                        if len(self.sets) >= self.max_states:
+                            # `row` goes with the flushed states
+                            if self.flush(runner, i - start):
+                                return self.simulate(runner, i, next_states)
+                            rows = self.rows
+                            final = self.final
+                            dead = self.dead
+                        nextstate = self.get_state(next_states)
+                    row[cls] = nextstate
+                if nextstate < 0:
+                    break
+                state = nextstate
+            runner.state = state
+            return ~i
+        finally:
+            self.matched += i - start
+
+    def simulate(self, runner, i, states):
+        """Go on matching like `__call__` from the bitset `states`, by
+        simulating the NFA. DFA states are only looked up for the states
+        left in the runner."""
+        input = runner.text
+        class_of = self.class_of
+        matched = None # bitset of the last final states
+        while 1:
+            if not states & self.with_moves:
+                matched = states
+                runner.last_matched_index = i - 1
+                result = i if i == len(input) else ~i
+                break
+            if states & self.final_states:
+                matched = states
+                runner.last_matched_index = i - 1
+            try:
+                char = input[i]
+                i += 1
+            except IndexError:
+                result = i if states & self.final_states else ~i
+                break
+            result = ~i
+            cls = class_of.get(char)
+            if cls is None:
+                break
+            next_states = self.closure(self.move(states, cls))
+            if not next_states:
+                break
+            states = next_states
+        if matched is not None:
+            runner.last_matched_state = self.lookup(runner, matched)
+        runner.state = self.lookup(runner, states)
+        return result
+
 class SetNFARunner(object):
     def __init__(self, automaton):
         self.automaton = automaton
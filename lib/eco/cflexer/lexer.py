@@ -19,7 +19,6 @@
 # FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
 # IN THE SOFTWARE.
 
-import py
 from cflexer import deterministic, regex
 
 class Token(object):
@@ -64,34 +63,116 @@ class SourcePos(object):
     def __repr__(self):
         return "SourcePos(%r, %r, %r)" % (self.i, self.lineno, self.columnno)
 
-import os
+import imp, marshal
 try:
     import cPickle as pickle
 except:
     import pickle
+from artifactcache import cache, make_key, pickle_dumps
+
+# Bump whenever the generated matchers change, to invalidate cached ones
+MATCHER_VERSION = 2
+# Bump whenever automata are built or stored differently
+AUTOMATON_VERSION = 2
 
 class Lexer(object):
-    def __init__(self, token_regexs, names, ignore=None):
+    # Matcher backends: "code" generates and compiles Python source for the
+    # automaton, "table" uses a compact transition table (see TableMatcher),
+    # "lazy" builds the automaton while lexing (see LazyDFA)
+    backends = ["code", "table", "lazy"]
+
+    def __init__(self, token_regexs, names, ignore=None, backend="code"):
+        assert backend in Lexer.backends
         self.token_regexs = token_regexs
         self.names = names
+        self.backend = backend
         self.rex = regex.LexingOrExpression(token_regexs, names)
-        # pickling automaton to increase loading times
-        h = hash(str(token_regexs)) ^ hash(str(names))
-        filename = "".join([os.path.dirname(__file__), "/../pickle/", str(h), ".pcl"])
-        try:
-            f = open(filename, "r")
-            self.automaton = pickle.load(f)
-        except IOError:
-            automaton = self.rex.make_automaton()
-            self.automaton = automaton.make_deterministic(names)
-            self.automaton.optimize() # XXX not sure whether this is a good idea
-            pickle.dump(self.automaton, open(filename, "w"))
+        self.key = self.automaton_key(token_regexs, names)
         if ignore is None:
             ignore = []
         for ign in ignore:
             assert ign in names
         self.ignore = dict.fromkeys(ignore)
-        self.matcher = self.automaton.make_lexing_code()
+        if backend == "lazy":
+            # nothing to build or cache up front
+            self.automaton = deterministic.LazyDFA(self.rex.make_automaton(), names)
+            self.matcher = self.automaton
+            return
+        # caching automaton to increase loading times
+        built = []
+        def build():
+            automaton = self.rex.make_automaton()
+            automaton = automaton.make_deterministic(names)
+            automaton.optimize() # XXX not sure whether this is a good idea
+            built.append(True)
+            return automaton
+        self.automaton = cache.get(self.key, build)
+        self.matcher = self.load_matcher(bool(built))
+
+    @staticmethod
+    def automaton_key(token_regexs, names):
+        return make_key("automaton", token_regexs, names, AUTOMATON_VERSION)
+
+    @classmethod
+    def is_cached(cls, token_regexs, names):
+        """Return whether the automaton of a lexer for `token_regexs` is in
+        the artifact cache, i.e. whether creating the lexer is cheap."""
+        return cache.contains(cls.automaton_key(token_regexs, names))
+
+    def matcher_key(self):
+        # Marshalled code objects are only readable by the Python version
+        # that wrote them, so the interpreter's magic number is part of the key
+        return make_key("matcher", self.key, self.backend,
+                        imp.get_magic().encode("hex"), MATCHER_VERSION)
+
+    def load_matcher(self, rebuild=False):
+        """Load the matcher for the automaton from the artifact cache,
+        generating (and caching) it if necessary. Set `rebuild` if the
+        automaton itself has just been built and cached matchers can't be
+        trusted."""
+        key = self.matcher_key()
+        if self.backend == "table":
+            build = self.automaton.make_lexing_table
+            dumps, loads = pickle_dumps, pickle.loads
+        else:
+            build = self.automaton.compile_lexing_code
+            dumps, loads = marshal.dumps, marshal.loads
+        if rebuild:
+            matcher = build()
+            cache.store(key, matcher, dumps)
+        else:
+            matcher = cache.get(key, build, dumps, loads)
+        if self.backend == "code":
+            self.code = matcher
+            matcher = deterministic.load_lexing_code(matcher)
+        return matcher
+
+    def to_bundle(self):
+        """Return the lexer, including its automaton and matcher, as a
+        picklable tuple (see `from_bundle`). Generated code is marshalled, so
+        it can only be loaded by the same Python version."""
+        matcher = self.matcher
+        if self.backend == "code":
+            matcher = marshal.dumps(self.code)
+        return (self.token_regexs, self.names, self.ignore.keys(),
+                self.backend, self.automaton, matcher)
+
+    @classmethod
+    def from_bundle(cls, bundle):
+        token_regexs, names, ignore, backend, automaton, matcher = bundle
+        lexer = cls.__new__(cls)
+        lexer.token_regexs = token_regexs
+        lexer.names = names
+        lexer.backend = backend
+        lexer.rex = regex.LexingOrExpression(token_regexs, names)
+        lexer.key = cls.automaton_key(token_regexs, names)
+        lexer.automaton = automaton
+        lexer.ignore = dict.fromkeys(ignore)
+        if backend == "code":
+            lexer.code = marshal.loads(matcher)
+            matcher = deterministic.load_lexing_code(lexer.code)
+        lexer.matcher = matcher
+        return lexer
 
     def get_runner(self, text, eof=False):
         return LexingDFARunner(self.matcher, self.automaton, text,
@@ -111,12 +192,12 @@ class Lexer(object):
 
     def get_dummy_repr(self):
         return '%s\nlexer = DummyLexer(recognize, %r, %r)' % (
-                py.code.Source(self.matcher),
+                self.automaton.generate_lexing_code(),
                 self.automaton,
                 self.ignore)
 
     def __getstate__(self):
-        return (self.token_regexs, self.names, self.ignore)
+        return (self.token_regexs, self.names, self.ignore, self.backend)
 
     def __setstate__(self, args):
         self.__init__(*args)
@@ -130,6 +211,7 @@ class DummyLexer(Lexer):
         self.token_regexs = None
         self.names = None
         self.rex = None
+        self.backend = "code"
         self.automaton = automaton
         self.ignore = ignore
         self.matcher = matcher
@@ -183,11 +265,7 @@ class AbstractLexingDFARunner(deterministic.DFARunner):
                 return result
             if self.last_matched_index == i - 1:
                 # no progress (loop)
-                lookahead = 0
-                for from_, to in self.automaton.transitions.iterkeys():
-                    if from_ == self.state:
-                        lookahead = 1
-                        break
+                lookahead = int(self.automaton.has_transitions(self.state))
                 source = self.text[start: ]
                 result = self.make_token(start, self.last_matched_state, source, lookahead = lookahead)
                 self.last_matched_index = start + len(source)
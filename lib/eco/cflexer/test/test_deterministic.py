@@ -179,3 +179,228 @@ def test_make_nice_charset_repr():
     for chunk in chunks:
         assert chunk in nice  # make sure every unit is in there, in some order
     assert len(''.join(chunks))==len(nice)  # make sure that's all that's in there
+
+def test_ranges():
+    a = DFA()
+    s0 = a.add_state()
+    s1 = a.add_state()
+    s2 = a.add_state(final=True)
+    for c in "abcdef":
+        a[s0, c] = s1
+    a[s0, "x"] = s2
+    assert a.ranges[s0] == [(ord("a"), ord("f"), s1), (ord("x"), ord("x"), s2)]
+    # replacing transitions splits ranges, and joins them again
+    a[s0, "c"] = s2
+    assert a.ranges[s0] == [(ord("a"), ord("b"), s1), (ord("c"), ord("c"), s2),
+                            (ord("d"), ord("f"), s1), (ord("x"), ord("x"), s2)]
+    a.add_range(s0, ord("c"), ord("w"), s1)
+    assert a.ranges[s0] == [(ord("a"), ord("w"), s1), (ord("x"), ord("x"), s2)]
+    assert a[s0, "m"] == s1
+    assert a[s0, "x"] == s2
+    assert (s0, "y") not in a
+    assert (s1, "a") not in a
+    with py.test.raises(KeyError):
+        a[s0, "`"]
+    assert a.has_transitions(s0)
+    assert not a.has_transitions(s2)
+    assert a.get_all_chars() == set("abcdefghijklmnopqrstuvwx")
+    assert a.transitions[s0, "x"] == s2
+    assert len(a.transitions) == 24
+
+def test_char_classes():
+    a = DFA()
+    s0 = a.add_state()
+    s1 = a.add_state()
+    s2 = a.add_state(final=True)
+    a.add_range(s0, ord("a"), ord("z"), s1)
+    a.add_range(s1, ord("a"), ord("z"), s1)
+    a.add_range(s1, ord("0"), ord("9"), s1)
+    a[s0, "_"] = s1
+    a[s1, "_"] = s1
+    a[s1, "."] = s2
+    classes = a.get_char_classes()
+    assert classes == [
+        ([(ord("."), ord("."))], (-1, s2, -1)),
+        ([(ord("0"), ord("9"))], (-1, s1, -1)),
+        ([(ord("_"), ord("_")), (ord("a"), ord("z"))], (s1, s1, -1)),
+    ]
+
+def test_optimize_merges_equivalent_states():
+    # (ab|cb)d*: the states after a and c are equivalent, and so are the
+    # final ones
+    a = DFA()
+    s0 = a.add_state("start")
+    s1 = a.add_state()
+    s2 = a.add_state()
+    s3 = a.add_state(final=True)
+    s4 = a.add_state(final=True)
+    a[s0, "a"] = s1
+    a[s0, "c"] = s2
+    a[s1, "b"] = s3
+    a[s2, "b"] = s4
+    a[s3, "d"] = s4
+    a[s4, "d"] = s3
+    assert a.optimize()
+    assert a.num_states == 3
+    assert a.names[0] == "start"
+    assert a.ranges[0] == [(ord("a"), ord("a"), 1), (ord("c"), ord("c"), 1)]
+    assert a.ranges[1] == [(ord("b"), ord("b"), 2)]
+    assert a.ranges[2] == [(ord("d"), ord("d"), 2)]
+    assert a.final_states == set([2])
+    assert not a.optimize()
+
+def test_optimize_keeps_distinct_states():
+    a = DFA()
+    s0 = a.add_state()
+    s1 = a.add_state()
+    s2 = a.add_state()
+    s3 = a.add_state(final=True)
+    s4 = a.add_state(final=True)
+    s5 = a.add_state("KEYWORD", final=True, unmergeable=True)
+    a[s0, "a"] = s1
+    a[s0, "b"] = s2
+    a[s0, "c"] = s5
+    a[s1, "x"] = s3
+    a[s2, "x"] = s4
+    # a missing transition isn't equivalent to one into a dead end
+    a[s4, "y"] = s1
+    a[s5, "y"] = s1
+    assert not a.optimize()
+    assert a.num_states == 6
+
+def test_optimize_random():
+    import random
+    rnd = random.Random(0)
+    alphabet = "abc"
+    def words(length):
+        if length == 0:
+            return [""]
+        return [w + c for w in words(length - 1) for c in alphabet] + words(length - 1)
+    inputs = words(5)
+    for n in range(30):
+        a = DFA()
+        for i in range(rnd.randrange(2, 12)):
+            a.add_state(final=rnd.random() < 0.4)
+        for state in range(a.num_states):
+            for c in alphabet:
+                if rnd.random() < 0.8:
+                    a[state, c] = rnd.randrange(a.num_states)
+        expected = [a.get_runner().recognize(w) for w in inputs]
+        before = a.num_states
+        a.optimize()
+        assert a.num_states <= before
+        assert [a.get_runner().recognize(w) for w in inputs] == expected
+        # no two remaining states behave the same on every word (a missing
+        # transition counts as behaviour of its own)
+        def signature(state):
+            result = []
+            for w in inputs:
+                s = state
+                for c in w:
+                    s = a.get_next_state(s, c)
+                    if s is None:
+                        break
+                result.append((s is not None, s in a.final_states))
+            return tuple(result)
+        signatures = set()
+        for state in range(a.num_states):
+            signatures.add(signature(state))
+        reachable = set([0])
+        todo = [0]
+        while todo:
+            for lo, hi, s in a.get_ranges(todo.pop()):
+                if s not in reachable:
+                    reachable.add(s)
+                    todo.append(s)
+        if len(reachable) == a.num_states:
+            assert len(signatures) == a.num_states
+
+def test_lexing_code_ranges():
+    a = DFA()
+    s0 = a.add_state()
+    s1 = a.add_state(final=True)
+    s2 = a.add_state(final=True)
+    # identifiers, and digits; the ranges of the start state need more
+    # than three outcomes and are searched in halves
+    for lo, hi in [("a", "z"), ("A", "Z"), ("_", "_")]:
+        a.add_range(s0, ord(lo), ord(hi), s1)
+        a.add_range(s1, ord(lo), ord(hi), s1)
+    a.add_range(s1, ord("0"), ord("9"), s1)
+    a.add_range(s0, ord("0"), ord("9"), s2)
+    a.add_range(s2, ord("0"), ord("9"), s2)
+    a.add_range(s0, ord("!"), ord("!"), s0)
+    recognize = a.make_lexing_code()
+    table = a.make_lexing_table()
+    class Runner(object):
+        def __init__(self, text):
+            self.text = text
+            self.state = self.last_matched_index = self.last_matched_state = None
+    for text in ["abc", "a1_Z", "123", "12a", "!!x", "", "?", "a?", "~", "\xff"]:
+        r1 = Runner(text)
+        r2 = Runner(text)
+        assert recognize(r1, 0) == table(r2, 0)
+        assert r1.__dict__ == r2.__dict__
+
+def test_epsilon_closures():
+    a = NFA()
+    z0 = a.add_state("z0", start=True)
+    z1 = a.add_state("z1")
+    z2 = a.add_state("z2")
+    z3 = a.add_state("z3", final=True)
+    a.add_transition(z0, z1)
+    a.add_transition(z1, z2)
+    a.add_transition(z2, z1)
+    a.add_transition(z2, z3, "a")
+    assert a.epsilon_closures() == [0b0111, 0b0110, 0b0110, 0b1000]
+    assert bitset_members(0b0111) == [0, 1, 2]
+    assert bitset([3, 0]) == 0b1001
+
+def test_NFA_char_classes():
+    a = NFA()
+    z0 = a.add_state("z0", start=True)
+    z1 = a.add_state("z1")
+    z2 = a.add_state("z2", final=True)
+    for c in "abcxyz":
+        a.add_transition(z0, z1, c)
+        a.add_transition(z1, z2, c)
+    a.add_transition(z0, z2, "b")
+    a.add_transition(z1, z1)
+    classes, moves = a.get_char_classes()
+    assert classes == [[(ord("a"), ord("a")), (ord("c"), ord("c")), (ord("x"), ord("z"))],
+                       [(ord("b"), ord("b"))]]
+    assert moves == {z0: [(0, 0b010), (1, 0b110)], z1: [(0, 0b100), (1, 0b100)]}
+
+def test_NFA_to_DFA_names():
+    a = NFA()
+    z0 = a.add_state("z0", start=True)
+    z1 = a.add_state("z1")
+    z2 = a.add_state("z2")
+    keyword = a.add_state("KEYWORD", final=True, unmergeable=True)
+    name = a.add_state("NAME", final=True, unmergeable=True)
+    for c in "if":
+        a.add_transition(z0, z1, c)
+        a.add_transition(z1, z1, c)
+    a.add_transition(z0, z2, "i")
+    a.add_transition(z2, keyword, "f")
+    a.add_transition(z1, name)
+    fda = a.make_deterministic(["KEYWORD", "NAME"])
+    assert isinstance(fda.names, StateNames)
+    assert fda.names.names[0] == (z0, )
+    r = DFARunner(fda)
+    assert r.recognize("if")
+    assert fda.names[r.state] == "KEYWORD"
+    assert r.recognize("fi")
+    assert fda.names[r.state] == "NAME"
+    assert r.recognize("i")
+    assert fda.names[r.state] == "NAME"
+    # other names are joined when needed, and pickled as a list
+    assert fda.names[0] == "z0"
+    import pickle
+    names = pickle.loads(pickle.dumps(fda.names))
+    assert type(names) is list
+    assert names == list(fda.names)
+    assert eval(repr(fda)).names == names
+    fda = a.make_deterministic(["NAME", "KEYWORD"])
+    r = DFARunner(fda)
+    assert r.recognize("if")
+    assert fda.names[r.state] == "NAME"
@@ -2,6 +2,7 @@ import py
 from cflexer.lexer import *
 from cflexer.regex import *
 from cflexer import deterministic
+from artifactcache import cache
 
 class TestDirectLexer(object):
     def get_lexer(self, rexs, names, ignore=None):
@@ -219,6 +220,200 @@ class TestDirectLexer(object):
         assert tok.name == "if"
         assert tok.source == "if"
 
+class TestTableLexer(object):
+    """The table driven matcher must produce exactly the same tokens
+    (including lookaheads and positions) as the generated code."""
+
+    backend = "table"
+
+    def compare(self, rexs, names, inputs, ignore=None):
+        code = Lexer(rexs, names, ignore)
+        table = Lexer(rexs, names, ignore, backend=self.backend)
+        assert table.backend == self.backend
+        for s in inputs:
+            for eof in [False, True]:
+                expected = code.tokenize(s, eof)
+                tokens = table.tokenize(s, eof)
+                assert tokens == expected
+                assert [t.lookahead for t in tokens] == [t.lookahead for t in expected]
+
+    def test_simple(self):
+        rexs = [StringExpression("if"), StringExpression("else"),
+                StringExpression("while"), StringExpression(":"),
+                StringExpression(" "), StringExpression("\n")]
+        names = ["IF", "ELSE", "WHILE", "COLON", "WHITE", "NL"]
+        inputs = ["if: else: while:", "if\nif if:\nelse while\n", "", "whi",
+                  "if: whi", "ifx", "x"]
+        self.compare(rexs, names, inputs)
+        self.compare(rexs, names, inputs, ["WHITE", "NL"])
+
+    def test_pro(self):
+        digits = RangeExpression("0", "9")
+        lower = RangeExpression("a", "z")
+        upper = RangeExpression("A", "Z")
+        keywords = StringExpression("if") | StringExpression("else") | StringExpression("def") | StringExpression("class")
+        underscore = StringExpression("_")
+        atoms = lower + (upper | lower | digits | underscore).kleene()
+        vars = underscore | (upper + (upper | lower | underscore | digits).kleene())
+        integers = StringExpression("0") | (RangeExpression("1", "9") + digits.kleene())
+        white = StringExpression(" ")
+        rexs = [keywords, atoms, vars, integers, white]
+        names = ["KEYWORD", "ATOM", "VAR", "INT", "WHITE"]
+        inputs = ["if A a 12341 0 else", "classy _ Foo_1 007", "a  b", "1a?"]
+        self.compare(rexs, names, inputs)
+
+    def test_lookaheads(self):
+        rexs = [StringExpression("aaa"), StringExpression("a"),
+                StringExpression("b")]
+        names = ["aaa", "a", "b"]
+        self.compare(rexs, names, ["baabaaaa", "b", "a", "aa", "aaaaaaa"])
+        rexs = [StringExpression("class"), KleeneClosure(RangeExpression("a","z")),
+                StringExpression(" ")]
+        names = ["class", "name", "space"]
+        self.compare(rexs, names, ["class test class", "cla", "classes"])
+
+    def test_pickle(self):
+        rexs = [StringExpression("if"), StringExpression(" ")]
+        names = ["IF", "WHITE"]
+        l = Lexer(rexs, names, backend="table")
+        l2 = pickle.loads(pickle.dumps(l))
+        assert l2.backend == "table"
+        assert isinstance(l2.matcher, deterministic.TableMatcher)
+        assert l2.tokenize("if if") == l.tokenize("if if")
+
+class TestLazyLexer(TestTableLexer):
+    """The lazily built DFA must produce exactly the same tokens as the
+    generated code, whether its states come from its cache or not."""
+
+    backend = "lazy"
+
+    def identifiers(self):
+        digits = RangeExpression("0", "9")
+        lower = RangeExpression("a", "z")
+        keywords = StringExpression("if") | StringExpression("else") | StringExpression("elif")
+        names = lower + (lower | digits).kleene()
+        integers = digits + digits.kleene()
+        comment = StringExpression("#") + (~StringExpression("\n")).kleene()
+        rexs = [keywords, names, integers, StringExpression(" "), StringExpression("\n"), comment]
+        return rexs, ["KEYWORD", "NAME", "INT", "WHITE", "NL", "COMMENT"]
+
+    def test_pickle(self):
+        rexs = [StringExpression("if"), StringExpression(" ")]
+        names = ["IF", "WHITE"]
+        l = Lexer(rexs, names, backend="lazy")
+        assert l.tokenize("if if")
+        l2 = pickle.loads(pickle.dumps(l))
+        assert isinstance(l2.matcher, deterministic.LazyDFA)
+        assert l2.matcher is l2.automaton
+        assert l2.tokenize("if if") == l.tokenize("if if")
+
+    def test_builds_states_on_demand(self, monkeypatch):
+        rexs, names = self.identifiers()
+        make_deterministic = deterministic.NFA.make_deterministic
+        def check(self, name_precedence=None):
+            # the DFAs of the single expressions are still built
+            assert name_precedence is None, "automaton was built eagerly"
+            return make_deterministic(self)
+        monkeypatch.setattr(deterministic.NFA, "make_deterministic", check)
+        l = Lexer(rexs, names, backend="lazy")
+        assert l.automaton.rows == {}
+        assert len(l.automaton.sets) == 1
+        l.tokenize("if x")
+        built = len(l.automaton.sets)
+        l.tokenize("if x if")
+        assert len(l.automaton.sets) == built
+        l.tokenize("elif 12 # comment")
+        assert len(l.automaton.sets) > built
+
+    def test_small_cache(self):
+        rexs, names = self.identifiers()
+        code = Lexer(rexs, names)
+        text = "if elif x1 else 123 abc # a comment\nelse if 0 iffy\n" * 20
+        expected = code.tokenize(text, True)
+        for max_states, thrash in [(1, 10), (3, 10), (3, 0), (1000, 10)]:
+            l = Lexer(rexs, names, backend="lazy")
+            l.automaton.max_states = max_states
+            l.automaton.thrash = thrash
+            tokens = l.tokenize(text, True)
+            assert tokens == expected
+            assert [t.lookahead for t in tokens] == [t.lookahead for t in expected]
+            # a flush keeps the start and the last matched state
+            assert len(l.automaton.sets) <= max(max_states, 3)
+            assert len(l.automaton.rows) <= len(l.automaton.sets)
+            assert len(l.automaton.closed) <= len(l.automaton.sets) * len(l.automaton.classes)
+            if max_states < 1000:
+                assert l.automaton.flushes > 0
+            else:
+                assert l.automaton.flushes == 0
+
+    def test_simulation(self, monkeypatch):
+        # with room for a single state, the cache thrashes as soon as a
+        # match needs a second one, and the match goes on by simulating
+        # the NFA
+        rexs, names = self.identifiers()
+        code = Lexer(rexs, names)
+        l = Lexer(rexs, names, backend="lazy")
+        l.automaton.max_states = 1
+        l.automaton.thrash = 1000
+        simulated = []
+        simulate = deterministic.LazyDFA.simulate
+        def record(self, *args):
+            simulated.append(True)
+            return simulate(self, *args)
+        monkeypatch.setattr(deterministic.LazyDFA, "simulate", record)
+        for s in ["if elif x1 else 123", "# comment\nif", "ifx 1", "?", "iff"]:
+            for eof in [False, True]:
+                expected = code.tokenize(s, eof)
+                tokens = l.tokenize(s, eof)
+                assert tokens == expected
+                assert [t.lookahead for t in tokens] == [t.lookahead for t in expected]
+                # simulating creates no states but the ones left in the runner
+                assert len(l.automaton.sets) <= 3
+                assert len(l.automaton.closed) <= 3 * len(l.automaton.classes)
+        assert simulated
+
+class TestMatcherCache(object):
+    def test_cached_matcher(self, monkeypatch):
+        rexs = [StringExpression("cached"), StringExpression(" "),
+                KleeneClosure(RangeExpression("0", "9"))]
+        names = ["CACHED", "WHITE", "NUMBER"]
+        for backend in Lexer.backends:
+            l = Lexer(rexs, names, backend=backend)
+            expected = l.tokenize("cached 123 cached")
+            def fail(*args):
+                raise AssertionError("matcher was regenerated")
+            monkeypatch.setattr(deterministic.DFA, "generate_lexing_code", fail)
+            monkeypatch.setattr(deterministic.DFA, "make_lexing_table", fail)
+            l2 = Lexer(rexs, names, backend=backend)
+            assert l2.tokenize("cached 123 cached") == expected
+            l3 = pickle.loads(pickle.dumps(l))
+            assert l3.tokenize("cached 123 cached") == expected
+            monkeypatch.undo()
+
+    def test_broken_cache(self):
+        rexs = [StringExpression("broken"), StringExpression(" ")]
+        names = ["BROKEN", "WHITE"]
+        for backend in Lexer.backends:
+            l = Lexer(rexs, names, backend=backend)
+            f = open(cache.path(l.matcher_key()), "wb")
+            f.write("garbage")
+            f.close()
+            l2 = Lexer(rexs, names, backend=backend)
+            assert [t.name for t in l2.tokenize("broken broken")] == ["BROKEN", "WHITE", "BROKEN"]
+
+    def test_bundle(self, monkeypatch):
+        rexs = [StringExpression("bundled"), StringExpression(" ")]
+        names = ["BUNDLED", "WHITE"]
+        for backend in Lexer.backends:
+            l = Lexer(rexs, names, ignore=["WHITE"], backend=backend)
+            bundle = pickle.loads(pickle.dumps(l.to_bundle(), 2))
+            def fail(*args):
+                raise AssertionError("lexer was rebuilt")
+            monkeypatch.setattr(Lexer, "load_matcher", fail)
+            l2 = Lexer.from_bundle(bundle)
+            assert l2.tokenize("bundled bundled") == l.tokenize("bundled bundled")
+            monkeypatch.undo()
+
 class TestSourcePos(object):
     def test_copy(self):
         base = SourcePos(1, 2, 3)
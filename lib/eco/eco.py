@@ -45,7 +45,7 @@ if not QtGui.QIcon.hasThemeIcon("document-new"):
 
 from grammar_parser.plexer import PriorityLexer
 from incparser.incparser import IncParser
-from inclexer.inclexer import IncrementalLexer
+from inclexer.inclexer import IncrementalLexer, IncrementalLexerCF
 from viewer import Viewer
 
 from grammar_parser.gparser import Terminal, MagicTerminal, IndentationTerminal, Nonterminal
@@ -849,7 +849,7 @@ class Window(QtGui.QMainWindow):
     def parse_options(self):
         # parse options
         parser = OptionParser(usage="usage: python2.7 %prog FILE [options]")
-        parser.add_option("-p", "--preload", action="store_true", default=False, help="Preload grammars")
+        parser.add_option("-p", "--preload", action="store_true", default=False, help="Build grammar bundles for all languages")
         parser.add_option("-v", "--verbose", action="store_true", default=False, help="Show output")
         parser.add_option("-l", "--log", default="WARNING", help="Log level: INFO, WARNING, ERROR, DEBUG [default: %default]")
         parser.add_option("-e", "--export", action="store_true", default=False, help="Fast export files. Usage: --export [SOURCE] [DESTINATION]")
@@ -880,32 +880,21 @@ class Window(QtGui.QMainWindow):
         logging.basicConfig(format='%(levelname)s: %(message)s', filemode='w', level=loglevel)
 
     def preload(self):
-        for l in newfile_langs + submenu_langs:
-            try:
-                print("Preloading %s" % (l.name))
-                l.load()
-            except AttributeError:
-                pass
+        from grammars.grammars import build_bundles
+        def progress(l):
+            print("Preloading %s" % (l.name))
+        build_bundles(newfile_langs + submenu_langs, progress)
 
     def cli_export(self, source, dest, fast):
         print("Exporting...")
         print("    Source: %s" % source)
         print("    Destination: %s" % dest)
 
-        from jsonmanager import JsonManager
-        manager = JsonManager()
-        language_boxes = manager.load(source)
-
-        from treemanager import TreeManager
-        self.tm = TreeManager()
-
-        if fast:
-            self.tm.fast_export(language_boxes, dest, source=source)
-        else:
-            self.tm.load_file(language_boxes)
-            ex = self.tm.export(dest, source=source)
-            if ex == False:
-                self.show_export_fail_message()
+        from batch import export_document
+        result = export_document((source, dest, fast))
+        if not result.ok:
+            print(result.error)
+            self.show_export_fail_message()
         QApplication.quit()
         sys.exit(1)
 
@@ -1550,6 +1539,10 @@ def main():
 
     app.showindent = False
 
+    # open languages that were never used before without waiting for their
+    # lexers to be built
+    IncrementalLexerCF.lazy_until_cached = True
+
     window=Window()
     t = SubProcessThread(window, app)
     window.thread = t
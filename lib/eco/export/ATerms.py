@@ -20,70 +20,98 @@
 # IN THE SOFTWARE.
 
 
-import re
-from grammar_parser.gparser import MagicTerminal, Terminal, Nonterminal
+from grammar_parser.gparser import Terminal, Nonterminal
 
 class ATerms:
+    """Writes a parse tree as an ATerm. Every node is visited exactly once and
+    the output is written to `out` (any object with a `write` method) in
+    chunks of roughly `chunksize` pieces while the tree is traversed. The
+    traversal uses an explicit stack, so deeply nested trees don't hit the
+    recursion limit."""
 
-    def to_term(self, node):
-        if node is None:
-            return
-        from grammar_parser.bootstrap import AstNode, ListNode
-        if isinstance(node, AstNode):
-            return self.process_astnode(node)
-        elif isinstance(node, ListNode):
-            return self.process_listnode(node)
-        elif isinstance(node.symbol, Nonterminal):
-            return self.process_nonterm(node)
-        elif isinstance(node.symbol, Terminal):
-            return self.process_term(node)
+    chunksize = 4096
 
-    def process_astnode(self, node):
-        s = []
-        s.append(node.name)
-        s.append("(")
-        s.append(self.collect_children(node.children.values()))
-        s.append(")")
-        return "".join(s)
+    def __init__(self, out):
+        self.out = out
+        self.buf = []
 
-    def collect_children(self, children):
-        s = []
-        for c in children:
-            t = self.to_term(c)
-            if t:
-                s.append(self.to_term(c))
-        return ", ".join(s)
+    def write(self, text):
+        self.buf.append(text)
+        if len(self.buf) >= self.chunksize:
+            self.flush()
 
-    def process_listnode(self, node):
-        s = []
-        s.append("[")
-        s.append(self.collect_children(node.children))
-        s.append("]")
-        return "".join(s)
+    def flush(self):
+        self.out.write("".join(self.buf))
+        self.buf = []
 
-    def process_nonterm(self, node):
+    def resolve(self, node):
+        """Return the node whose term is written for `node`, or None if
+        `node` doesn't produce any output."""
         from grammar_parser.bootstrap import AstNode, ListNode
-        if not isinstance(node, AstNode) and not isinstance(node, ListNode) and node.alternate:
-            return self.to_term(node.alternate)
-        s = []
-        s.append(node.symbol.name)
-        s.append("(")
-        children = []
-        for c in node.children:
-            text = self.to_term(c)
-            if text:
-                children.append(text)
-        s.append(", ".join(children))
-        s.append(")")
-        return "".join(s)
+        while node is not None:
+            if isinstance(node, AstNode) or isinstance(node, ListNode):
+                return node
+            elif isinstance(node.symbol, Nonterminal):
+                if not node.alternate:
+                    return node
+                node = node.alternate
+            elif isinstance(node.symbol, Terminal):
+                return node
+            else:
+                return None
+        return None
 
-    def process_term(self, node):
-        s = []
-        s.append(node.lookup)
-        s.append("(\"")
-        s.append(repr(node.symbol.name))
-        s.append("\")")
-        return "".join(s)
+    def export(self, start):
+        """Write the term for `start` and return whether there was one."""
+        from grammar_parser.bootstrap import AstNode, ListNode
+        node = self.resolve(start)
+        if node is None:
+            return False
+        # items on the stack are either resolved nodes or strings
+        stack = [node]
+        while stack:
+            node = stack.pop()
+            if isinstance(node, str):
+                self.write(node)
+                continue
+            if isinstance(node, AstNode):
+                self.write(node.name)
+                self.write("(")
+                self.push_children(stack, node.children.values(), ")")
+            elif isinstance(node, ListNode):
+                self.write("[")
+                self.push_children(stack, node.children, "]")
+            elif isinstance(node.symbol, Nonterminal):
+                self.write(node.symbol.name)
+                self.write("(")
+                self.push_children(stack, node.children, ")")
+            else:
+                self.write(node.lookup)
+                self.write("(\"")
+                self.write(repr(node.symbol.name))
+                self.write("\")")
+        self.flush()
+        return True
+
+    def push_children(self, stack, children, close):
+        stack.append(close)
+        terms = []
+        for c in children:
+            c = self.resolve(c)
+            if c is not None:
+                terms.append(c)
+        for i in range(len(terms) - 1, -1, -1):
+            stack.append(terms[i])
+            if i > 0:
+                stack.append(", ")
 
-def export(start):
-    return ATerms().to_term(start)
+def export(start, out=None):
+    """Write the ATerm for the tree `start` to `out`. If no `out` is given,
+    the term is returned as a string."""
+    if out is None:
+        from cStringIO import StringIO
+        buf = StringIO()
+        if not ATerms(buf).export(start):
+            return None
+        return buf.getvalue()
+    ATerms(out).export(start)
@@ -63,6 +63,8 @@ class CPythonExporter(object):
             return self._run()
         elif debug:
             return self._debug()
+        elif path:
+            return self.tm.export_as_text(path)
         else:
             f = tempfile.mkstemp()
             self.tm.export_as_text(f[1])
@@ -264,12 +264,16 @@ class JRubyExporter(object):
             else:
                 self._output.append(sym.name)
 
-    def _export_as_text(self, path):
+    def as_text(self):
         node = self.tm.lines[0].node # first node
+        self._output = []
         self._walk_rb(node)
-        output = "".join(self._output)
+        return "".join(self._output)
+
+    def _export_as_text(self, path):
+        output = self.as_text()
         with open(path, "w") as fp:
-            fp.write("".join(output))
+            fp.write(output)
 
     def _run(self):
         f = tempfile.mkstemp(suffix=".rb")
@@ -191,7 +191,19 @@ class BootstrapParser(object):
                 s.append(c.symbol.name[1:-1])
         return s
 
-    def create_parser(self, pickle_id = None):
+    def create_parser(self, pickle_id = None, previous = None):
+        """Create the incremental parser for the rules. If the syntax table
+        has to be built, the StateGraph `previous` of an earlier version of
+        the grammar is used to speed this up."""
+        self.add_implicit_rules()
+        incparser = IncParser()
+        incparser.from_dict(self.rules, self.start_symbol, self.lr_type, self.implicit_ws(), pickle_id, self.precedences, previous=previous)
+        incparser.init_ast()
+        self.incparser = incparser
+
+    def add_implicit_rules(self):
+        """Add the rules for *match_until functions and implicit whitespace
+        to the parsed rules."""
         self.all_terminals.update(self.terminals)
 
         for fname, terminals, parentrule in self.functions:
@@ -238,11 +250,6 @@ class BootstrapParser(object):
             self.rules[start_rule.symbol] = start_rule
             self.start_symbol = start_rule.symbol
 
-        incparser = IncParser()
-        incparser.from_dict(self.rules, self.start_symbol, self.lr_type, self.implicit_ws(), pickle_id, self.precedences)
-        incparser.init_ast()
-        self.incparser = incparser
-
     def parse_rules(self, node):
         if node.children[0].symbol.name == "parser":
             self.parse_rules(node.children[0])
@@ -449,7 +456,8 @@ class BootstrapParser(object):
         # add so far undefined terminals
         undefined_terminals = self.terminals.difference(set(names))
         import re
-        for t in undefined_terminals:
+        # sorted, so the lexer (and its cache key) doesn't depend on set order
+        for t in sorted(undefined_terminals):
             names.insert(0, t)
             regexs.insert(0,re.escape(t))
         self.inclexer = IncrementalLexerCF()
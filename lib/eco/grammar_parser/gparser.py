@@ -40,6 +40,9 @@ class Rule(object):
         return "Rule(%s => %s)" % (self.symbol, self.alternatives)
 
 class Symbol(object):
+    # every node of a parse tree has its own symbol, so keep them small
+    __slots__ = ["name", "folding"]
+
     def __init__(self, name="", folding=None):
         self.name = name
         self.folding = folding
@@ -59,7 +62,14 @@ class Symbol(object):
     def copy(self):
         return self.__class__(self.name, self.folding)
 
+    def __reduce__(self):
+        # unpickled symbols must have their name right away, as they may be
+        # hashed before the rest of the pickle is loaded
+        return (self.__class__, (self.name, self.folding), getattr(self, "__dict__", None))
+
 class Terminal(Symbol):
+    __slots__ = []
+
     def __repr__(self):
         return "Terminal('%s')" % (repr(self.name),)
 
@@ -68,14 +78,19 @@ class MagicTerminal(Terminal):
         return "MagicTerminal('%s')" % (repr(self.name),)
 
 class IndentationTerminal(Terminal):
+    __slots__ = []
+
     def __repr__(self):
         return "IndentationTerminal('%s')" % (repr(self.name),)
 
 class Nonterminal(Symbol):
+    __slots__ = []
+
     def __repr__(self):
         return "Nonterminal('%s')" % (self.name,)
 
 class Epsilon(Symbol):
+    __slots__ = []
 
     def __eq__(self, other):
         return isinstance(other, Epsilon)
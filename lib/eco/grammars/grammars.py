@@ -40,7 +40,94 @@ class EcoGrammar(object):
     def __str__(self):
         return self.name
 
-_cache = {}
+import os, hashlib
+
+# Load languages from precompiled bundles (see GrammarEntry)
+use_bundles = True
+
+class GrammarEntry(object):
+    """Everything EcoFile.load derives from a grammar file, kept so that
+    further language boxes of the same language can be created without
+    touching the file again.
+
+    Pickled entries are the grammar bundles kept in the artifact cache: they
+    contain the rules, the syntax table and the lexer's automaton and matcher,
+    so loading a language from a bundle doesn't need to parse the grammar or
+    build anything."""
+
+    def __init__(self, pickle_id, rules, syntaxtable, whitespace, lexer):
+        self.pickle_id = pickle_id
+        self.rules = rules
+        self.syntaxtable = syntaxtable
+        self.whitespace = whitespace
+        self.lexer = lexer
+
+    @staticmethod
+    def bundle_key(pickle_id):
+        # bundles contain marshalled code
+        from artifactcache import make_key
+        from cflexer.lexer import MATCHER_VERSION
+        import imp
+        return make_key("bundle", pickle_id, imp.get_magic().encode("hex"), MATCHER_VERSION)
+
+    def __getstate__(self):
+        return (self.pickle_id, self.rules, self.syntaxtable, self.whitespace,
+                self.lexer.backend, self.lexer.indentation_based,
+                self.lexer.lexer.to_bundle())
+
+    def __setstate__(self, state):
+        from inclexer.inclexer import IncrementalLexerCF
+        from cflexer.lexer import Lexer
+        self.pickle_id, self.rules, self.syntaxtable, self.whitespace = state[:4]
+        backend, indentation_based, lexer = state[4:]
+        self.lexer = IncrementalLexerCF(backend=backend)
+        self.lexer.indentation_based = indentation_based
+        self.lexer.lexer = Lexer.from_bundle(lexer)
+
+class GrammarRegistry(object):
+    """Memoizes loaded grammars by language name, and the content hashes of
+    grammar files by filename. A file's hash is only recomputed when its
+    modification time or size changes. Grammar entries are keyed on the
+    EcoFile's cache key, which includes the content hash, so editing a
+    grammar file invalidates all languages built from it.
+
+    For languages whose syntax table had to be built, the state graph is kept
+    as well, so that rebuilding the table after the grammar was edited can
+    reuse the states the edit doesn't affect."""
+
+    def __init__(self):
+        self.files = {}     # filename -> ((mtime, size), content hash)
+        self.grammars = {}  # language name -> GrammarEntry
+        self.graphs = {}    # language name -> StateGraph of the last build
+
+    def content_hash(self, filename):
+        st = os.stat(filename)
+        stamp = (st.st_mtime, st.st_size)
+        cached = self.files.get(filename)
+        if cached is None or cached[0] != stamp:
+            with open(filename, "rb") as f:
+                cached = (stamp, hashlib.sha1(f.read()).hexdigest())
+            self.files[filename] = cached
+        return cached[1]
+
+    def get(self, name, pickle_id):
+        entry = self.grammars.get(name)
+        if entry is not None and entry.pickle_id != pickle_id:
+            # grammar file or extensions changed since it was loaded
+            del self.grammars[name]
+            return None
+        return entry
+
+    def add(self, name, entry):
+        self.grammars[name] = entry
+
+    def clear(self):
+        self.files.clear()
+        self.grammars.clear()
+        self.graphs.clear()
+
+registry = GrammarRegistry()
+
 class EcoFile(object):
     def __init__(self, name, filename, base=""):
         self.name = name
@@ -52,54 +139,50 @@ class EcoFile(object):
     def load(self):
         from grammar_parser.bootstrap import BootstrapParser
         from jsonmanager import JsonManager
+        from incparser.incparser import IncParser
 
-        if _cache.has_key(self.name + "::parser"):
-
-            root, language, whitespaces = _cache[self.name + "::json"]
-
-            # parse rules as they are needed by the incremental parser to
-            # detect comments
-
-            manager = JsonManager(unescape=True)
-            root, language, whitespaces = manager.load(self.filename)[0]
+        from artifactcache import cache
 
-            pickle_id = hash(self)
-            bootstrap = BootstrapParser(lr_type=1, whitespaces=whitespaces)
-            bootstrap.ast = root
-            bootstrap.parse_rules(root.children[1].children[1].children[0])
-
-            pickle_id, whitespace = _cache[self.name + "::parser"]
-            from incparser.incparser import IncParser
+        pickle_id = self.cache_key()
+        entry = registry.get(self.name, pickle_id)
+        if entry is None and use_bundles:
+            entry = cache.load(GrammarEntry.bundle_key(pickle_id))
+            if entry is not None:
+                registry.add(self.name, entry)
+        if entry is not None:
             incparser = IncParser()
-            incparser.from_dict(bootstrap.rules, None, None, whitespace, pickle_id, None)
+            incparser.from_dict(entry.rules, None, None, entry.whitespace, pickle_id, None, entry.syntaxtable)
             incparser.init_ast()
-
-            inclexer = _cache[self.name + "::lexer"]
-            incparser.lexer = inclexer # give parser a reference to its lexer (needed for multiline comments)
-
-            return (incparser, inclexer)
-        else:
-            manager = JsonManager(unescape=True)
-            root, language, whitespaces = manager.load(self.filename)[0]
-
-            pickle_id = hash(self)
-            bootstrap = BootstrapParser(lr_type=1, whitespaces=whitespaces)
-            bootstrap.ast = root
-            bootstrap.extra_alternatives = self.alts
-            bootstrap.change_startrule = self.extract
-            bootstrap.read_options()
-
-            bootstrap.parse_both()
-            bootstrap.create_parser(pickle_id)
-            bootstrap.create_lexer()
-            whitespace = bootstrap.implicit_ws()
-
-            _cache[self.name + "::lexer"] = bootstrap.inclexer
-            _cache[self.name + "::json"] = (root, language, whitespaces)
-            _cache[self.name + "::parser"] = (pickle_id, whitespace)
-
-            bootstrap.incparser.lexer = bootstrap.inclexer
-            return (bootstrap.incparser, bootstrap.inclexer)
+            incparser.lexer = entry.lexer # give parser a reference to its lexer (needed for multiline comments)
+            return (incparser, entry.lexer)
+
+        manager = JsonManager(unescape=True)
+        root, language, whitespaces = manager.load(self.filename)[0]
+
+        bootstrap = BootstrapParser(lr_type=1, whitespaces=whitespaces)
+        bootstrap.ast = root
+        bootstrap.extra_alternatives = self.alts
+        bootstrap.change_startrule = self.extract
+        bootstrap.read_options()
+
+        bootstrap.parse_both()
+        bootstrap.create_parser(pickle_id, registry.graphs.get(self.name))
+        if bootstrap.incparser.graph is not None:
+            registry.graphs[self.name] = bootstrap.incparser.graph
+        bootstrap.create_lexer()
+        whitespace = bootstrap.implicit_ws()
+
+        entry = GrammarEntry(pickle_id, bootstrap.rules,
+                             bootstrap.incparser.syntaxtable, whitespace,
+                             bootstrap.inclexer)
+        registry.add(self.name, entry)
+        if use_bundles:
+            # a lexer that is still being built would be bundled as a lazy one
+            bootstrap.inclexer.when_built(
+                lambda: cache.store(GrammarEntry.bundle_key(pickle_id), entry))
+
+        bootstrap.incparser.lexer = bootstrap.inclexer
+        return (bootstrap.incparser, bootstrap.inclexer)
 
     def add_alternative(self, nonterminal, language):
         if nonterminal not in self.alts:
@@ -112,11 +195,15 @@ class EcoFile(object):
     def __str__(self):
         return self.name
 
+    def cache_key(self):
+        """Return a key identifying the grammar file's content and the
+        extensions of this language, which is stable across interpreters."""
+        from artifactcache import make_key
+        return make_key("grammar", registry.content_hash(self.filename),
+                        sorted(self.alts.items()), self.extract)
+
     def __hash__(self):
-        h1 = hash(file(self.filename, "r").read())
-        h2 = hash(repr(self.alts))
-        h3 = hash(str(self.extract))
-        return h1 ^ h2 ^ h3
+        return hash(self.cache_key())
 
 from eco_grammar import eco_grammar # needed to edit EcoGrammar
 
@@ -188,3 +275,18 @@ submenu_langs = [java, javasqlchemical, java_expr, php, phppython, python, pytho
 lang_dict = {}
 for l in languages:
     lang_dict[l.name] = l
+
+def build_bundles(langs=None, callback=None):
+    """Compile a bundle for every grammar file based language in `langs` (by
+    default all of them), so that later processes can load them without
+    building anything. `callback` is called with each language first."""
+    if langs is None:
+        langs = languages
+    done = set()
+    for l in langs:
+        if l.name in done or type(l) is not EcoFile:
+            continue
+        done.add(l.name)
+        if callback:
+            callback(l)
+        l.load()
@@ -20,10 +20,10 @@
 # IN THE SOFTWARE.
 
 from grammar_parser.plexer import PriorityLexer
-from grammar_parser.gparser import MagicTerminal, Terminal, IndentationTerminal
+from grammar_parser.gparser import MagicTerminal, Terminal, Nonterminal, IndentationTerminal
 from incparser.astree import BOS, EOS, TextNode, ImageNode
 from PyQt4.QtGui import QImage
-import re, os
+import re, os, bisect, logging, threading
 
 class IncrementalLexer(object):
     # XXX needs to be replaced by a lexing automaton to avoid unnecessary
@@ -358,9 +358,34 @@ class IncrementalLexer(object):
 
 from cflexer.regexparse import parse_regex
 from cflexer.lexer import Lexer
+
+build_lock = threading.Lock()
+
 class IncrementalLexerCF(object):
-    def __init__(self, rules=None, language=""):
+    # Leave nodes at the start and end of a relexed range untouched if they
+    # are lexed exactly as before (see merge_back)
+    reuse_tokens = True
+    # Matcher backend of the lexers of newly loaded languages (see
+    # cflexer.lexer.Lexer). With "lazy", languages that are not bundled
+    # yet open without building their whole lexer first.
+    default_backend = "code"
+    # Use the "lazy" backend for lexers whose automaton isn't cached yet,
+    # and build the lexer with `backend` in a background thread, replacing
+    # the lazy one once it is done (see when_built). Only the editor turns
+    # this on: the thread dies with short-lived processes before it's done.
+    lazy_until_cached = False
+
+    def __init__(self, rules=None, language="", backend=None):
         self.indentation_based = False
+        if backend is None:
+            backend = self.default_backend
+        self.backend = backend
+        self.building = None # thread building the lexer
+        self.callbacks = []
+        # number of tokens merged back into the tree by relex, and how many
+        # of them were left untouched
+        self.relexed = 0
+        self.reused = 0
         if rules:
             if rules.startswith("%"):
                 config_line = rules.splitlines()[0]     # get first line
@@ -380,7 +405,7 @@ class IncrementalLexerCF(object):
         for regex in regexs:
             r = parse_regex(regex)
             parsed_regexs.append(r)
-        self.lexer = Lexer(parsed_regexs, names)
+        self.make_lexer(parsed_regexs, names)
 
     def createDFA(self, rules):
         # lex lexing rules
@@ -396,7 +421,42 @@ class IncrementalLexerCF(object):
             r = parse_regex(regex)
             regexs.append(r)
             names.append(name)
-        self.lexer = Lexer(regexs, names)
+        self.make_lexer(regexs, names)
+
+    def make_lexer(self, regexs, names):
+        if (self.backend == "lazy" or not self.lazy_until_cached or
+                Lexer.is_cached(regexs, names)):
+            self.lexer = Lexer(regexs, names, backend=self.backend)
+            return
+        self.lexer = Lexer(regexs, names, backend="lazy")
+        self.building = threading.Thread(target=self.build, args=(regexs, names))
+        self.building.daemon = True
+        self.building.start()
+
+    def build(self, regexs, names):
+        lexer = Lexer(regexs, names, backend=self.backend)
+        with build_lock:
+            self.lexer = lexer
+            self.building = None
+            callbacks, self.callbacks = self.callbacks, []
+        for callback in callbacks:
+            callback()
+
+    def when_built(self, callback):
+        """Call `callback` once the lexer uses its `backend`: right away, or
+        from the thread building it."""
+        with build_lock:
+            if self.building is not None:
+                self.callbacks.append(callback)
+                return
+        callback()
+
+    def wait_until_built(self):
+        """Wait until the lexer uses its `backend`, e.g. so that the bundle
+        of its language is stored before the process exits."""
+        building = self.building
+        if building is not None:
+            building.join()
 
     def is_indentation_based(self):
         return self.indentation_based
@@ -412,29 +472,65 @@ class IncrementalLexerCF(object):
         return l
 
     def relex_import(self, startnode, version = 0):
-        success = self.lex(startnode.symbol.name)
+        """Replace `startnode`, which holds the text of a whole file, with the
+        text's tokens and return the newline nodes among them, in order.
+
+        Tokens are taken from the runner one at a time and linked into the
+        chain of terminals as they come. The terminals of every line are put
+        under a temporary, changed `import_line` nonterminal instead of
+        directly under the root: the first parse breaks these down anyway,
+        but this way the indentation tokens it inserts after each newline
+        don't need a search through the children of the root, which would
+        be a list of all tokens of the file."""
+        next_token = self.lexer.get_token_iter(startnode.symbol.name)
         bos = startnode.prev_term # bos
         startnode.parent.remove_child(startnode)
         parent = bos.parent
         eos = parent.children.pop()
+        newlines = []
+        line = []
         last_node = bos
-        for match in success:
-            node = TextNode(Terminal(match[0]))
+        while True:
+            try:
+                token = next_token()
+            except StopIteration:
+                break
+            node = TextNode(Terminal(token.source))
             node.version = version
-            node.lookup = match[1]
-            parent.children.append(node)
-            last_node.next_term = node
-            last_node.right = node
-            node.left = last_node
+            node.lookup = token.name
+            node.lookahead = token.lookahead
             node.prev_term = last_node
-            node.parent = parent
+            last_node.next_term = node
+            line.append(node)
             last_node = node
+            if token.source == "\r":
+                newlines.append(node)
+                self.append_import_line(parent, line)
+                line = []
+        if line:
+            self.append_import_line(parent, line)
+        parent.children[-1].right = eos
+        eos.left = parent.children[-1]
         parent.children.append(eos)
-        last_node.right = eos # link to eos
         last_node.next_term = eos
-        eos.left = last_node
         eos.prev_term = last_node
-
+        return newlines
+
+    def append_import_line(self, parent, nodes):
+        group = TextNode(Nonterminal("import_line"))
+        group.children = nodes
+        group.changed = True
+        left = None
+        for node in nodes:
+            node.parent = group
+            node.left = left
+            if left is not None:
+                left.right = node
+            left = node
+        group.parent = parent
+        group.left = parent.children[-1]
+        group.left.right = group
+        parent.children.append(group)
 
     def split_endcomment(self, node):
         read_nodes = [node]
@@ -476,7 +572,7 @@ class IncrementalLexerCF(object):
         pos = 0  # read tokens
         read = 0 # generated tokens
         current_node = node
-        next_token = self.lexer.get_token_iter(StringWrapper(node))
+        next_token = self.lexer.get_token_iter(NodeCursor(node))
         while True:
             token = next_token()
             if token.source == "":
@@ -508,9 +604,44 @@ class IncrementalLexerCF(object):
 
         return self.merge_back(read_nodes, generated_tokens)
 
+    def unchanged(self, node, token):
+        """Return whether `token` is exactly what `node` was lexed to last
+        time: same text, type and lookahead, and the text hasn't been edited
+        since the last version was saved."""
+        return (node.symbol.name == token.source and node.lookup == token.name
+                and node.lookahead == token.lookahead and not node.text_changed())
+
     def merge_back(self, read_nodes, generated_tokens):
 
         any_changes = False
+        # Nodes at either end of the relexed range that come out unchanged are
+        # kept as they are. Only the nodes in between are updated and marked,
+        # so that the parser has to look at the damaged part only.
+        start = 0
+        end = len(read_nodes)
+        token_end = len(generated_tokens)
+        if self.reuse_tokens:
+            unchanged = self.unchanged
+            while (start < end and start < token_end
+                   and unchanged(read_nodes[start], generated_tokens[start])):
+                start += 1
+            while (end > start and token_end > start
+                   and unchanged(read_nodes[end - 1], generated_tokens[token_end - 1])):
+                end -= 1
+                token_end -= 1
+            if start == end == 0 and token_end > 0:
+                # need a node to insert the new ones after
+                end += 1
+                token_end += 1
+        reused = start + len(generated_tokens) - token_end
+        self.relexed += len(generated_tokens)
+        self.reused += reused
+        logging.debug("relexed %s tokens, reused %s", len(generated_tokens), reused)
+        if start > 0:
+            last_node = read_nodes[start - 1]
+        read_nodes = read_nodes[start:end]
+        generated_tokens = generated_tokens[start:token_end]
+
         # insert new nodes into tree
         it = iter(read_nodes)
         for t in generated_tokens:
@@ -575,26 +706,63 @@ class IncrementalLexerCF(object):
 IncrementalLexer = IncrementalLexerCF
 import sys
 
-class StringWrapper(object):
-    # XXX This is just a temprary solution. To do this right we have to alter
-    # the lexer to work on (node, index)-tuples
+def ends_line(node):
+    """Return whether lexing must not continue into `node`."""
+    return (isinstance(node, EOS) or isinstance(node.symbol, IndentationTerminal)
+            or node.symbol.name == "\r" or isinstance(node.symbol, MagicTerminal))
+
+class NodeCursor(object):
+    """Presents the text of the terminals starting at `startnode` as a string
+    to the lexer's runner, without copying it.
+
+    The cursor records every terminal it walks over together with the offset
+    of its first character. Reading further only continues the walk along
+    `next_term` from the last recorded terminal, while indices that were
+    already passed, e.g. when the runner backs up to the end of the last
+    match, are found by bisecting the offsets. Reading through n characters
+    spread over m terminals therefore costs O(n + m), instead of a walk from
+    `startnode` for every character.
+
+    The walk skips an indentation terminal following a terminal and ends at
+    EOS. The length is unknown (sys.maxint) until the cursor reaches a
+    terminal that is followed by the end of a line, after which it is the
+    offset at the end of that terminal. Slices end at the first newline,
+    indentation terminal or language box."""
 
     def __init__(self, startnode):
-        self.node = startnode
+        node = startnode
+        if isinstance(node.symbol, IndentationTerminal):
+            node = node.next_term
+        if isinstance(node, EOS):
+            self.nodes = []
+            self.starts = []
+            self.end = 0
+        else:
+            self.nodes = [node]
+            self.starts = [0]
+            self.end = None
         self.length = sys.maxint
+        # scanning state for the end of slices
+        self.scan_node = node
+        self.scan_pos = 0
 
     def __len__(self):
         return self.length
 
-    def __getitem__(self, index):
-        startindex = index
-        node = self.node
-        if isinstance(node.symbol, IndentationTerminal):
-            node = node.next_term
-        if isinstance(node, EOS):
+    def seek(self, index):
+        """Return the terminal containing `index` together with the offset of
+        its first character."""
+        starts = self.starts
+        if not starts:
             raise IndexError
-        while index > len(node.symbol.name) - 1:
-            index -= len(node.symbol.name)
+        pos = starts[-1]
+        if index < pos:
+            i = bisect.bisect_right(starts, index) - 1
+            return self.nodes[i], starts[i]
+        node = self.nodes[-1]
+        name = node.symbol.name
+        while index >= pos + len(name):
+            pos += len(name)
             node = node.next_term
             if node is None:
                 raise IndexError
@@ -602,32 +770,52 @@ class StringWrapper(object):
                 node = node.next_term
             if isinstance(node, EOS):
                 raise IndexError
-        if node.next_term and (isinstance(node.next_term, EOS) or isinstance(node.next_term.symbol, IndentationTerminal) or node.next_term.symbol.name == "\r" or isinstance(node.next_term.symbol, MagicTerminal)):
-            self.length = startindex + len(node.symbol.name[index:])
-        return node.symbol.name[index]
+            name = node.symbol.name
+            self.nodes.append(node)
+            starts.append(pos)
+        return node, pos
+
+    def __getitem__(self, index):
+        node, pos = self.seek(index)
+        name = node.symbol.name
+        if node.next_term and ends_line(node.next_term):
+            self.length = pos + len(name)
+        return name[index - pos]
+
+    def slice_end(self, stop):
+        """Return where slices up to `stop` end."""
+        if self.end is None:
+            node = self.scan_node
+            pos = self.scan_pos
+            while pos < stop:
+                pos += len(node.symbol.name)
+                node = node.next_term
+                if ends_line(node):
+                    self.end = pos
+                    break
+            self.scan_node = node
+            self.scan_pos = pos
+        if self.end is None or stop < self.end:
+            return stop
+        return self.end
 
     def __getslice__(self, start, stop):
         if stop <= start:
             return ""
 
-        name = self.node.symbol.name
-        if start < len(name) and stop < len(name):
-            return name[start: stop]
+        if self.nodes:
+            name = self.nodes[0].symbol.name
+            if start < len(name) and stop < len(name):
+                return name[start: stop]
 
+        stop = self.slice_end(stop)
+        if start >= stop:
+            return ""
+        node, pos = self.seek(start)
         text = []
-        node = self.node
-        i = 0
-        while i < stop:
-            text.append(node.symbol.name)
-            i += len(node.symbol.name)
+        while pos < stop:
+            name = node.symbol.name
+            text.append(name[max(start - pos, 0):stop - pos])
+            pos += len(name)
             node = node.next_term
-            if isinstance(node, EOS):
-                break
-            if isinstance(node.symbol, IndentationTerminal):
-                break
-            if node.symbol.name == "\r":
-                break
-            if isinstance(node.symbol, MagicTerminal):
-                break
-
-        return "".join(text)[start:stop]
+        return "".join(text)
@@ -19,11 +19,14 @@
 # FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
 # IN THE SOFTWARE.
 
-from inclexer.inclexer import IncrementalLexer, StringWrapper
+import sys
+import pytest
+
+from inclexer.inclexer import IncrementalLexer, NodeCursor
 from incparser.astree import AST
 from grammars.grammars import calc
 from incparser.astree import TextNode, BOS, EOS
-from grammar_parser.gparser import Terminal, Nonterminal
+from grammar_parser.gparser import Terminal, Nonterminal, IndentationTerminal
 
 class Test_IncrementalLexer:
 
@@ -230,7 +233,7 @@ class Test_CalcLexer(Test_IncrementalLexer):
         assert ast.parent.children[2].symbol.name == "aaa"
         assert ast.parent.children[3].symbol.name == "b"
 
-    def test_stringwrapper(self):
+    def test_nodecursor(self):
         ast = AST()
         ast.init()
         bos = ast.parent.children[0]
@@ -246,7 +249,7 @@ class Test_CalcLexer(Test_IncrementalLexer):
         text3.insert_after(text4)
         text4.insert_after(text5)
 
-        wrapper = StringWrapper(text1)
+        wrapper = NodeCursor(text1)
         assert wrapper[0] == "a"
         assert wrapper[2] == "c"
         assert wrapper[3] == "+"
@@ -261,4 +264,47 @@ class Test_CalcLexer(Test_IncrementalLexer):
                 assert wrapper[i:j] == s[i:j]
                 print(i,j,wrapper[i:j])
 
-
+    def make_nodes(self, *names):
+        ast = AST()
+        ast.init()
+        last = ast.parent.children[0]
+        nodes = []
+        for name in names:
+            if name in ["INDENT", "DEDENT"]:
+                node = TextNode(IndentationTerminal(name))
+            else:
+                node = TextNode(Terminal(name))
+            last.insert_after(node)
+            nodes.append(node)
+            last = node
+        return nodes
+
+    def test_nodecursor_backwards(self):
+        nodes = self.make_nodes("abc", "+", "", "1", "*", "3456")
+        s = "abc+1*3456"
+        cursor = NodeCursor(nodes[0])
+        for i in [9, 0, 5, 4, 3, 8, 2, 6, 1, 7]:
+            assert cursor[i] == s[i]
+        assert cursor[2:8] == s[2:8]
+        assert cursor[7:10] == s[7:10]
+        with pytest.raises(IndexError):
+            cursor[10]
+
+    def test_nodecursor_newline(self):
+        nodes = self.make_nodes("ab", "cd", "\r", "INDENT", "ef", "\r")
+        cursor = NodeCursor(nodes[0])
+        assert len(cursor) == sys.maxint
+        assert cursor[1] == "b"
+        assert cursor[3] == "d"
+        assert len(cursor) == 4
+        # reading continues past the newline, skipping indentation
+        assert cursor[4] == "\r"
+        assert cursor[5] == "e"
+        assert len(cursor) == 7
+        # but slices end at the newline
+        assert cursor[0:7] == "abcd"
+        assert cursor[1:3] == "bc"
+        assert cursor[4:6] == ""
+        assert NodeCursor(nodes[2])[0:3] == "\r"
+        assert NodeCursor(nodes[3])[0] == "e"
+        assert NodeCursor(nodes[3])[0:4] == "ef"
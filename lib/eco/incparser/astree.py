@@ -20,8 +20,9 @@
 # IN THE SOFTWARE.
 
 import re
-from grammar_parser.gparser import Nonterminal, Terminal, IndentationTerminal
+from grammar_parser.gparser import Nonterminal, Terminal, IndentationTerminal, MagicTerminal
 from syntaxtable import FinishSymbol
+from history import NodeLog
 
 class AST(object):
     def __init__(self, parent=None):
@@ -40,80 +41,65 @@ class AST(object):
     def get_bos(self):
         return self.parent.children[0]
 
-    def get_nodes_at_position(self, pos, a=None, b=None):
+    def get_nodes_at_position(self, pos):
         """
         Searches all nodes that match the current cursor position in the TextField.
-        As a side effect all passed nodes are updated with their position in the document.
+        As a side effect the returned nodes are updated with their position in the document.
         """
-        print("================== get nodes at pos ================== ")
-        progress = 0
-        node = self.parent.children[0]
-        while node is not None:
-            node.position = progress
-            progress += len(node.symbol.name)
-
-            print("node", node)
-            if pos < progress:
-                return [node, None]
-
-            if pos == progress:
-                print("pos == progress")
-                other = node.next_terminal()
-                print("other", other)
-                other.position = progress
-                return [node, other]
-
-            node = node.next_terminal()
-        print ("================ end get nodes at pos ================ ")
-
-
-    def get_nodes_at_position_old(self, pos, node=None, bla=0):
-        print("Progress:", self.progress, "Node", node)
-        if node is None:
-           node = self.parent#.children[1]
-
-        if isinstance(node.symbol, Nonterminal):
+        node, inner = self.find_node_at_pos(pos)
+        node.position = pos - inner
+        if inner < len(node.symbol.name):
+            return [node, None]
+        other = node.next_terminal()
+        other.position = pos
+        return [node, other]
+
+    def find_node_at_pos(self, pos):
+        """Return the terminal containing the character before offset `pos` of
+        the text and the position of `pos` within that terminal, i.e. where a
+        cursor at `pos` would be. At offset 0 this is BOS. Language boxes are
+        entered, offsets beyond the end of the text are at its end.
+
+        Uses the extents cached on the nonterminals (see Node.get_extent), so
+        only the path from the root to the terminal is visited."""
+        node = self.parent
+        pos = min(pos, node.get_extent()[0])
+        if pos <= 0:
+            return node.children[0], 0
+        while True:
+            if isinstance(node.symbol, MagicTerminal):
+                node = node.symbol.ast
+            if not node.children:
+                return node, pos
             for child in node.children:
-                result = self.get_nodes_at_position(pos, child, self.progress)
-                if result != []:
-                    self.progress = 0
-                    return result
-        else:
-            nodes = []
-            if pos <= self.progress + len(node.symbol.name):
-                nodes.append(node)
-
-            if pos == self.progress + len(node.symbol.name):
-                nodes.append(node.next_terminal())
-
-            self.progress += len(node.symbol.name)
-            return nodes
-
-    def find_node_at_pos(self, pos, node=None): #recursive
-        if node is None:
-           node = self.parent.children[1]
-
-        if isinstance(node.symbol, Nonterminal):
+                chars = child.get_extent()[0]
+                if pos <= chars and chars > 0:
+                    node = child
+                    break
+                pos -= chars
+
+    def find_line_start(self, line):
+        """Return the offset at which line `line` (counting from 0) of the text
+        starts, or the length of the text if it has fewer lines."""
+        node = self.parent
+        if line <= 0:
+            return 0
+        if line > node.get_extent()[1]:
+            return node.get_extent()[0]
+        offset = 0
+        while True:
+            if isinstance(node.symbol, MagicTerminal):
+                node = node.symbol.ast
+            if not node.children:
+                # the line-th line break
+                return offset + 1
             for child in node.children:
-                result = self.find_node_at_pos(pos, child)
-                if result:
-                    return result
-
-        if node.pos + len(node.symbol.name) >= pos:
-            return node
-
-
-    def find_node_at_pos_iterative(self, pos): #not working
-        stack = []
-        stack.append(self.parent.children[1]) # skip bos
-        #XXX speed things up later by having a list/dict of all terminal nodes
-        while stack != []:
-            e = stack.pop(0)
-            if isinstance(e.symbol, Nonterminal):
-                stack.extend(e.children)
-                continue
-            if e.pos + len(e.symbol.name) >= pos:
-                return e
+                chars, lines = child.get_extent()
+                if line <= lines and lines > 0:
+                    node = child
+                    break
+                line -= lines
+                offset += chars
 
     def find_common_parent(self, start, end):
         start_parents = []
@@ -153,9 +139,10 @@ class AST(object):
         return "\n".join(output)
 
 class Node(object):
-    __slots__ = ["symbol", "state", "parent", "left", "right", "prev_term", "next_term", "magic_parent", "children", "annotations"]
+    __slots__ = ["symbol", "state", "parent", "left", "right", "prev_term", "next_term", "magic_parent", "children", "annotations", "extent"]
     def __init__(self, symbol, state, children):
         self.symbol = symbol
+        self.extent = None
         self.state = state
         self.parent = None
         self.left = None
@@ -164,7 +151,7 @@ class Node(object):
         self.next_term = None
         self.magic_parent = None
         self.set_children(children)
-        self.log = {}
+        self.log = NodeLog()
         self.annotations = []
 
     def add_annotation(self, annotation):
@@ -191,9 +178,10 @@ class Node(object):
 
     def save_ns(self, setchildren=False):
         from treemanager import TreeManager
-        self.log[("ns", TreeManager.version)] = True
+        self.log.mark_changed(TreeManager.version)
 
     def mark_changed(self):
+        self.invalidate_extent()
         node = self
         while True:
             node.save_ns()
@@ -210,6 +198,9 @@ class Node(object):
             node.changed = True
 
     def mark_version(self):
+        # a token's text may have changed, but a subtree only gets a new
+        # parent, and tokens have no extent of their own anyway
+        self.invalidate_ancestor_extents()
         node = self
         while True:
             node.save_ns()
@@ -224,6 +215,8 @@ class Node(object):
 
     def set_children(self, children):
         self.children = children
+        if self.extent is not None:
+            self.invalidate_extent()
         last = None
         for c in children:
             c.parent = self
@@ -236,42 +229,119 @@ class Node(object):
             last.right = None # last child has no right sibling
             #XXX need to save this?
 
-    def save(self, version):
-        self.log[("children", version)] = list(self.children)
-        self.log[("parent", version)] = self.parent
-        self.log[("left", version)] = self.left
-        self.log[("right", version)] = self.right
-        self.log[("next_term", version)] = self.next_term
-        self.log[("prev_term", version)] = self.prev_term
-        self.log[("deleted", version)] = self.deleted
-        self.log[("indent", version)] = self.indent
+    def save(self, version, text=None):
+        # see history.ATTRIBUTES for the layout of the snapshot
+        self.log.save(version, (list(self.children), self.parent, self.left,
+                                self.right, self.next_term, self.prev_term,
+                                self.deleted, self.indent, text))
         self.version = version
 
     def load(self, version):
-        while version >= 0:
-            if ("parent", version) in self.log:
-                self.parent = self.log[("parent", version)]
-                self.children = list(self.log[("children", version)])
-                self.left = self.log[("left", version)]
-                self.right = self.log[("right", version)]
-                self.next_term = self.log[("next_term", version)]
-                self.prev_term = self.log[("prev_term", version)]
-                self.deleted = self.log[("deleted", version)]
-                self.indent = self.log[("indent", version)]
-                self.version = version
+        log = self.log
+        i = log.find(version)
+        if i < 0:
+            return
+        (children, self.parent, self.left, self.right, self.next_term,
+         self.prev_term, self.deleted, self.indent, _) = log.values[i]
+        self.children = list(children)
+        self.version = log.versions[i]
+        self.invalidate_extent()
+
+    def get_extent(self):
+        """Return the number of characters and of line breaks in the text of
+        this subtree, as exported, including the contents of language boxes.
+
+        The extents of nonterminals are cached until something in their
+        subtree changes (see invalidate_extent). A cached nonterminal's
+        ancestors may be stale, but never the other way round, so computing
+        an extent only visits the nonterminals whose cache was invalidated."""
+        if self.extent is not None:
+            return self.extent
+        if isinstance(self.symbol, MagicTerminal):
+            return self.symbol.ast.get_extent()
+        if not self.children:
+            return terminal_extent(self)
+        # post-order without recursion: the trees of long lists are deep
+        stack = [[self, 0, 0, 0]]
+        while True:
+            frame = stack[-1]
+            node, i, chars, lines = frame
+            children = node.children
+            pending = None
+            while i < len(children):
+                child = children[i]
+                if isinstance(child.symbol, MagicTerminal):
+                    child = child.symbol.ast
+                if child.extent is not None:
+                    c, l = child.extent
+                elif child.children:
+                    pending = child
+                    break
+                else:
+                    c, l = terminal_extent(child)
+                chars += c
+                lines += l
+                i += 1
+            if pending is not None:
+                frame[1:] = [i, chars, lines]
+                stack.append([pending, 0, 0, 0])
+                continue
+            node.extent = (chars, lines)
+            stack.pop()
+            if not stack:
+                return node.extent
+
+    def invalidate_extent(self):
+        """Drop the cached extents of this node and of all its ancestors,
+        continuing from language boxes into their parent tree. Stops at the
+        first ancestor without one, whose ancestors have none either."""
+        self.extent = None
+        self.invalidate_ancestor_extents()
+
+    def invalidate_ancestor_extents(self):
+        """Drop the cached extents of the ancestors of this node only, e.g.
+        when it moves to another parent."""
+        node = self
+        while True:
+            parent = node.parent
+            if parent is None:
+                lbox = node.get_magicterminal()
+                if lbox is None or lbox.parent is None:
+                    return
+                parent = lbox.parent
+            if parent.extent is None:
                 return
-            version -= 1
+            parent.extent = None
+            node = parent
+
+    def get_offset(self):
+        """Return the number of characters and of line breaks in the text
+        before this node, counted from the beginning of the outermost tree."""
+        chars = lines = 0
+        node = self
+        while True:
+            parent = node.parent
+            if parent is None:
+                lbox = node.get_magicterminal()
+                if lbox is None or lbox.parent is None:
+                    return chars, lines
+                node = lbox
+                continue
+            for child in parent.children:
+                if child is node:
+                    break
+                c, l = child.get_extent()
+                chars += c
+                lines += l
+            node = parent
 
     def get_attr(self, attr, version):
         if version is None:
             return self.__getattribute__(attr)
-        version = int(version)
-        while version >= 0:
-            try:
-                return self.log[(attr, version)]
-            except KeyError:
-                version -= 1
-        raise AttributeError("Attribute %s for version %s not found." % (attr, version))
+        try:
+            return self.log.get_attr(attr, int(version))
+        except KeyError:
+            raise AttributeError("Attribute %s for version %s not found." % (attr, version))
 
     def remove_child(self, child):
         for i in xrange(len(self.children)):
@@ -438,13 +508,23 @@ class Node(object):
             return other.symbol == self.symbol and other.state == self.state and other.children == self.children
         return False
 
+def terminal_extent(node):
+    """Return the number of characters and of line breaks in the text of a
+    terminal (see Node.get_extent)."""
+    symbol = node.symbol
+    if isinstance(symbol, (Nonterminal, IndentationTerminal)) or isinstance(node, (BOS, EOS)):
+        return (0, 0)
+    if symbol.name == "\r":
+        return (1, 1)
+    return (len(symbol.name), 0)
+
 import string
 lowercase = set(list(string.ascii_lowercase))
 uppercase = set(list(string.ascii_uppercase))
 digits = set(list(string.digits))
 
 class TextNode(Node):
-    __slots__ = ["log", "version", "position", "changed", "deleted", "image", "image_src", "plain_mode", "alternate", "lookahead", "lookup", "parent_lbox", "magic_backpointer", "indent"]
+    __slots__ = ["log", "version", "position", "changed", "deleted", "image", "image_src", "plain_mode", "alternate", "lookahead", "lookup", "symbol_id", "parent_lbox", "magic_backpointer", "indent"]
     def __init__(self, symbol, state=-1, children=[], pos=-1, lookahead=0):
         Node.__init__(self, symbol, state, children)
         self.position = 0
@@ -456,7 +536,7 @@ class TextNode(Node):
         self.alternate = None
         self.lookahead = lookahead
         self.lookup = ""
-        self.log = {}
+        self.symbol_id = None # (syntaxtable, key, id), see IncParser.get_lookup_id
         self.version = 0
         self.indent = None
 
@@ -508,8 +588,7 @@ class TextNode(Node):
         self.mark_version()
 
     def save(self, version):
-        Node.save(self, version)
-        self.log[("symbol.name", version)] = self.symbol.name
+        Node.save(self, version, self.symbol.name)
 
     def load(self, version):
         Node.load(self, version)
@@ -525,17 +604,21 @@ class TextNode(Node):
         if version is None:
             from treemanager import TreeManager
             version = TreeManager.version
-        return self.log.has_key(("ns", version))
+        return self.log.has_changes(version)
 
     def get_text(self, version):
-        while True:
-            try:
-                return self.log[("symbol.name", version)]
-            except KeyError:
-                version -= 1
-                if version == -1:
-                    return None
-                continue
+        snapshot = self.log.get(version)
+        if snapshot is None:
+            return None
+        return snapshot[-1]
+
+    def text_changed(self, version=None):
+        """Return whether the text differs from the one saved in `version`
+        (by default the current version), e.g. because it was edited."""
+        if version is None:
+            from treemanager import TreeManager
+            version = TreeManager.version
+        return self.get_text(version) != self.symbol.name
 
     def insert(self, char, pos):
         l = list(self.symbol.name)
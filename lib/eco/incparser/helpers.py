@@ -21,7 +21,7 @@
 
 from __future__ import print_function
 
-from state import State, StateSet, LR0Element, LR1Element
+from state import State, StateSet, LR0Element, LR1Element, LRItem
 from production import Production
 from grammar_parser.gparser import Terminal, Nonterminal, Epsilon
 from syntaxtable import FinishSymbol
@@ -31,16 +31,90 @@ epsilon = Epsilon()
 def noprint(*args, **kwargs):
     pass
 
+def rule_signature(rule):
+    # annotations are compared by their repr, as not all of them can be
+    # compared with each other
+    return (rule.alternatives, [repr(a) for a in rule.annotations], rule.precs,
+            repr(sorted(rule.inserts.items())))
+
+def changed_rules(old, new):
+    """Return the nonterminals whose rules differ between the grammars `old`
+    and `new`, including added and removed ones."""
+    changed = set()
+    for symbol in set(old) | set(new):
+        if symbol not in old or symbol not in new:
+            changed.add(symbol)
+        elif rule_signature(old[symbol]) != rule_signature(new[symbol]):
+            changed.add(symbol)
+    return changed
+
 class Helper(object):
 
-    def __init__(self, grammar):
+    def __init__(self, grammar, previous=None):
+        """Calculate FIRST sets for `grammar`. If `previous` is the Helper of
+        a build of an earlier version of the grammar, its FIRST sets and
+        closures are reused where the changes to the grammar don't affect
+        them."""
         self.grammar = grammar
-        self.closure_time = 0
         self.first_dict = {}
-        self.follow_dict = {}
-        self.calculate_first()
-        self.calculate_follow()
+        self.follow_dict = None
         self.goto_count = {}
+        # interned items and the items each nonterminal expands to
+        self.items = {}
+        self.expansions = {}
+        # lookahead sets are represented as bitsets over the terminals
+        self.terminal_bits = {}
+        self.terminals = []
+        self.symbol_sets = {}
+        # closures computed by closure_bits, by kernel
+        self.closures = {}
+        self.reusable = {}
+        self.changed = set()
+        self.invalid = set()
+        self.valid = {}
+        self.reused = 0
+        if previous is None:
+            self.calculate_first()
+        else:
+            self.reuse(previous)
+
+    def __getstate__(self):
+        # the memoised closures are only needed to rebuild the graph in the
+        # same process, so they aren't pickled along with it
+        state = self.__dict__.copy()
+        state["closures"] = {}
+        state["reusable"] = {}
+        state["valid"] = {}
+        return state
+
+    def reuse(self, previous):
+        self.changed = changed_rules(previous.grammar, self.grammar)
+        # FIRST(X) can only change if a rule reachable from X changed
+        users = {}
+        for rule in self.grammar.values():
+            for a in rule.alternatives:
+                for symbol in a:
+                    users.setdefault(symbol, set()).add(rule.symbol)
+        affected = set(self.changed)
+        todo = list(self.changed)
+        while todo:
+            for user in users.get(todo.pop(), ()):
+                if user not in affected:
+                    affected.add(user)
+                    todo.append(user)
+        for symbol in previous.first_dict:
+            if symbol not in affected:
+                self.first_dict[symbol] = previous.first_dict[symbol]
+        self.calculate_first()
+        # closures containing items of these symbols have to be recomputed
+        self.invalid = set(self.changed)
+        for symbol in affected:
+            if self.first_dict.get(symbol) != previous.first_dict.get(symbol):
+                self.invalid.add(symbol)
+        # keep the bits of the terminals, so old lookahead sets stay valid
+        self.terminal_bits = dict(previous.terminal_bits)
+        self.terminals = list(previous.terminals)
+        self.reusable = previous.closures
 
 
     def first(self, symbol):
@@ -54,6 +128,10 @@ class Helper(object):
             return set()
 
     def follow(self, symbol):
+        if self.follow_dict is None:
+            # only needed by some of the tests, so calculated on demand
+            self.follow_dict = {}
+            self.calculate_follow()
         if self.follow_dict.__contains__(symbol):
             return self.follow_dict[symbol]
         else:
@@ -169,7 +247,137 @@ class Helper(object):
                 result.add(new_state)
         return self.closure_0(result)
 
+    def item(self, element):
+        """Return the interned LRItem equal to the LR-element `element`."""
+        try:
+            return self.items[element]
+        except KeyError:
+            pass
+        item = LRItem(element.p, element.d)
+        if not isinstance(item.next_symbol(), Nonterminal):
+            item.expand = ()
+        # FIRST(beta) for an item 'X ::= alpha . B beta'
+        for symbol in item.p.right[item.d+1:]:
+            f = self.first(symbol)
+            item.first_bits |= self.bits(f)
+            if epsilon not in f:
+                break
+        else:
+            item.nullable = True
+        self.items[item] = item
+        return item
+
+    def expand(self, symbol):
+        """Return the items 'symbol ::= . a' for all alternatives a of the
+        nonterminal `symbol`."""
+        try:
+            return self.expansions[symbol]
+        except KeyError:
+            pass
+        rule = self.grammar[symbol]
+        result = []
+        for i in range(len(rule.alternatives)):
+            a = rule.alternatives[i]
+            # create epsilon symbol if alternative is empty
+            if a == []:
+                a = [Epsilon()]
+            p = Production(symbol, a, rule.annotations[i], rule.precs[i])
+            if rule.inserts.has_key(i):
+                insert = rule.inserts[i]
+                p.inserts[insert[0]] = insert[1]
+            if a == [epsilon]:
+                result.append(self.item(LR0Element(p, 1)))
+            else:
+                result.append(self.item(LR0Element(p, 0)))
+        self.expansions[symbol] = result
+        return result
+
+    def advance(self, element):
+        """Return the interned item for `element` with its dot moved over the
+        next symbol."""
+        item = self.item(element)
+        if item.advanced is None:
+            item.advanced = self.item(LR0Element(item.p, item.d + 1))
+        return item.advanced
+
+    def bits(self, symbols):
+        """Convert a set of terminals into a bitset (epsilon is ignored)."""
+        result = 0
+        for symbol in symbols:
+            try:
+                result |= self.terminal_bits[symbol]
+            except KeyError:
+                if symbol == epsilon:
+                    continue
+                bit = 1 << len(self.terminals)
+                self.terminal_bits[symbol] = bit
+                self.terminals.append(symbol)
+                result |= bit
+        return result
+
+    def symbols(self, bits):
+        """Convert a bitset back into a (frozen) set of terminals."""
+        try:
+            return self.symbol_sets[bits]
+        except KeyError:
+            pass
+        result = []
+        i = 0
+        rest = bits
+        while rest:
+            if rest & 1:
+                result.append(self.terminals[i])
+            rest >>= 1
+            i += 1
+        result = frozenset(result)
+        self.symbol_sets[bits] = result
+        return result
+
     def closure_1(self, state_set):
+        la_state_set = StateSet()
+        for element in state_set.elements:
+            la_state_set.add(element, self.bits(state_set.get_lookahead(element)))
+        closure = self.closure_bits(la_state_set)
+        final_result = StateSet()
+        for element in closure.elements:
+            final_result.add(element, set(self.symbols(closure.get_lookahead(element))))
+        return final_result
+
+    def closure_bits(self, state_set):
+        """LR(1) closure of `state_set`, whose lookaheads are bitsets (see
+        `bits`). The lookaheads of the result are bitsets as well.
+
+        The result only depends on the kernel, in the order its elements are
+        iterated, and on the rules and FIRST sets of the symbols of the
+        closure's items, so closures of a previous build are reused if none
+        of these changed."""
+        key = tuple([(element, state_set.lookaheads[element]) for element in state_set.elements])
+        closure = self.reusable.get(key)
+        if closure is not None and self.is_valid(closure):
+            self.reused += 1
+        else:
+            closure = self.compute_closure(state_set)
+        self.closures[key] = closure
+        return closure
+
+    def is_valid(self, closure):
+        """Check that a closure of the previous build contains no items of
+        rules that changed or whose FIRST sets are used and changed."""
+        valid = self.valid
+        invalid = self.invalid
+        for element in closure.elements:
+            p = element.p
+            try:
+                if not valid[p]:
+                    return False
+            except KeyError:
+                ok = p.left not in invalid and invalid.isdisjoint(p.right)
+                valid[p] = ok
+                if not ok:
+                    return False
+        return True
+
+    def compute_closure(self, state_set):
         la_dict = {}
         result = set()
         working_set = set()
@@ -179,53 +387,39 @@ class Helper(object):
             result.add(element)
             working_set.add(element)
         # Step 2
-        i=0
         temp = working_set
-        while 1:
+        while temp:
             newelements = set()
             for state in temp:
-                if state.isfinal():
+                item = self.item(state)
+                expand = item.expand
+                if expand is None:
+                    expand = item.expand = self.expand(item.next_symbol())
+                if not expand:
                     continue
-                symbol = state.next_symbol()
-                if isinstance(symbol, Nonterminal):
-                    f = set()
-                    for l in la_dict[state]:
-                        betaL = []
-                        betaL.extend(state.remaining_symbols())
-                        betaL.append(l)
-                        f |= self.first(betaL)
-                    alternatives = self.grammar[symbol].alternatives
-                    i = -1
-                    for a in alternatives:
-                        i = i + 1
-                        # create epsilon symbol if alternative is empty
-                        if a == []:
-                            a = [Epsilon()]
-                        p = Production(symbol, a, self.grammar[symbol].annotations[i], self.grammar[symbol].precs[i])
-                        if self.grammar[symbol].inserts.has_key(i):
-                            insert = self.grammar[symbol].inserts[i]
-                            p.inserts[insert[0]] = insert[1]
-                        s = LR0Element(p, 0)
-                        if a == [epsilon]:
-                            s.d = 1
-                        # NEW ELEMENT:
-                        # 1. completely new (+lookahead): add to result
-                        # 2. new lookahead: update lookahead in la_dict
-                        # -> add to new working set
-                        # 3. already known: ignore
-                        if s in result:
-                            if f.issubset(la_dict[s]):   # lookahead in combination with state already known
-                                continue
-                            else:
-                                la_dict[s] |= f   # new lookahead
-                        else:
-                            la_dict[s] = set(f)        # completely new
-                        result.add(s)
-                        newelements.add(s)
+                # FIRST(beta l) for all lookaheads l
+                f = la_dict[state]
+                if f:
+                    if item.nullable:
+                        f |= item.first_bits
+                    else:
+                        f = item.first_bits
+                for s in expand:
+                    # NEW ELEMENT:
+                    # 1. completely new (+lookahead): add to result
+                    # 2. new lookahead: update lookahead in la_dict
+                    # -> add to new working set
+                    # 3. already known: ignore
+                    if s in result:
+                        la = la_dict[s]
+                        if not f & ~la:   # lookahead in combination with state already known
+                            continue
+                        la_dict[s] = la | f   # new lookahead
+                    else:
+                        la_dict[s] = f        # completely new
+                    result.add(s)
+                    newelements.add(s)
             temp = newelements
-            if len(temp) == 0:
-                break
-            i += 1
         # add lookaheads
         final_result = StateSet()
         for element in result:
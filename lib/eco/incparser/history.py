@@ -0,0 +1,229 @@
+# Copyright (c) 2012--2014 King's College London
+# Created by the Software Development Team <http://soft-dev.org/>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to
+# deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+# sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+
+
+"""Version history of tree nodes.
+
+Undo and redo in Eco work by saving the relevant attributes of every changed
+node after each reparse (see `TreeManager.save`) and restoring them later
+(`TreeManager.recover_version`). Versions are saved in increasing order, so a
+node's history is kept as a sorted array of version numbers plus a parallel
+list of values. Looking up the state of a node at some version is a binary
+search for the latest entry saved at or before that version."""
+
+from array import array
+from bisect import bisect_left, bisect_right
+
+class VersionLog(object):
+    """Maps versions to values. `get` returns the value of the latest version
+    that is smaller than or equal to the requested one."""
+
+    __slots__ = ["versions", "values"]
+
+    def __init__(self):
+        self.versions = array("i")
+        self.values = []
+
+    def set(self, version, value):
+        versions = self.versions
+        if not versions or versions[-1] < version:
+            versions.append(version)
+            self.values.append(value)
+            return
+        i = bisect_left(versions, version)
+        if i < len(versions) and versions[i] == version:
+            self.values[i] = value
+        else:
+            versions.insert(i, version)
+            self.values.insert(i, value)
+
+    def find(self, version):
+        """Return the index of the latest entry saved at or before `version`,
+        or -1 if there is none."""
+        return bisect_right(self.versions, version) - 1
+
+    def get(self, version, default=None):
+        i = self.find(version)
+        if i < 0:
+            return default
+        return self.values[i]
+
+    def has_version(self, version):
+        i = self.find(version)
+        return i >= 0 and self.versions[i] == version
+
+    def max_version(self):
+        if self.versions:
+            return self.versions[-1]
+        return -1
+
+    def delete_from(self, version):
+        """Forget all entries newer than `version`."""
+        i = bisect_right(self.versions, version)
+        del self.versions[i:]
+        del self.values[i:]
+
+    def squash(self, version):
+        """Forget all entries that are only needed to look up versions older
+        than `version` and return their values."""
+        i = self.find(version)
+        if i <= 0:
+            return []
+        dropped = self.values[:i]
+        del self.versions[:i]
+        del self.values[:i]
+        return dropped
+
+    def __len__(self):
+        return len(self.versions)
+
+# Attributes saved by `Node.save`, in the order they are stored in a snapshot
+ATTRIBUTES = ["children", "parent", "left", "right", "next_term", "prev_term",
+              "deleted", "indent", "symbol.name"]
+INDEX = dict((name, i) for i, name in enumerate(ATTRIBUTES))
+
+class NodeLog(VersionLog):
+    """History of a single node. Every saved version stores a snapshot tuple
+    of the node's `ATTRIBUTES`. Additionally, `changes` records the versions
+    in which the node was modified (see `Node.save_ns`), which is used during
+    undo to skip unchanged subtrees."""
+
+    __slots__ = ["changes"]
+
+    def __init__(self):
+        VersionLog.__init__(self)
+        self.changes = array("i")
+
+    def save(self, version, snapshot):
+        values = self.values
+        if values:
+            # share the children list with the previous snapshot if possible
+            children = values[-1][0]
+            new_children = snapshot[0]
+            if len(children) == len(new_children):
+                for a, b in zip(children, new_children):
+                    if a is not b:
+                        break
+                else:
+                    snapshot = (children,) + snapshot[1:]
+        self.set(version, snapshot)
+
+    def get_attr(self, attr, version):
+        snapshot = self.get(version)
+        if snapshot is None:
+            raise KeyError((attr, version))
+        return snapshot[INDEX[attr]]
+
+    def mark_changed(self, version):
+        changes = self.changes
+        if changes and changes[-1] >= version:
+            i = bisect_left(changes, version)
+            if i < len(changes) and changes[i] == version:
+                return
+            changes.insert(i, version)
+        else:
+            changes.append(version)
+
+    def has_changes(self, version):
+        changes = self.changes
+        i = bisect_left(changes, version)
+        return i < len(changes) and changes[i] == version
+
+    def copy_changes(self):
+        return array("i", self.changes)
+
+    def max_version(self):
+        version = VersionLog.max_version(self)
+        if self.changes:
+            return max(version, self.changes[-1])
+        return version
+
+    def delete_from(self, version):
+        VersionLog.delete_from(self, version)
+        del self.changes[bisect_right(self.changes, version):]
+
+    def squash(self, version):
+        del self.changes[:bisect_left(self.changes, version)]
+        return VersionLog.squash(self, version)
+
+    def __getitem__(self, key):
+        # exact lookup of `(attribute, version)`, as used by the debug viewers
+        attr, version = key
+        if attr == "ns":
+            if self.has_changes(version):
+                return True
+            raise KeyError(key)
+        if attr not in INDEX or not self.has_version(version):
+            raise KeyError(key)
+        return self.get(version)[INDEX[attr]]
+
+    def __contains__(self, key):
+        try:
+            self[key]
+            return True
+        except KeyError:
+            return False
+
+class RetentionPolicy(object):
+    """Limits the undo history kept by a `TreeManager`. Versions older than
+    the last `max_versions` versions, older than `max_age` seconds, or beyond
+    `max_bytes` of (estimated) snapshot memory are squashed into a single base
+    version, which becomes the oldest version undo can return to. Limits that
+    are None are not enforced. The policy is checked every `interval`
+    versions, so that the cost of compacting the history is spread over many
+    edits."""
+
+    # Average memory of one node snapshot including its children list,
+    # measured with benchmarks/bench_history.py
+    snapshot_bytes = 320
+
+    def __init__(self, max_versions=None, max_age=None, max_bytes=None, interval=100):
+        assert max_versions is None or max_versions > 0
+        self.max_versions = max_versions
+        self.max_age = max_age
+        self.max_bytes = max_bytes
+        self.interval = interval
+
+    def due(self, version):
+        return version % self.interval == 0
+
+    def base_version(self, current, stats, now):
+        """Return the oldest version to keep. `stats` is a sorted list of
+        `(version, timestamp, snapshots)` for all saved versions up to
+        `current`."""
+        base = 0
+        if self.max_versions is not None:
+            base = max(base, current - self.max_versions + 1)
+        if self.max_age is not None:
+            for version, timestamp, snapshots in stats:
+                if now - timestamp <= self.max_age:
+                    base = max(base, version)
+                    break
+            else:
+                base = current
+        if self.max_bytes is not None:
+            size = 0
+            for version, timestamp, snapshots in reversed(stats):
+                size += snapshots * self.snapshot_bytes
+                if size > self.max_bytes:
+                    base = max(base, version + 1)
+                    break
+        return min(base, current)
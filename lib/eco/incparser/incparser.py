@@ -21,12 +21,7 @@
 
 from __future__ import print_function
 
-try:
-    import cPickle as pickle
-except:
-    import pickle
-
-import time, os
+import time
 
 from grammar_parser.gparser import Parser, Nonterminal, Terminal, Epsilon, IndentationTerminal
 from syntaxtable import SyntaxTable, FinishSymbol, Reduce, Accept, Shift
@@ -34,6 +29,7 @@ from stategraph import StateGraph
 from constants import LR0, LALR
 from astree import AST, TextNode, BOS, EOS
 from ip_plugins.plugin import PluginManager
+from artifactcache import cache, make_key
 
 import logging
 
@@ -62,29 +58,23 @@ class IncParser(object):
             parser = Parser(grammar, whitespaces)
             parser.parse()
 
-            filename = "".join([os.path.dirname(__file__), "/../pickle/", str(hash(grammar) ^ hash(whitespaces)), ".pcl"])
-            try:
-                logging.debug("Try to unpickle former stategraph")
-                f = open(filename, "r")
-                start = time.time()
-                self.graph = pickle.load(f)
-                end = time.time()
-                logging.debug("unpickling done in %s", end-start)
-            except IOError:
-                logging.debug("could not unpickle old graph")
+            def build():
                 logging.debug("Creating Stategraph")
-                self.graph = StateGraph(parser.start_symbol, parser.rules, lr_type)
+                graph = StateGraph(parser.start_symbol, parser.rules, lr_type)
                 logging.debug("Building Stategraph")
-                self.graph.build()
-                logging.debug("Pickling")
-                pickle.dump(self.graph, open(filename, "w"))
+                graph.build()
+                return graph
+            start = time.time()
+            self.graph = cache.get(make_key("stategraph", grammar, whitespaces, lr_type), build)
+            logging.debug("loading stategraph done in %s", time.time() - start)
 
             if lr_type == LALR:
                 self.graph.convert_lalr()
 
             logging.debug("Creating Syntaxtable")
-            self.syntaxtable = SyntaxTable(lr_type)
-            self.syntaxtable.build(self.graph)
+            syntaxtable = SyntaxTable(lr_type)
+            syntaxtable.build(self.graph)
+            self.syntaxtable = syntaxtable.compile()
 
         self.stack = []
         self.ast_stack = []
@@ -97,7 +87,7 @@ class IncParser(object):
         self.whitespaces = whitespaces
         self.status_by_version = {}
         self.errornode_by_version = {}
-        self.indentation_based = False
+        self._indentation_based = False
 
         self.pm = PluginManager()
         self.pm.loadplugins(self)
@@ -106,23 +96,35 @@ class IncParser(object):
         self.previous_version = None
         logging.debug("Incremental parser done")
 
-    def from_dict(self, rules, startsymbol, lr_type, whitespaces, pickle_id, precedences):
+    @property
+    def indentation_based(self):
+        return self._indentation_based
+
+    @indentation_based.setter
+    def indentation_based(self, value):
+        self._indentation_based = value
+        self.pm.resolve() # enables or disables the indentation plugin
+
+    def from_dict(self, rules, startsymbol, lr_type, whitespaces, pickle_id, precedences, syntaxtable=None, previous=None):
+        # `previous` can be the graph built for an earlier version of the
+        # grammar, whose unaffected states are then reused
         self.graph = None
-        self.syntaxtable = None
-        if pickle_id:
-            filename = "".join([os.path.dirname(__file__), "/../pickle/", str(pickle_id ^ hash(whitespaces)), ".pcl"])
-            try:
-                f = open(filename, "r")
-                self.syntaxtable = pickle.load(f)
-            except IOError:
-                pass
+        # compiled tables are never modified, so parsers can share them
+        self.syntaxtable = syntaxtable
         if self.syntaxtable is None:
-            self.graph = StateGraph(startsymbol, rules, lr_type)
-            self.graph.build()
-            self.syntaxtable = SyntaxTable(lr_type)
-            self.syntaxtable.build(self.graph, precedences)
+            def build():
+                self.graph = StateGraph(startsymbol, rules, lr_type, previous)
+                self.graph.build()
+                if lr_type == LALR:
+                    self.graph.convert_lalr()
+                syntaxtable = SyntaxTable(lr_type)
+                syntaxtable.build(self.graph, precedences)
+                return syntaxtable.compile()
             if pickle_id:
-                pickle.dump(self.syntaxtable, open(filename, "w"))
+                key = make_key("syntaxtable", pickle_id, whitespaces, lr_type)
+                self.syntaxtable = cache.get(key, build)
+            else:
+                self.syntaxtable = build()
 
         self.whitespaces = whitespaces
         self.pm.do_incparse_from_dict(rules)
@@ -166,8 +168,8 @@ class IncParser(object):
                 if la.changed:
                     assert False # with prelexing you should never end up here!
                 else:
-                    lookup_symbol = self.get_lookup(la)
-                    result = self.parse_terminal(la, lookup_symbol)
+                    lookup_id = self.get_lookup_id(la)
+                    result = self.parse_terminal(la, lookup_id)
                     if result == "Accept":
                         self.last_status = True
                         return True
@@ -184,7 +186,7 @@ class IncParser(object):
                     la = self.left_breakdown(la)
                 else:
                     if USE_OPT:
-                        goto = self.syntaxtable.lookup(self.current_state, la.symbol)
+                        goto = self.syntaxtable.lookup_id(self.current_state, self.get_symbol_id(la))
                         if goto: # can we shift this Nonterminal in the current state?
                             logging.debug("OPTShift: %s in state %s -> %s", la.symbol, self.current_state, goto)
                             self.pm.do_incparse_optshift(la)
@@ -200,8 +202,8 @@ class IncParser(object):
                             #XXX can be made faster by providing more information in syntax tables
                             first_term = la.find_first_terminal()
 
-                            lookup_symbol = self.get_lookup(first_term)
-                            element = self.syntaxtable.lookup(self.current_state, lookup_symbol)
+                            lookup_id = self.get_lookup_id(first_term)
+                            element = self.syntaxtable.lookup_id(self.current_state, lookup_id)
                             if isinstance(element, Reduce):
                                 self.reduce(element)
                             else:
@@ -224,21 +226,22 @@ class IncParser(object):
                             la = self.left_breakdown(la)
         logging.debug("============ INCREMENTAL PARSE END ================= ")
 
-    def parse_terminal(self, la, lookup_symbol):
+    def parse_terminal(self, la, lookup_id):
         element = None
         if isinstance(la, EOS):
-            element = self.syntaxtable.lookup(self.current_state, Terminal("<eos>"))
+            element = self.syntaxtable.lookup_id(self.current_state, self.syntaxtable.eos_id)
             if isinstance(element, Shift):
                 self.current_state = element.action
                 return la
         if element is None:
-            element = self.syntaxtable.lookup(self.current_state, lookup_symbol)
-        logging.debug("\x1b[34mparse_terminal\x1b[0m: %s in %s -> %s", lookup_symbol, self.current_state, element)
+            element = self.syntaxtable.lookup_id(self.current_state, lookup_id)
+        logging.debug("\x1b[34mparse_terminal\x1b[0m: %s in %s -> %s", la, self.current_state, element)
         if isinstance(element, Accept):
             #XXX change parse so that stack is [bos, startsymbol, eos]
             bos = self.previous_version.parent.children[0]
             eos = self.previous_version.parent.children[-1]
             self.previous_version.parent.set_children([bos, self.stack[1], eos])
+            self.undo = [] # only needed to recover from errors
             logging.debug("loopcount: %s", self.loopcount)
             logging.debug ("\x1b[32mAccept\x1b[0m")
             return "Accept"
@@ -250,7 +253,7 @@ class IncParser(object):
         elif isinstance(element, Reduce):
             logging.debug("\x1b[33mReduce\x1b[0m: %s -> %s", la, element)
             self.reduce(element)
-            return self.parse_terminal(la, lookup_symbol)
+            return self.parse_terminal(la, lookup_id)
         elif element is None:
             if self.validating:
                 logging.debug("Was validating: Right breakdown and return to normal")
@@ -271,6 +274,27 @@ class IncParser(object):
             lookup_symbol = Terminal(lookup_symbol.name)
         return lookup_symbol
 
+    def get_lookup_id(self, la):
+        """Like `get_lookup`, but return the id of the symbol in the compiled
+        syntax table. Ids of lexed terminals are cached on the node, so that
+        reparsing unchanged nodes doesn't need to hash any symbols."""
+        cached = la.symbol_id
+        if cached is not None and cached[0] is self.syntaxtable and cached[1] is la.lookup:
+            return cached[2]
+        symbol_id = self.syntaxtable.symbol_id(self.get_lookup(la))
+        if la.lookup != "":
+            la.symbol_id = (self.syntaxtable, la.lookup, symbol_id)
+        return symbol_id
+
+    def get_symbol_id(self, node):
+        """Return the id of a nonterminal node's symbol (cached on the node)."""
+        cached = node.symbol_id
+        if cached is not None and cached[0] is self.syntaxtable and cached[1] is node.symbol:
+            return cached[2]
+        symbol_id = self.syntaxtable.symbol_id(node.symbol)
+        node.symbol_id = (self.syntaxtable, node.symbol, symbol_id)
+        return symbol_id
+
     def do_undo(self, la):
         while len(self.undo) > 0:
             node, attribute, value = self.undo.pop(-1)
@@ -299,7 +323,7 @@ class IncParser(object):
         self.current_state = self.stack[-1].state #XXX don't store on nodes, but on stack
         logging.debug("   Reduce: set state to %s (%s)", self.current_state, self.stack[-1].symbol)
 
-        goto = self.syntaxtable.lookup(self.current_state, element.action.left)
+        goto = self.syntaxtable.lookup_id(self.current_state, element.left_id)
         if goto is None:
             raise Exception("Reduction error on %s in state %s: goto is None" % (element, self.current_state))
         assert goto != None
@@ -309,7 +333,7 @@ class IncParser(object):
             self.undo.append((c, 'parent', c.parent))
             self.undo.append((c, 'left', c.left))
             self.undo.append((c, 'right', c.right))
-            self.undo.append((c, 'log', c.log.copy()))
+            self.undo.append((c.log, 'changes', c.log.copy_changes()))
             c.mark_version() # XXX with node reuse we only have to do this if the parent changes
 
         new_node = Node(element.action.left.copy(), goto.action, children)
@@ -397,8 +421,7 @@ class IncParser(object):
 
     def shift(self, la, element=None, rb=False):
         if not element:
-            lookup_symbol = self.get_lookup(la)
-            element = self.syntaxtable.lookup(self.current_state, lookup_symbol)
+            element = self.syntaxtable.lookup_id(self.current_state, self.get_lookup_id(la))
         logging.debug("\x1b[32m" + "%sShift(%s)" + "\x1b[0m" + ": %s -> %s", "rb" if rb else "", self.current_state, la, element)
         la.state = element.action
         self.stack.append(la)
@@ -442,11 +465,7 @@ class IncParser(object):
         return AST(root)
 
     def get_next_possible_symbols(self, state_id):
-        l = set()
-        for (state, symbol) in self.syntaxtable.table.keys():
-            if state == state_id:
-                l.add(symbol)
-        return l
+        return set(self.syntaxtable.get_symbols(state_id))
 
     def get_next_symbols_list(self, state = -1):
         if state == -1:
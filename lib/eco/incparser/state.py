@@ -19,13 +19,10 @@
 # FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
 # IN THE SOFTWARE.
 
-from time import time
 from grammar_parser.gparser import Nonterminal
 
 class StateSet(object):
 
-    _hashtime = 0
-
     def __init__(self, elements=None):
         if elements:
             self.elements = elements
@@ -124,12 +121,9 @@ class StateSet(object):
             print(str(e), self.lookaheads[e])
 
     def __hash__(self):
-        start = time()
         _hash = 0
         for element in self.elements:
             _hash ^= hash(element)
-        end = time()
-        StateSet._hashtime += end-start
         return _hash
 
 class State(object):
@@ -219,6 +213,25 @@ class LR0Element(State):
     def __hash__(self):
         return hash(self.p) ^ hash(self.d)
 
+class LRItem(LR0Element):
+    """An interned LR(0) item, as created by Helper.item. It is equal to the
+    LR0Element with the same production and position, and caches what the
+    closure needs to know about it."""
+
+    def __init__(self, production, pos):
+        LR0Element.__init__(self, production, pos)
+        self._hash = hash(production) ^ hash(pos)
+        self.expand = None      # items added to the closure for the next symbol
+        self.first_bits = 0     # FIRST of the symbols after the next symbol
+        self.nullable = False   # whether these symbols can derive epsilon
+        self.advanced = None    # this item with the dot moved one symbol on
+
+    def __eq__(self, other):
+        return self is other or (self.p == other.p and self.d == other.d)
+
+    def __hash__(self):
+        return self._hash
+
 class LR1Element(State):
 
     def __init__(self, production, pos, lookahead=None):
@@ -31,112 +31,108 @@ import logging
 
 class StateGraph(object):
 
-    def __init__(self, start_symbol, grammar, lr_type=0):
+    def __init__(self, start_symbol, grammar, lr_type=0, previous=None):
+        """Create the state graph for `grammar`. `previous` can be the graph
+        of an earlier version of the grammar, whose states are reused where
+        they aren't affected by the changes (see Helper.closure_bits)."""
         self.grammar = grammar
         self.start_symbol = start_symbol
+        self.lr_type = lr_type
         self.state_sets = []
         self.edges = {}
         self.ids = {}
         self.todo = []
         self.done = set()
         self.maybe_compatible = {}
+        self.core_hashes = []
+        # the last closure computed for each state
+        self.closures = {}
 
-        self.goto_time = 0
-        self.add_time = 0
-        self.closure_time = 0
         self.closure_count = 0
-        self.addcount = 0
-        self.weakly = 0
         self.weakly_count = 0
-        self.mergetime = 0
 
-        helper = Helper(grammar)
+        if previous is not None:
+            helper = Helper(grammar, previous.helper)
+        else:
+            helper = Helper(grammar)
         self.helper = helper
         if lr_type == LR0:
             self.closure = helper.closure_0
             self.goto = helper.goto_0
             self.start_set = StateSet([LR0Element(Production(None, [self.start_symbol]), 0)])
         elif lr_type == LR1 or lr_type == LALR:
-            self.closure = helper.closure_1
+            # while building, lookaheads are bitsets (see Helper.bits)
+            self.closure = helper.closure_bits
             self.goto = helper.goto_1
             self.start_set = StateSet()
-            self.start_set.add(LR0Element(Production(None, [self.start_symbol]), 0), set([FinishSymbol()]))
+            self.start_set.add(helper.item(LR0Element(Production(None, [self.start_symbol]), 0)), helper.bits([FinishSymbol()]))
 
     def build(self):
-        State._hashtime = 0
         start = time()
         start_set = self.start_set
         closure = start_set
         self.state_sets.append(closure)
+        self.core_hashes.append(hash(closure))
         self.ids[closure] = 0
         _id = 0
         self.todo.append(_id)
+        advance = self.helper.advance
         while self.todo:
-            self.addcount += 1
             _id = self.todo.pop()
             self.done.add(_id)
-            closure_start = time()
             state_set = self.closure(self.state_sets[_id])
+            self.closures[_id] = state_set
             self.closure_count += 1
-            closure_end = time()
-            self.closure_time += closure_end - closure_start
             new_gotos = {}
-            goto_start = time()
             # create new sets first, then calculate closure
             for lrelement in state_set.elements:
                 symbol = lrelement.next_symbol()
                 if not symbol: # state is final
                     continue
-                #XXX optimisation: create all configurations before building
-                new_element = lrelement.clone()
-                new_element.d += 1
+                new_element = advance(lrelement)
                 new_element_la = state_set.get_lookahead(lrelement)
                 stateset = new_gotos.setdefault(symbol, StateSet())
                 stateset.add(new_element, new_element_la)
 
             # now calculate closure and add result to state_sets
-            goto_end = time()
-            self.goto_time += goto_end - goto_start
-
             for ss in new_gotos:
-                new_state_set = new_gotos[ss]
-                add_start = time()
-                self.add(_id, ss, new_state_set)
-                add_end = time()
-                self.add_time += add_end - add_start
+                self.add(_id, ss, new_gotos[ss])
 
-        end = time()
-        logging.info("add time %s", self.add_time)
-        logging.info("closure time %s", self.closure_time)
-        logging.info("closure time helper %s", self.helper.closure_time)
-        logging.info("goto time %s", self.goto_time)
-        logging.info("hashtime %s", StateSet._hashtime)
-        logging.info("addcount %s", self.addcount)
+        logging.info("closures %s (%s reused)", self.closure_count, self.helper.reused)
         logging.info("states %s", len(self.state_sets))
-        logging.info("weakly %s", self.weakly)
         logging.info("weakly count %s", self.weakly_count)
-        logging.info("mergetime %s", self.mergetime)
 
-        # apply closure
-        logging.info("Apply closure to states")
-        clstart = time()
+        # Replace the states by their closures. A state's lookaheads haven't
+        # changed since its last closure was computed (otherwise it would have
+        # been put back on the todo list), so that closure can be reused.
         new_state_sets = []
         new_ids = {}
-        for state in self.state_sets:
-            _id = self.ids[state]
-            new_state = self.closure(state)
+        for _id in range(len(self.state_sets)):
+            new_state = self.closures[_id]
+            if self.lr_type != LR0:
+                new_state = self.convert_lookaheads(new_state)
             new_state_sets.append(new_state)
             new_ids[new_state] = new_state
         self.state_sets = new_state_sets
-        logging.info("after closure %s", len(new_state_sets))
-        logging.info("edges %s", len(set(self.edges.values())))
         self.ids = new_ids
-        logging.info(time() - clstart)
+        self.closures = {}
+        self.helper.reusable = {}
+        logging.info("edges %s", len(set(self.edges.values())))
 
-        logging.info("Finished building Stategraph in %s", end-start)
+        logging.info("Finished building Stategraph in %s", time()-start)
         self.closure = None
         self.goto = None
 
+    def convert_lookaheads(self, state_set):
+        """Return a copy of `state_set` with its lookahead bitsets converted
+        to sets of terminals. The bitsets are kept, as the closure may be
+        reused by a later build."""
+        symbols = self.helper.symbols
+        result = StateSet(state_set.elements)
+        for element, la in state_set.lookaheads.iteritems():
+            result.lookaheads[element] = symbols(la)
+        return result
+
     def weakly_compatible(self, s1, s2):
         self.weakly_count += 1
         core = s1.elements
@@ -144,18 +140,24 @@ class StateGraph(object):
             return False
         if len(core) == 1:
             return True
-        self.weakly -= time()
-        core = list(core)
-        for i in range(0, len(core)-1):
-            I = core[i]
-            for j in range(i+1, len(core)):
-                J = core[j]
-                if ((s1.lookaheads[I] & s2.lookaheads[J] or s1.lookaheads[J] & s2.lookaheads[I])
-                    and not s1.lookaheads[I] & s1.lookaheads[J]
-                    and not s2.lookaheads[I] & s2.lookaheads[J]):
-                    self.weakly += time()
+        l1 = s1.lookaheads
+        l2 = s2.lookaheads
+        for element in core:
+            if l1[element] & ~l2[element]:
+                break
+        else:
+            # if every lookahead of s1 is already contained in s2, a conflict
+            # between I and J in s1 would be one in s2 as well
+            return True
+        las = [(l1[element], l2[element]) for element in core]
+        for i in range(0, len(las)-1):
+            l1I, l2I = las[i]
+            for j in range(i+1, len(las)):
+                l1J, l2J = las[j]
+                if ((l1I & l2J or l1J & l2I)
+                    and not l1I & l1J
+                    and not l2I & l2J):
                     return False
-        self.weakly += time()
         return True
 
     def find_stateset_without_lookahead(self, state_set):
@@ -165,23 +167,22 @@ class StateGraph(object):
         return None
 
     def merge_lookahead(self, old, new):
-        self.mergetime -= time()
         changed = False
         for element in new.elements:
             la1 = new.get_lookahead(element)
             la2 = old.get_lookahead(element)
-            if la1 - la2:
+            if la1 & ~la2:
                 changed = True
-                new_la = la2 | la1
-                old.lookaheads[element] = new_la
-
-        self.mergetime += time()
+                old.lookaheads[element] = la2 | la1
         return changed
 
     def add(self, from_id, symbol, state_set):
         merged = False
+        core_hash = hash(state_set)
         #for candidate in self.state_sets: # only check states that can be reached by symbol
         for _id in self.maybe_compatible.setdefault(symbol,set()):
+            if self.core_hashes[_id] != core_hash:
+                continue # different core
             candidate = self.state_sets[_id]
             if self.weakly_compatible(state_set, candidate):
                 # merge them
@@ -199,6 +200,7 @@ class StateGraph(object):
             _id = len(self.state_sets)-1
             self.edges[(from_id, symbol)] = _id
             self.ids[state_set] = _id
+            self.core_hashes.append(core_hash)
             self.todo.append(_id)
 
             # add to maybe compatible
@@ -220,17 +222,13 @@ class StateGraph(object):
        #self.edges[(from_id, symbol)] = _id
 
         # normal LR(1) way
-        add_start = time()
         _id = self.ids.get(state_set)
         if _id is None: # new state
-            self.addcount += 1
             self.state_sets.append(state_set)
             _id = len(self.state_sets)-1
             self.ids[state_set] = _id
             self.todo.append(_id)
         self.edges[(from_id, symbol)] = _id
-        add_end = time()
-        self.add_time += add_end - add_start
 
     def follow(self, from_id, symbol):
         try:
@@ -249,32 +247,36 @@ class StateGraph(object):
         return self.state_sets[i]
 
     def convert_lalr(self):
-        removelist = set([])
-        l = len(self.state_sets)
-        for i in range(l):
-            if i in removelist:
-                continue
-            for j in range(l):
-                if j in removelist:
-                    continue
-                s1 = self.state_sets[i]
-                s2 = self.state_sets[j]
-                if s1 is not s2 and s1.equals(s2, False):
-                    for e in s2:
-                        s1.add(e) # this should automatically merge the lookahead of the states
-                    s1.merge()
-                    for key in self.edges:
-                        fromid, symbol = key
-                        to = self.edges[key]
-                        if fromid == j:
-                            fromid == i
-                        if to == j:
-                            to == i
-                        self.edges.pop(key)
-                        self.edges[(fromid, symbol)] = to
-                    removelist.add(j)
-        l = list(removelist)
-        l.sort()
-        l.reverse()
-        for j in l:
-            self.state_sets.pop(j)
+        """Turn the LR(1) graph into an LALR(1) graph, by merging all states
+        with the same core, i.e. the same items regardless of their
+        lookaheads. The lookaheads of merged items are united. States are
+        renumbered in the order of their first occurrence, so the start
+        state keeps id 0."""
+        cores = {}      # core -> new id
+        new_ids = []    # old id -> new id
+        state_sets = []
+        for state_set in self.state_sets:
+            core = frozenset(state_set.elements)
+            _id = cores.get(core)
+            if _id is None:
+                _id = cores[core] = len(state_sets)
+                merged = StateSet(state_set.elements)
+                for element in state_set.elements:
+                    merged.lookaheads[element] = set(state_set.lookaheads[element])
+                state_sets.append(merged)
+            else:
+                merged = state_sets[_id]
+                for element in state_set.elements:
+                    merged.lookaheads[element] |= state_set.lookaheads[element]
+            new_ids.append(_id)
+
+        # states with the same core have transitions to states with the same
+        # core, so merging never maps an edge to two different states
+        edges = {}
+        for (from_id, symbol), to in self.edges.iteritems():
+            edges[(new_ids[from_id], symbol)] = new_ids[to]
+
+        logging.info("LALR: merged %s states into %s", len(self.state_sets), len(state_sets))
+        self.state_sets = state_sets
+        self.edges = edges
+        self.ids = dict((state_set, state_set) for state_set in state_sets)
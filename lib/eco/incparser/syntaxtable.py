@@ -19,6 +19,7 @@
 # FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
 # IN THE SOFTWARE.
 
+from array import array
 from production import Production
 from grammar_parser.gparser import Terminal, Nonterminal, Epsilon
 from constants import LR0, LR1, LALR
@@ -73,9 +74,15 @@ class SyntaxTable(object):
         self.lr_type = lr_type
 
     def build(self, graph, precedences=[]):
+        table = self.table
         start_production = Production(None, [graph.start_symbol])
         symbols = graph.get_symbols()
         symbols.add(FinishSymbol())
+        # outgoing edges of every state, in the order of `symbols`
+        order = dict((s, n) for n, s in enumerate(symbols))
+        edges = {}
+        for (i, s), dest in graph.edges.iteritems():
+            edges.setdefault(i, []).append((order[s], s, dest))
         for i in range(len(graph.state_sets)):
             # accept, reduce
             state_set = graph.get_state_set(i)
@@ -89,17 +96,17 @@ class SyntaxTable(object):
                         else:
                             lookahead = symbols
                         for s in lookahead:
+                            key = (i, s)
                             newaction = Reduce(state.p)
-                            if self.table.has_key((i,s)):
-                                oldaction = self.table[(i,s)]
+                            oldaction = table.get(key)
+                            if oldaction is not None:
                                 newaction = self.resolve_conflict(i, s, oldaction, newaction, precedences)
                             if newaction:
-                                self.table[(i, s)] = newaction
+                                table[key] = newaction
                             else:
-                                del self.table[(i,s)]
+                                del table[key]
             # shift, goto
-            for s in symbols:
-                dest = graph.follow(i, s)
+            for _, s, dest in sorted(edges.get(i, ())):
                 if dest:
                     if isinstance(s, Terminal):
                         action = Shift(dest)
@@ -196,3 +203,138 @@ class SyntaxTable(object):
             return self.table[(state_id, symbol)]
         except KeyError:
             return None
+
+    def compile(self):
+        return CompactSyntaxTable(self)
+
+class CompactSyntaxTable(object):
+    """Read-only, compiled form of a `SyntaxTable`, used by the incremental
+    parser.
+
+    Every symbol is interned to an integer id. The actions of all states are
+    stored in three arrays using row displacement: the action for `symbol_id`
+    in `state` lives at index `base[state] + symbol_id` of `value`, if
+    `check` at that index equals the state's row id. States with identical
+    rows share a row id. `value` holds indices into `actions`, where 0 means
+    error.
+
+    `lookup` accepts symbols like `SyntaxTable.lookup`. Hot paths resolve the
+    symbol id once (`symbol_id`, `terminal_id`) and then use `lookup_id`. The
+    original dict can be recreated with the `table` property."""
+
+    def __init__(self, syntaxtable):
+        self.lr_type = syntaxtable.lr_type
+
+        symbols = set()
+        for (state, symbol) in syntaxtable.table.iterkeys():
+            symbols.add(symbol)
+        self.symbols = sorted(symbols, key=lambda s: (s.__class__.__name__, s.name))
+        self.ids = {}
+        self.terminals = {}
+        for i, symbol in enumerate(self.symbols):
+            self.ids[symbol] = i
+            if isinstance(symbol, Terminal):
+                self.terminals[symbol.name] = i
+        self.eos_id = self.terminal_id("<eos>")
+
+        self.actions = [None]
+        action_ids = {}
+        rows = {}
+        for (state, symbol), action in syntaxtable.table.iteritems():
+            key = (action.__class__, action.action)
+            if key not in action_ids:
+                action_ids[key] = len(self.actions)
+                self.actions.append(action)
+                if isinstance(action, Reduce):
+                    action.left_id = self.ids.get(action.action.left, -1)
+            rows.setdefault(state, {})[self.ids[symbol]] = action_ids[key]
+
+        num_states = max(rows) + 1 if rows else 0
+        self.base = array("i", [0] * num_states)
+        self.rowid = array("i", [-1] * num_states)
+        self.pack(rows)
+
+    def pack(self, rows):
+        # First fit, starting with the fullest rows. Free slots are tracked as
+        # bits of a (long) integer, so that all possible offsets for a row can
+        # be tested at once: bit `b` of `fits` is set if every column `c` of
+        # the row finds slot `b + c` free.
+        padding = len(self.symbols)
+        check = []
+        value = []
+        free = (1 << padding) - 1 # slots past the end are always free
+        packed = {}
+        for state in sorted(rows, key=lambda s: (-len(rows[s]), s)):
+            row = sorted(rows[state].iteritems())
+            key = tuple(row)
+            if key in packed:
+                self.rowid[state], self.base[state] = packed[key]
+                continue
+            fits = -1
+            for sid, _ in row:
+                fits &= free >> sid
+            base = (fits & -fits).bit_length() - 1
+            end = base + row[-1][0] + 1
+            if end > len(check):
+                free |= ((1 << (end - len(check))) - 1) << (len(check) + padding)
+                check.extend([-1] * (end - len(check)))
+                value.extend([0] * (end - len(value)))
+            rowid = len(packed)
+            for sid, aid in row:
+                check[base + sid] = rowid
+                value[base + sid] = aid
+                free &= ~(1 << (base + sid))
+            packed[key] = (rowid, base)
+            self.rowid[state] = rowid
+            self.base[state] = base
+        # pad, so that base + symbol_id never runs past the end
+        self.check = array("i", check + [-1] * padding)
+        self.value = array("i", value + [0] * padding)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        for name in ["base", "rowid", "check", "value"]:
+            state[name] = state[name].tostring()
+        return state
+
+    def __setstate__(self, state):
+        for name in ["base", "rowid", "check", "value"]:
+            a = array("i")
+            a.fromstring(state[name])
+            state[name] = a
+        self.__dict__.update(state)
+
+    def symbol_id(self, symbol):
+        return self.ids.get(symbol, -1)
+
+    def terminal_id(self, name):
+        return self.terminals.get(name, -1)
+
+    def lookup_id(self, state_id, symbol_id):
+        if state_id < 0 or symbol_id < 0:
+            return None
+        try:
+            i = self.base[state_id] + symbol_id
+            if self.check[i] == self.rowid[state_id]:
+                return self.actions[self.value[i]]
+        except IndexError:
+            pass
+        return None
+
+    def lookup(self, state_id, symbol):
+        return self.lookup_id(state_id, self.ids.get(symbol, -1))
+
+    def get_symbols(self, state_id):
+        """Return all symbols that have an action in the given state."""
+        return [symbol for i, symbol in enumerate(self.symbols)
+                if self.lookup_id(state_id, i) is not None]
+
+    @property
+    def table(self):
+        table = {}
+        for state in range(len(self.base)):
+            for i, symbol in enumerate(self.symbols):
+                action = self.lookup_id(state, i)
+                if action is not None:
+                    table[(state, symbol)] = action
+        return table
@@ -172,6 +172,25 @@ def test_closure_1():
     assert LR1Element(Production(D, [d]), 0, set([a])) in closure
     assert LR1Element(Production(D, [epsilon]), 1, set([a])) in closure
 
+def test_lookahead_bits():
+    bits = helper1.bits(set([a, finish, epsilon]))
+    assert helper1.bits([finish]) & bits
+    assert not helper1.bits([c]) & bits
+    assert helper1.symbols(bits) == set([a, finish])
+    assert helper1.symbols(0) == set()
+
+def test_interned_items():
+    element = LR1Element(Production(S, [S, b]), 0, set([finish]))
+    item = helper1.item(element)
+    assert item == element
+    assert hash(item) == hash(element)
+    assert helper1.item(LR1Element(Production(S, [S, b]), 0)) is item
+    assert helper1.advance(item) == State(Production(S, [S, b]), 1)
+    assert helper1.advance(element) is helper1.advance(item)
+    # FIRST of the symbols after the next one
+    assert helper1.symbols(item.first_bits) == set([b])
+    assert not item.nullable
+
 def test_goto_1():
     lre = LR1Element(Production(Z, [S]), 0, set([finish]))
     clone = lre.clone()
@@ -0,0 +1,111 @@
+# Copyright (c) 2012--2014 King's College London
+# Created by the Software Development Team <http://soft-dev.org/>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to
+# deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+# sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+
+
+from incparser.history import VersionLog, NodeLog
+
+def test_versionlog():
+    log = VersionLog()
+    assert log.get(5) is None
+    log.set(1, "a")
+    log.set(3, "b")
+    log.set(7, "c")
+    assert log.get(0) is None
+    assert log.get(1) == "a"
+    assert log.get(2) == "a"
+    assert log.get(6) == "b"
+    assert log.get(100) == "c"
+    assert log.has_version(3)
+    assert not log.has_version(4)
+    log.set(3, "B")
+    log.set(5, "d")
+    assert list(log.versions) == [1, 3, 5, 7]
+    assert log.get(4) == "B"
+    assert log.max_version() == 7
+    log.delete_from(4)
+    assert list(log.versions) == [1, 3]
+    assert log.get(100) == "B"
+    assert len(log) == 2
+
+def snapshot(children, text):
+    return (children, None, None, None, None, None, False, None, text)
+
+def test_nodelog():
+    log = NodeLog()
+    children = [object(), object()]
+    log.save(1, snapshot(list(children), "a"))
+    log.save(2, snapshot(list(children), "b"))
+    # unchanged children lists are shared between versions
+    assert log.values[0][0] is log.values[1][0]
+    log.save(4, snapshot([children[0]], "c"))
+    assert log.get_attr("symbol.name", 3) == "b"
+    assert log.get_attr("children", 5) == [children[0]]
+    assert log[("symbol.name", 2)] == "b"
+    assert ("symbol.name", 3) not in log
+    try:
+        log.get_attr("children", 0)
+    except KeyError:
+        pass
+    else:
+        assert False
+
+def test_nodelog_changes():
+    log = NodeLog()
+    log.mark_changed(3)
+    log.mark_changed(3)
+    log.mark_changed(5)
+    log.mark_changed(1)
+    assert list(log.changes) == [1, 3, 5]
+    assert log.has_changes(3)
+    assert not log.has_changes(4)
+    assert ("ns", 5) in log
+    log.save(2, snapshot([], "x"))
+    assert log.max_version() == 5
+    log.delete_from(2)
+    assert list(log.changes) == [1]
+    assert log.max_version() == 2
+
+def test_squash():
+    log = NodeLog()
+    for version in [1, 3, 5, 7]:
+        log.save(version, snapshot([], str(version)))
+        log.mark_changed(version)
+    assert log.squash(4) == [snapshot([], "1")]
+    assert list(log.versions) == [3, 5, 7]
+    assert list(log.changes) == [5, 7]
+    assert log.get_attr("symbol.name", 4) == "3"
+    assert log.squash(3) == []
+    assert log.squash(100) == [snapshot([], "3"), snapshot([], "5")]
+    assert list(log.versions) == [7]
+
+def test_retention_policy():
+    from incparser.history import RetentionPolicy
+    stats = [(v, 100.0 + v, 10) for v in range(1, 21)]
+    assert RetentionPolicy().base_version(20, stats, 200.0) == 0
+    assert RetentionPolicy(max_versions=5).base_version(20, stats, 200.0) == 16
+    assert RetentionPolicy(max_age=5).base_version(20, stats, 120.0) == 15
+    assert RetentionPolicy(max_age=5).base_version(20, stats, 1000.0) == 20
+    size = RetentionPolicy.snapshot_bytes * 10
+    assert RetentionPolicy(max_bytes=size * 3).base_version(20, stats, 200.0) == 18
+    assert RetentionPolicy(max_versions=5, max_age=2).base_version(20, stats, 120.0) == 18
+    assert RetentionPolicy(max_versions=50).base_version(20, stats, 200.0) == 0
+    assert RetentionPolicy(interval=10).due(20)
+    assert not RetentionPolicy(interval=10).due(21)
@@ -44,111 +44,59 @@ S = Nonterminal("S")
 A = Nonterminal("A")
 f = FinishSymbol()
 
+def cores(graph):
+    return [frozenset(state_set.elements) for state_set in graph.state_sets]
+
 def test_graph():
-    pytest.skip("conversion is not working yet")
     graph = StateGraph(p.start_symbol, p.rules, 1)
     graph.build()
-
-    s0 = StateSet([
-        LR1Element(Production(None, [S]), 0, set([f])),
-        LR1Element(Production(S, [b, A, c]), 0, set([f])),
-    ])
-
-    s1 = StateSet([
-        LR1Element(Production(S, [b, A, c]), 1, set([f])),
-        LR1Element(Production(A, [S]), 0, set([c])),
-        LR1Element(Production(A, [a]), 0, set([c])),
-        LR1Element(Production(S, [b, A, c]), 0, set([c])),
-    ])
-
-    s2 = StateSet([
-        LR1Element(Production(S, [b, A, c]), 1, set([c])),
-        LR1Element(Production(A, [S]), 0, set([c])),
-        LR1Element(Production(A, [a]), 0, set([c])),
-        LR1Element(Production(S, [b, A, c]), 0, set([c])),
-    ])
-
-    s3 = StateSet([
-        LR1Element(Production(A, [a]), 1, set([c])),
-    ])
-
-    s4 = StateSet([
-        LR1Element(Production(None, [S]), 1, set([f])),
-    ])
-
-    s5 = StateSet([
-        LR1Element(Production(S, [b, A, c]), 2, set([f])),
-    ])
-
-    s6 = StateSet([
-        LR1Element(Production(S, [b, A, c]), 2, set([c])),
-    ])
-
-    s7 = StateSet([
-        LR1Element(Production(A, [S]), 1, set([c])),
-    ])
-
-    s8 = StateSet([
-        LR1Element(Production(S, [b, A, c]), 3, set([f])),
-    ])
-
-    s9 = StateSet([
-        LR1Element(Production(S, [b, A, c]), 3, set([c])),
-    ])
-
-    assert len(graph.state_sets) == 10
-    assert s0 in graph.state_sets
-    assert s1 in graph.state_sets
-    assert s2 in graph.state_sets
-    assert s3 in graph.state_sets
-    assert s4 in graph.state_sets
-    assert s6 in graph.state_sets
-    assert s7 in graph.state_sets
-    assert s8 in graph.state_sets
-    assert s9 in graph.state_sets
-
     graph.convert_lalr()
 
-    s0 = StateSet([
-        LR1Element(Production(None, [S]), 0, set([f])),
-        LR1Element(Production(S, [b, A, c]), 0, set([f])),
-    ])
-
-    s1 = StateSet([
-        LR1Element(Production(S, [b, A, c]), 1, set([f, c])),
-        LR1Element(Production(A, [S]), 0, set([c])),
-        LR1Element(Production(A, [a]), 0, set([c])),
-        LR1Element(Production(S, [b, A, c]), 0, set([c])),
-    ])
-
-    s2 = StateSet([
-        LR1Element(Production(A, [a]), 1, set([c])),
-    ])
-
-    s3 = StateSet([
-        LR1Element(Production(None, [S]), 1, set([f])),
-    ])
-
-    s4 = StateSet([
-        LR1Element(Production(S, [b, A, c]), 2, set([f, c])),
-    ])
-
-    s5 = StateSet([
-        LR1Element(Production(A, [S]), 1, set([c])),
-    ])
-
-    s6 = StateSet([
-        LR1Element(Production(S, [b, A, c]), 3, set([f, c])),
-    ])
-
     assert len(graph.state_sets) == 7
-    assert s0 in graph.state_sets
-    assert s1 in graph.state_sets
-    assert s2 in graph.state_sets
-    assert s3 in graph.state_sets
-    assert s4 in graph.state_sets
-    assert s6 in graph.state_sets
+    assert len(set(cores(graph))) == 7
+    assert State(Production(None, [S]), 0) in graph.state_sets[0]
+
+    s = graph.state_sets[graph.follow(0, b)]
+    assert s.lookaheads[LR1Element(Production(S, [b, A, c]), 1)] == set([c, f])
+    assert s.lookaheads[LR1Element(Production(A, [a]), 0)] == set([c])
+    assert graph.follow(graph.follow(0, b), b) == graph.follow(0, b)
+
+grammar2 = """
+    S ::= "a" E "c"
+        | "a" F "d"
+        | "b" F "c"
+        | "b" E "d"
+    E ::= "e"
+    F ::= "e"
+"""
 
-def test_edges():
-    pass
+def test_merge():
+    # LR(1), but not LALR(1): the states reached by "a" "e" and "b" "e"
+    # have the same core, but can't be merged without a conflict
+    p2 = Parser(grammar2)
+    p2.parse()
+    d = Terminal("d")
+    e = Terminal("e")
+    E = Nonterminal("E")
+    F = Nonterminal("F")
+    graph = StateGraph(p2.start_symbol, p2.rules, 1)
+    graph.build()
+    lr1_states = len(graph.state_sets)
+    ae = graph.follow(graph.follow(0, a), e)
+    be = graph.follow(graph.follow(0, b), e)
+    assert ae != be
+    assert cores(graph).count(cores(graph)[ae]) == 2
 
+    graph.convert_lalr()
+    assert len(graph.state_sets) == lr1_states - 1
+    assert len(set(cores(graph))) == len(graph.state_sets)
+    ae = graph.follow(graph.follow(0, a), e)
+    be = graph.follow(graph.follow(0, b), e)
+    assert ae == be
+    merged = graph.state_sets[ae]
+    assert merged.lookaheads[LR1Element(Production(E, [e]), 1)] == set([c, d])
+    assert merged.lookaheads[LR1Element(Production(F, [e]), 1)] == set([c, d])
+    # every edge points to an existing state
+    for (from_id, symbol), to in graph.edges.items():
+        assert 0 <= from_id < len(graph.state_sets)
+        assert 0 < to < len(graph.state_sets)
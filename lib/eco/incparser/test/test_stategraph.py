@@ -23,6 +23,7 @@ from grammar_parser.gparser import Parser, Terminal, Nonterminal
 from incparser.state import StateSet, State
 from incparser.production import Production
 from incparser.stategraph import StateGraph
+from incparser.syntaxtable import SyntaxTable
 
 import pytest
 
@@ -123,3 +124,44 @@ def test_edges():
 
 def test_get_symbols():
     assert graph.get_symbols() == set([a, b, c, S, A])
+
+grammar_ab = """
+    S ::= "x" A
+        | "y" B
+    A ::= "a" A
+        | "a"
+    B ::= "b" B
+        | "b"
+"""
+
+def build_table(graph):
+    syntaxtable = SyntaxTable(1)
+    syntaxtable.build(graph)
+    return syntaxtable.table
+
+def test_rebuild_after_edit():
+    p1 = Parser(grammar_ab)
+    p1.parse()
+    old = StateGraph(p1.start_symbol, p1.rules, 1)
+    old.build()
+
+    p2 = Parser(grammar_ab + """
+        | "c" B
+    """)
+    p2.parse()
+    new = StateGraph(p2.start_symbol, p2.rules, 1, old)
+    new.build()
+    scratch = StateGraph(p2.start_symbol, p2.rules, 1)
+    scratch.build()
+
+    # the states for "x" A don't depend on B
+    assert new.helper.changed == set([Nonterminal("B")])
+    assert 0 < new.helper.reused < new.closure_count
+    assert len(new.state_sets) == len(scratch.state_sets)
+    assert build_table(new) == build_table(scratch)
+
+def test_rebuild_unchanged():
+    new = StateGraph(p.start_symbol, p.rules, 1, graph)
+    new.build()
+    assert new.helper.reused == new.closure_count
+    assert build_table(new) == build_table(graph)
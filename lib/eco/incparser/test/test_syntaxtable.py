@@ -68,3 +68,32 @@ def test_build():
     st.build(graph)
     for key in syntaxtable.keys():
         assert st.table[key] == syntaxtable[key]
+
+def test_compile():
+    graph = StateGraph(p.start_symbol, p.rules, 1)
+    graph.build()
+    st = SyntaxTable(1)
+    st.build(graph)
+    compact = st.compile()
+    assert compact.table == st.table
+    for (state, symbol), action in st.table.items():
+        assert compact.lookup(state, symbol) == action
+        assert compact.lookup_id(state, compact.symbol_id(symbol)) == action
+    assert compact.lookup(0, c) is None
+    assert compact.lookup(3, Terminal("unknown")) is None
+    assert compact.lookup_id(-1, compact.symbol_id(b)) is None
+    assert compact.lookup_id(len(graph.state_sets), compact.symbol_id(b)) is None
+    assert compact.terminal_id("b") == compact.symbol_id(b)
+    assert set(compact.get_symbols(2)) == set([c, A, d])
+    reduce = compact.lookup(4, d)
+    assert compact.symbols[reduce.left_id] == A
+
+def test_compile_pickle():
+    import pickle
+    graph = StateGraph(p.start_symbol, p.rules, 1)
+    graph.build()
+    st = SyntaxTable(1)
+    st.build(graph)
+    compact = pickle.loads(pickle.dumps(st.compile()))
+    for key in syntaxtable.keys():
+        assert compact.lookup(*key) == syntaxtable[key]
@@ -1,33 +1,66 @@
-import pkgutil, importlib
+import pkgutil, importlib, os
+
+_modules = None
+
+def plugin_modules():
+    """Import the plugin modules. This only happens once per process."""
+    global _modules
+    if _modules is None:
+        path = os.path.dirname(os.path.abspath(__file__))
+        names = sorted(name for _, name, _ in pkgutil.iter_modules([path]))
+        names.remove("plugin")
+        _modules = [importlib.import_module("." + m, "ip_plugins") for m in names]
+    return _modules
+
+def noop(*args, **kwargs):
+    pass
 
 class PluginManager:
+    """Calls the hooks of the plugins loaded for a parser. Calling
+    `do_<hook>(...)` calls `<hook>(...)` on every plugin that has it.
+
+    The dispatchers for all hooks are resolved once, by `resolve`. Plugins can
+    define `enabled()`; the hooks of disabled plugins aren't called, apart
+    from the `setup_hooks` which prepare a plugin in case it is enabled
+    later. Call `resolve` again whenever `enabled()` may have changed."""
+
+    hooks = ["incparse_init", "incparse_from_dict", "incparse_inc_parse_top",
+             "incparse_optshift", "incparse_shift", "incparse_reduce"]
+    setup_hooks = ["incparse_init", "incparse_from_dict"]
 
     def __init__(self):
         self.loaded = []
 
     def loadplugins(self, caller):
-        modules = [name for _, name, _ in pkgutil.iter_modules(['ip_plugins'])]
-        modules.remove("plugin")
-        for m in modules:
-            m = importlib.import_module("." + m, "ip_plugins")
+        for m in plugin_modules():
             p = m.load(caller)
             if p:
                 self.loaded.append(p)
+        self.resolve()
 
-    def __getattr__(self, attr, *args, **kwargs):
+    def resolve(self):
+        enabled = [p for p in self.loaded if not hasattr(p, "enabled") or p.enabled()]
+        for name in self.hooks:
+            if name in self.setup_hooks:
+                self.resolve_hook(name, self.loaded)
+            else:
+                self.resolve_hook(name, enabled)
 
-        funcs = []
-        if attr.startswith("do_"):
-            fname = attr[3:]
-            for p in self.loaded:
-                try:
-                    f = p.__getattribute__(fname)
-                    funcs.append(f)
-                except AttributeError:
-                    print("WARNING: Plugin %s has no method '%s'" % (type(p), fname))
+    def resolve_hook(self, name, plugins):
+        funcs = [getattr(p, name) for p in plugins if hasattr(p, name)]
+        if not funcs:
+            func = noop
+        elif len(funcs) == 1:
+            func = funcs[0]
+        else:
             def func(*args, **kwargs):
                 for f in funcs:
                     f(*args, **kwargs)
-            return func
-        else:
-            return object.__getattribute__(self, attr)
+        self.__dict__["do_" + name] = func
+        return func
+
+    def __getattr__(self, attr):
+        # hooks that aren't listed in `hooks`
+        if attr.startswith("do_"):
+            return self.resolve_hook(attr[3:], self.loaded)
+        raise AttributeError(attr)
@@ -9,6 +9,9 @@ class PythonIndent(object):
         self.incparser = incparser
         self.multimode = None
 
+    def enabled(self):
+        return self.incparser.indentation_based
+
     def incparse_init(self):
         self.comment_tokens = []
         self.indent_stack = None
@@ -242,7 +245,10 @@ class PythonIndent(object):
                 continue
             needed, newindent = self.get_indentation_tokens_and_indent(newindent, next_ws)
             if not self.indents_match(next_r, needed) or next_r.indent != newindent:
+                # the parser updates this line when it gets there and then
+                # continues with the lines after it
                 next_r.mark_changed()
+                break
             if next_ws < ws:
                 # if newline has smaller whitespace -> mark and break
                 break
@@ -310,7 +316,7 @@ class PythonIndent(object):
             node.indent = l
 
 def load(caller):
-    # XXX only load if incparser is indentation_based
+    # only enabled while the incparser is indentation_based
     if type(caller).__name__ == "IncParser":
         return PythonIndent(caller)
     return None
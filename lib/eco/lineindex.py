@@ -0,0 +1,275 @@
+# Copyright (c) 2012--2014 King's College London
+# Created by the Software Development Team <http://soft-dev.org/>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to
+# deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+# sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+
+"""A list of the lines of a document that is a persistent B-tree.
+
+Every node of the tree (a LineChunk) knows how many lines it holds, their
+total height and their maximum width. This makes indexing, inserting and
+deleting lines O(log n), as well as finding the line at a given height,
+e.g. the first visible line, or the height above a line. Chunks are never
+modified once created: an update copies the chunks on the path to the
+changed line and shares all others, so the index of an earlier version of a
+document stays valid and can be kept at the cost of that path.
+
+For the same reason lines must not be changed in place while they are in an
+index; `set_height` and `set_width` replace a line with an updated copy."""
+
+import copy
+
+# Maximum number of lines in a leaf, and of children of an inner chunk.
+# Chunks with less than MIN_ITEMS items are merged with a neighbour.
+MAX_ITEMS = 64
+MIN_ITEMS = MAX_ITEMS // 4
+
+class LineChunk(object):
+    __slots__ = ["leaf", "items", "size", "height", "width"]
+
+    def __init__(self, leaf, items):
+        self.leaf = leaf
+        self.items = items
+        if leaf:
+            self.size = len(items)
+            self.height = sum(line.height for line in items)
+            self.width = max(line.width for line in items)
+        else:
+            self.size = sum(chunk.size for chunk in items)
+            self.height = sum(chunk.height for chunk in items)
+            self.width = max(chunk.width for chunk in items)
+
+def make_chunks(leaf, items):
+    """Return a list of chunks holding `items`, evenly split so that none of
+    them has more than MAX_ITEMS items."""
+    if not items:
+        return []
+    if len(items) <= MAX_ITEMS:
+        return [LineChunk(leaf, items)]
+    count = (len(items) + MAX_ITEMS - 1) // MAX_ITEMS
+    size = (len(items) + count - 1) // count
+    return [LineChunk(leaf, items[i:i+size]) for i in range(0, len(items), size)]
+
+def make_root(chunks):
+    if not chunks:
+        return None
+    while len(chunks) > 1:
+        chunks = make_chunks(False, chunks)
+    root = chunks[0]
+    while not root.leaf and len(root.items) == 1:
+        root = root.items[0]
+    return root
+
+def merge_small(chunks):
+    result = []
+    for chunk in chunks:
+        if result and (len(chunk.items) < MIN_ITEMS or len(result[-1].items) < MIN_ITEMS):
+            result.extend(make_chunks(chunk.leaf, result.pop().items + chunk.items))
+        else:
+            result.append(chunk)
+    return result
+
+def insert(chunk, i, line):
+    if chunk.leaf:
+        items = list(chunk.items)
+        items.insert(i, line)
+        return make_chunks(True, items)
+    items = chunk.items
+    for k in range(len(items)):
+        if i <= items[k].size or k == len(items) - 1:
+            break
+        i -= items[k].size
+    return make_chunks(False, items[:k] + insert(items[k], i, line) + items[k+1:])
+
+def replace(chunk, i, line):
+    if chunk.leaf:
+        items = list(chunk.items)
+        items[i] = line
+        return LineChunk(True, items)
+    items = list(chunk.items)
+    for k in range(len(items)):
+        if i < items[k].size:
+            break
+        i -= items[k].size
+    items[k] = replace(items[k], i, line)
+    return LineChunk(False, items)
+
+def delete(chunk, start, stop):
+    """Return the chunks that remain of `chunk` without its lines from
+    `start` to `stop`."""
+    if chunk.leaf:
+        items = chunk.items[:start] + chunk.items[stop:]
+    else:
+        items = []
+        offset = 0
+        for child in chunk.items:
+            end = offset + child.size
+            if end <= start or offset >= stop:
+                items.append(child)
+            else:
+                items.extend(delete(child, max(start - offset, 0), min(stop, end) - offset))
+            offset = end
+        items = merge_small(items)
+    if not items:
+        return []
+    return make_chunks(chunk.leaf, items)
+
+def iterate(chunk):
+    if chunk.leaf:
+        for line in chunk.items:
+            yield line
+    else:
+        for child in chunk.items:
+            for line in iterate(child):
+                yield line
+
+class LineIndex(object):
+    """The lines of a document. Supports the list operations the editor uses
+    (len, indexing, slicing, iteration, insert, append, extend and del) and
+    answers height queries. `root` is the current, immutable tree; saving it
+    saves the index, and assigning a saved root restores it."""
+
+    def __init__(self, lines=()):
+        self.root = make_root(make_chunks(True, list(lines)))
+
+    def __len__(self):
+        if self.root is None:
+            return 0
+        return self.root.size
+
+    def __iter__(self):
+        if self.root is None:
+            return iter([])
+        return iterate(self.root)
+
+    def __repr__(self):
+        return "LineIndex(%s)" % (list(self),)
+
+    def normalize(self, i):
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError("line index out of range")
+        return i
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            start, stop, step = i.indices(len(self))
+            return [self[j] for j in range(start, stop, step)]
+        i = self.normalize(i)
+        chunk = self.root
+        while not chunk.leaf:
+            for child in chunk.items:
+                if i < child.size:
+                    break
+                i -= child.size
+            chunk = child
+        return chunk.items[i]
+
+    def __delitem__(self, i):
+        if isinstance(i, slice):
+            start, stop, step = i.indices(len(self))
+            assert step == 1
+        else:
+            start = self.normalize(i)
+            stop = start + 1
+        if start < stop:
+            self.root = make_root(delete(self.root, start, stop))
+
+    def insert(self, i, line):
+        if i < 0:
+            i = max(0, i + len(self))
+        if self.root is None:
+            self.root = LineChunk(True, [line])
+            return
+        self.root = make_root(insert(self.root, min(i, len(self)), line))
+
+    def append(self, line):
+        self.insert(len(self), line)
+
+    def extend(self, lines):
+        """Append `lines`. This rebuilds the whole index, which is faster than
+        inserting them one by one when there are many."""
+        self.root = make_root(make_chunks(True, list(self) + list(lines)))
+
+    def set_height(self, i, height):
+        self.update(i, "height", height)
+
+    def set_width(self, i, width):
+        self.update(i, "width", width)
+
+    def update(self, i, attr, value):
+        i = self.normalize(i)
+        line = self[i]
+        if getattr(line, attr) == value:
+            return
+        line = copy.copy(line)
+        setattr(line, attr, value)
+        self.root = replace(self.root, i, line)
+
+    @property
+    def height(self):
+        """The total height of all lines."""
+        if self.root is None:
+            return 0
+        return self.root.height
+
+    @property
+    def width(self):
+        """The width of the widest line."""
+        if self.root is None:
+            return 0
+        return self.root.width
+
+    def height_before(self, i):
+        """Return the total height of the lines before line `i`."""
+        if self.root is None:
+            return 0
+        height = 0
+        chunk = self.root
+        while not chunk.leaf:
+            for child in chunk.items:
+                if i < child.size:
+                    break
+                i -= child.size
+                height += child.height
+            chunk = child
+        return height + sum(line.height for line in chunk.items[:i])
+
+    def find_height(self, y):
+        """Return the index of the line that covers height `y`, and the height
+        at which it starts. Past the last line, this is the number of lines
+        and the total height."""
+        if y >= self.height:
+            return len(self), self.height
+        index = 0
+        start = 0
+        chunk = self.root
+        while not chunk.leaf:
+            for child in chunk.items:
+                if start + child.height > y:
+                    break
+                start += child.height
+                index += child.size
+            chunk = child
+        for line in chunk.items:
+            if start + line.height > y:
+                break
+            start += line.height
+            index += 1
+        return index, start
@@ -32,6 +32,7 @@ from grammars.grammars import submenu_langs as languages, lang_dict
 from grammar_parser.gparser import MagicTerminal, IndentationTerminal
 from grammar_parser.bootstrap import ListNode, AstNode
 from incparser.astree import BOS, EOS
+from incparser.history import RetentionPolicy
 from jsonmanager import JsonManager
 from utils import KeyPress
 from overlay import Overlay
@@ -164,8 +165,21 @@ class NodeEditor(QFrame):
 
     def set_mainlanguage(self, parser, lexer, lang_name):
         self.tm = TreeManager()
+        self.tm.history_policy = self.get_history_policy()
         self.tm.add_parser(parser, lexer, lang_name)
 
+    def get_history_policy(self):
+        # Undo history limits (0 = unlimited). Age is given in minutes and
+        # size in megabytes.
+        settings = QSettings("softdev", "Eco")
+        max_versions = settings.value("undo_max_versions", 0).toInt()[0]
+        max_age = settings.value("undo_max_age", 0).toInt()[0]
+        max_size = settings.value("undo_max_size", 0).toInt()[0]
+        if not (max_versions or max_age or max_size):
+            return None
+        return RetentionPolicy(max_versions or None, max_age * 60 or None,
+                               max_size * 1024 * 1024 or None)
+
     def get_mainlanguage(self):
         return self.tm.parsers[0][2]
 
@@ -245,16 +259,11 @@ class NodeEditor(QFrame):
         self.update()
 
     def getScrollSizes(self):
-        total_lines = 0
-        max_width = 0
-        for l in self.lines:
-            total_lines += l.height
-            max_width = max(max_width, l.width)
         max_visible_lines = self.geometry().height() / self.fontht
-        self.scroll_height = max(0, total_lines - max_visible_lines)
+        self.scroll_height = max(0, self.lines.height - max_visible_lines)
 
         current_width = self.parentWidget().geometry().width() / self.fontwt
-        self.scroll_width = max(0, max_width - current_width)
+        self.scroll_width = max(0, self.lines.width - current_width)
 
     def paintEvent(self, event):
         # Clear data in the visualisation overlay
@@ -283,16 +292,11 @@ class NodeEditor(QFrame):
 
         paint.end()
 
-        total_lines = 0
-        max_width = 0
-        for l in self.lines:
-            total_lines += l.height
-            max_width = max(max_width, l.width)
         max_visible_lines = self.geometry().height() / self.fontht
-        self.scroll_height = max(0, total_lines - max_visible_lines)
+        self.scroll_height = max(0, self.lines.height - max_visible_lines)
 
         current_width = self.parentWidget().geometry().width() / self.fontwt
-        self.scroll_width = max(0, max_width - current_width)
+        self.scroll_width = max(0, self.lines.width - current_width)
 
         railroad_annotations = self.tm.get_all_annotations_with_hint(Railroad)
         self.overlay.add_railroad_data(railroad_annotations)
@@ -303,13 +307,7 @@ class NodeEditor(QFrame):
     def paintLines(self, paint, startline):
 
         # find internal line corresponding to visual line
-        visual_line = 0
-        internal_line = 0
-        for l in self.tm.lines:
-            if visual_line + l.height > startline:
-                break
-            visual_line += l.height
-            internal_line += 1
+        internal_line, visual_line = self.tm.lines.find_height(startline)
 
         x = 0
         y = visual_line - startline # start drawing outside of viewport to display partial images
@@ -366,7 +364,7 @@ class NodeEditor(QFrame):
 
         self.lines = self.tm.lines
         self.cursor = self.tm.cursor
-        self.lines[line].height = 1 # reset height
+        height = 1 # height of the current line
         draw_cursor = True
         show_namebinding = self.getWindow().show_namebinding()
         while y < max_y:
@@ -414,7 +412,7 @@ class NodeEditor(QFrame):
                         error_node = self.fix_errornode(error_node)
                     continue
                 else:
-                    self.lines[line].width = x / self.fontwt
+                    self.lines.set_width(line, x / self.fontwt)
                     break
 
             # draw language boxes
@@ -450,7 +448,7 @@ class NodeEditor(QFrame):
             # draw node
             dx, dy = renderer.paint_node(paint, node, x, y, highlighter)
             x += dx
-            self.lines[line].height = max(self.lines[line].height, dy)
+            height = max(height, dy)
 
             # Draw footnotes and add heatmap data to overlay.
             annotes = [annote.annotation for annote in node.get_annotations_with_hint(Heatmap)]
@@ -480,7 +478,7 @@ class NodeEditor(QFrame):
                     paint.setPen(QPen(QColor((highlighter.get_default_color()))))
                     start_y = self.fontht + ((y + 1) * self.fontht)
                     paint.drawText(QtCore.QPointF(x-dx, start_y), footnote)
-                    self.lines[line].height = max(self.lines[line].height, 2)
+                    height = max(height, 2)
                     paint.setFont(self.font)
 
             # after we drew a return, update line information
@@ -489,11 +487,12 @@ class NodeEditor(QFrame):
                 if draw_lbox or (draw_all_boxes and lbox > 0):
                     paint.fillRect(QRectF(x,3+y*self.fontht, self.geometry().width()-x, self.fontht), color)
 
-                self.lines[line].width = x / self.fontwt
+                self.lines.set_width(line, x / self.fontwt)
+                self.lines.set_height(line, height)
                 x = 0
-                y += self.lines[line].height
+                y += height
                 line += 1
-                self.lines[line].height = 1 # reset height
+                height = 1
 
             if self.show_highlight_line:
                 if node.lookup == "<return>" or isinstance(node, BOS):
@@ -537,6 +536,7 @@ class NodeEditor(QFrame):
                     self.draw_squiggly_line(paint,x-length,y,length, err_color)
 
             node = node.next_term
+        self.lines.set_height(line, height)
 
         if selection_start != selection_end:
             self.draw_selection(paint, draw_selection_start, draw_selection_end, max_y)
@@ -732,9 +732,7 @@ class NodeEditor(QFrame):
             self.update()
 
     def cursor_to_coordinate(self):
-        y = 0
-        for l in self.tm.lines[:self.cursor.line]:
-            y += l.height * self.fontht
+        y = self.tm.lines.height_before(self.cursor.line) * self.fontht
         x = self.tm.cursor.get_x() * self.fontwt
         y = y - self.getScrollArea().verticalScrollBar().value() * self.fontht
         return (x,y)
@@ -1036,6 +1034,7 @@ class NodeEditor(QFrame):
         language_boxes = manager.load(filename)
 
         self.tm = TreeManager()
+        self.tm.history_policy = self.get_history_policy()
 
         self.tm.load_file(language_boxes)
         self.reset()
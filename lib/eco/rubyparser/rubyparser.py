@@ -3,11 +3,9 @@ from incparser.astree import AST, BOS, EOS, TextNode
 from incparser.syntaxtable import FinishSymbol
 from grammars.grammars import EcoFile
 from grammar_parser.gparser import Terminal, Nonterminal
+from worker import ParserWorker, FAILED
 from PyQt4.QtCore import QSettings
 
-import subprocess
-import tempfile
-
 lexingrules = [
     ("<ws>", "[ \t]"),
     ("<return>", "[\n\r]"),
@@ -75,12 +73,32 @@ class DummyTM(object):
         self.lines = [LineDummy(node)]
 
 class RubyParser(object):
+    """Parser for Ruby code that runs an external parser in a worker process
+    (see rubyparser.worker). Parsing happens in the background: last_status
+    and error_node describe the most recent text the worker has finished
+    parsing, as long as nothing was edited since. If the parser can't be run,
+    they keep describing the last text that could be parsed."""
+
     def __init__(self):
         self.previous_version = None
-        self.error_node = None
+        self._error_node = None
         self.graph = None
-        self.last_status = True
+        self._last_status = True
         self.whitespaces = True
+        self.command = None # by default taken from the settings
+        self.worker = None
+        self.requested = 0 # version of the last request sent to the worker
+        self.applied = 0 # version of the last result applied
+
+    @property
+    def last_status(self):
+        self.update_status()
+        return self._last_status
+
+    @property
+    def error_node(self):
+        self.update_status()
+        return self._error_node
 
     def init_ast(self, magic_parent = None):
         bos = BOS(Terminal(""), 0, [])
@@ -93,47 +111,54 @@ class RubyParser(object):
         self.previous_version = AST(root)
 
     def _find_node(self, lineno, charno):
-        node = self.previous_version.parent.children[0]
-        current_line = 1
-        current_charno = 0
-        while True:
+        ast = self.previous_version
+        node, pos = ast.find_node_at_pos(ast.find_line_start(lineno - 1) + charno)
+        if pos == len(node.symbol.name) and (isinstance(node, BOS) or node.lookup == "<return>"):
+            # the column is at the beginning of the line
             node = node.next_term
-            if isinstance(node, EOS):
-                return node
-            if node.lookup == "<return>":
-                current_line += 1
-                current_charno = 0
-                continue
-            current_charno += len(node.symbol.name)
-            if current_line == lineno and current_charno >= charno:
-                return node
+        return node
 
     def inc_parse(self, line_indents = [], reparse=False):
-        settings = QSettings("softdev", "Eco")
-        ruby_parser = str(settings.value("env_ruby_parser", "").toString())
-        if ruby_parser == "":
+        command = self.command
+        if command is None:
+            settings = QSettings("softdev", "Eco")
+            command = str(settings.value("env_ruby_parser", "").toString())
+        if command == "":
             print("Warning: Could not parse Ruby code.\nPlease install a "
                   "parser and set File->Settings->JRuby->Parser to the "
                   "command needed to invoke your parser.\n"
                   "e.g. 'ruby-parse' or 'jruby -c'")
             return
-        self.last_status = True
-        self.error_node = None
+        command = command.split(" ")
+        if self.worker is None or self.worker.command != command:
+            if self.worker is not None:
+                self.worker.close()
+            self.worker = ParserWorker(command)
         exporter = JRubyExporter(DummyTM(self.previous_version.parent.children[0]))
-        f = tempfile.mkstemp(suffix=".rb")
-        exporter.export(path=f[1])
-        command = ruby_parser.split(" ")
-        command.append(f[1])
-        proc = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-        stdout, _ = proc.communicate()
-        for line in stdout.split('\n'):
-            if line.startswith('warning:'):
-                continue
-            if line.startswith(f[1]):
-                tokens = line.split(':')
-                self.error_node = self._find_node(int(tokens[1]), int(tokens[2]))
-                self.last_status = False
-                return
+        self.requested += 1
+        self.worker.request(self.requested, exporter.as_text())
+
+    def update_status(self):
+        """Apply the result of the worker if it has parsed the current text."""
+        if self.worker is None or self.applied == self.requested:
+            return
+        error = self.worker.get_result(self.requested)
+        if error is False:
+            return
+        self.applied = self.requested
+        if error is FAILED:
+            # the text wasn't parsed (the worker has logged why), so keep
+            # the status of the last text that was
+            return
+        self._last_status = error is None
+        self._error_node = None
+        if error is not None:
+            self._error_node = self._find_node(*error)
+
+    def wait(self, timeout=None):
+        """Wait until the worker has parsed the current text."""
+        if self.worker is not None:
+            self.worker.wait(self.requested, timeout)
 
     def reparse(self):
         self.inc_parse()
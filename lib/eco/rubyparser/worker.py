@@ -0,0 +1,216 @@
+# Copyright (c) 2012--2014 King's College London
+# Created by the Software Development Team <http://soft-dev.org/>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to
+# deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+# sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+
+
+"""A long-lived process running an external Ruby parser, and the client eco
+uses to talk to it.
+
+The worker reads requests from stdin and answers each one on stdout, one
+line per answer:
+
+    parse <size>\n<size bytes of source>   ->  ok\n  or  error <line> <column>\n
+                                                or  failed <reason>\n
+    quit\n                                 ->  (exits)
+
+It runs the parser command (e.g. `ruby-parse` or `jruby -c`) with the path of
+a temporary file holding the source, and looks for the first line of its
+output containing `<path>:<line>:<column>` that isn't a warning. The column
+is optional. If the command can't be run at all, the answer is `failed`. The
+temporary file is reused for every request and removed when the worker exits,
+which it does when its stdin is closed.
+
+ParserWorker starts the worker and sends it requests from a background
+thread, so that parsing never blocks the editor. Requests are debounced:
+one is only sent once no newer one arrived for `delay` seconds, and a
+request replaced by a newer one is never sent. Answers to requests that
+have been replaced while the worker was parsing them are dropped."""
+
+import logging, os, re, subprocess, sys, tempfile, threading, time
+
+# Result of a request the parser couldn't be run for: neither None (no
+# error) nor a location.
+FAILED = "failed"
+
+def find_error(output, path):
+    """Return the line and column of the first error for `path` reported in
+    `output`, or None."""
+    location = re.compile(re.escape(path) + r":(\d+)(?::(\d+))?")
+    for line in output.split("\n"):
+        if "warning:" in line:
+            continue
+        m = location.search(line)
+        if m:
+            return int(m.group(1)), int(m.group(2) or 0)
+    return None
+
+def serve(command, stdin, stdout):
+    fd, path = tempfile.mkstemp(suffix=".rb")
+    os.close(fd)
+    try:
+        while True:
+            request = stdin.readline().split()
+            if not request or request[0] == "quit":
+                return
+            source = stdin.read(int(request[1]))
+            with open(path, "w") as f:
+                f.write(source)
+            try:
+                proc = subprocess.Popen(command + [path], stdout=subprocess.PIPE,
+                                        stderr=subprocess.STDOUT)
+            except OSError, e:
+                stdout.write("failed %s\n" % " ".join(str(e).split()))
+                stdout.flush()
+                continue
+            output, _ = proc.communicate()
+            error = find_error(output, path)
+            if error is None:
+                stdout.write("ok\n")
+            else:
+                stdout.write("error %d %d\n" % error)
+            stdout.flush()
+    finally:
+        os.remove(path)
+
+class ParserWorker(object):
+    """Client of a worker process running the parser `command` (a list)."""
+
+    def __init__(self, command, delay=0.25):
+        self.command = command
+        self.delay = delay
+        self.condition = threading.Condition()
+        self.pending = None     # (version, source) waiting to be sent
+        self.deadline = 0
+        self.latest = None      # version of the newest request
+        self.result = None      # (version, error) of the newest answer
+        self.failure = None     # reason of the last failure that was logged
+        self.closed = False
+        self.proc = None
+        self.thread = None
+
+    def request(self, version, source):
+        """Ask for `source` to be parsed, replacing any request that hasn't
+        been sent yet. `version` identifies the request in `result`."""
+        with self.condition:
+            self.pending = (version, source)
+            self.latest = version
+            self.deadline = time.time() + self.delay
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._run)
+                self.thread.daemon = True
+                self.thread.start()
+            self.condition.notify()
+
+    def get_result(self, version):
+        """Return the error (line, column) found in the source of request
+        `version`, None if there was none, FAILED if the parser couldn't be
+        run, or False if it hasn't been parsed (yet)."""
+        with self.condition:
+            if self.result is None or self.result[0] != version:
+                return False
+            return self.result[1]
+
+    def wait(self, version, timeout=None):
+        """Wait until request `version` has been parsed or replaced, and
+        return get_result(version)."""
+        end = None if timeout is None else time.time() + timeout
+        with self.condition:
+            while (self.latest == version and not self.closed and
+                   (self.result is None or self.result[0] != version)):
+                if end is None:
+                    self.condition.wait()
+                else:
+                    remaining = end - time.time()
+                    if remaining <= 0:
+                        break
+                    self.condition.wait(remaining)
+        return self.get_result(version)
+
+    def close(self):
+        """Stop the thread and the worker process."""
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+        if self.thread is not None:
+            self.thread.join()
+        self._stop()
+
+    def _run(self):
+        while True:
+            with self.condition:
+                while not self.closed:
+                    if self.pending is not None:
+                        remaining = self.deadline - time.time()
+                        if remaining <= 0:
+                            break
+                        self.condition.wait(remaining)
+                    else:
+                        self.condition.wait()
+                if self.closed:
+                    return
+                version, source = self.pending
+                self.pending = None
+            error = self._parse(source)
+            with self.condition:
+                if version == self.latest:
+                    self.result = (version, error)
+                    self.condition.notify_all()
+
+    def _parse(self, source):
+        try:
+            if self.proc is None:
+                self.proc = subprocess.Popen([sys.executable, os.path.abspath(__file__)] + self.command,
+                                             stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+            self.proc.stdin.write("parse %d\n" % len(source))
+            self.proc.stdin.write(source)
+            self.proc.stdin.flush()
+            answer = self.proc.stdout.readline().split()
+            if not answer:
+                raise IOError("worker exited")
+        except (IOError, OSError), e:
+            # restarted by the next request
+            self._stop()
+            return self._fail("worker failed: %s" % e)
+        if answer[0] == "ok":
+            return None
+        if answer[0] == "failed":
+            return self._fail("could not run %s: %s" % (" ".join(self.command), " ".join(answer[1:])))
+        return int(answer[1]), int(answer[2])
+
+    def _fail(self, reason):
+        # only log a failure once, not for every request it happens to
+        if reason != self.failure:
+            logging.warning("Ruby parser %s", reason)
+            self.failure = reason
+        return FAILED
+
+    def _stop(self):
+        proc, self.proc = self.proc, None
+        if proc is None:
+            return
+        try:
+            proc.stdin.write("quit\n")
+            proc.stdin.close()
+        except IOError:
+            pass
+        proc.wait()
+
+if __name__ == "__main__":
+    serve(sys.argv[1:], sys.stdin, sys.stdout)
@@ -0,0 +1,218 @@
+# Copyright (c) 2012--2014 King's College London
+# Created by the Software Development Team <http://soft-dev.org/>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to
+# deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+# sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+
+
+"""An index of the text of a document for searching it.
+
+The text searched is the document as it is exported: the text of all tokens,
+including the contents of language boxes, with "\\n" for line breaks. A match
+can span any number of tokens and language boxes.
+
+The index splits the parse tree into chunks and keeps the text of each. The
+chunks are the largest subtrees with at most CHUNK_SIZE characters, and the
+tokens of larger nonterminals that are not inside such a subtree. Refreshing
+the index after an edit reuses the chunks whose subtree didn't change. This
+relies on the extents cached on nonterminals (see Node.get_extent): every
+change of a subtree drops its extent, and recomputing an extent creates a new
+tuple. So a chunk whose node still has the very extent it had when the chunk
+was made still has the same text. A refresh thus only visits the
+nonterminals larger than a chunk and the changed chunks, not every token."""
+
+import bisect, re
+
+from grammar_parser.gparser import Nonterminal, MagicTerminal, IndentationTerminal
+from incparser.astree import BOS, EOS
+
+# Maximum number of characters of a subtree kept as one chunk
+CHUNK_SIZE = 1024
+
+def terminal_text(node):
+    """Return the text of a terminal in the exported document."""
+    symbol = node.symbol
+    if isinstance(symbol, (Nonterminal, IndentationTerminal)) or isinstance(node, (BOS, EOS)):
+        return ""
+    if symbol.name == "\r":
+        return "\n"
+    return symbol.name
+
+def terminals(node):
+    """Yield the terminals with text in the subtree of `node`, in the order of
+    the text, including those inside language boxes."""
+    stack = [node]
+    while stack:
+        node = stack.pop()
+        if isinstance(node.symbol, MagicTerminal):
+            node = node.symbol.ast
+        if node.children:
+            stack.extend(reversed(node.children))
+        elif terminal_text(node):
+            yield node
+
+class Chunk(object):
+    __slots__ = ["node", "extent", "text"]
+
+    def __init__(self, node, extent):
+        self.node = node
+        self.extent = extent    # None for tokens, which are compared by text
+        self.text = "".join([terminal_text(t) for t in terminals(node)])
+
+    def locate(self, pos):
+        """Return the terminal containing the character before position `pos`
+        of the chunk's text, and the position of `pos` within it. Like
+        AST.find_node_at_pos, this descends through the cached extents."""
+        node = self.node
+        while True:
+            if isinstance(node.symbol, MagicTerminal):
+                node = node.symbol.ast
+            if not node.children:
+                return node, pos
+            for child in node.children:
+                chars = child.get_extent()[0]
+                if pos <= chars and chars > 0:
+                    node = child
+                    break
+                pos -= chars
+
+class Match(object):
+    """A match of a search. `start` and `end` are offsets in the text of the
+    document. `node`, `pos` and `line` are where a cursor at the start of the
+    match would be (see SearchIndex.locate), and `end_node`, `end_pos` and
+    `end_line` where one at its end would be."""
+
+    def __init__(self, start, end, node, pos, line, end_node, end_pos, end_line):
+        self.start = start
+        self.end = end
+        self.node = node
+        self.pos = pos
+        self.line = line
+        self.end_node = end_node
+        self.end_pos = end_pos
+        self.end_line = end_line
+
+    def __repr__(self):
+        return "Match(%s, %s, line=%s)" % (self.start, self.end, self.line)
+
+class SearchIndex(object):
+    """The text of the document with the tree `root`, split into chunks.
+    Call refresh after the document was changed, before searching it."""
+
+    def __init__(self, root):
+        self.root = root
+        self.extent = None  # the root's extent when the index was refreshed
+        self.chunks = []
+        self.starts = []    # offset of each chunk in the text
+        self.text = ""
+
+    def refresh(self):
+        """Bring the index up to date with the tree."""
+        extent = self.root.get_extent()
+        if extent is self.extent:
+            return
+        old = {}
+        for chunk in self.chunks:
+            old[id(chunk.node)] = chunk
+        chunks = []
+        stack = [self.root]
+        while stack:
+            node = stack.pop()
+            if isinstance(node.symbol, MagicTerminal):
+                node = node.symbol.ast
+            if not node.children:
+                text = terminal_text(node)
+                if text:
+                    chunk = old.get(id(node))
+                    if chunk is None or chunk.text != text:
+                        chunk = Chunk(node, None)
+                    chunks.append(chunk)
+                continue
+            chars = node.get_extent()[0]
+            if chars > CHUNK_SIZE:
+                stack.extend(reversed(node.children))
+            elif chars > 0:
+                chunk = old.get(id(node))
+                if chunk is None or chunk.extent is not node.extent:
+                    chunk = Chunk(node, node.extent)
+                chunks.append(chunk)
+        starts = []
+        offset = 0
+        for chunk in chunks:
+            starts.append(offset)
+            offset += len(chunk.text)
+        self.chunks = chunks
+        self.starts = starts
+        self.text = "".join([chunk.text for chunk in chunks])
+        self.extent = extent
+
+    def locate(self, offset):
+        """Return the terminal containing the character before `offset` and
+        the position of `offset` within it, which is where the editor puts a
+        cursor at that offset. At offset 0 this is BOS."""
+        if offset <= 0 or not self.chunks:
+            return self.root.children[0], 0
+        offset = min(offset, len(self.text))
+        i = bisect.bisect_left(self.starts, offset) - 1
+        return self.chunks[i].locate(offset - self.starts[i])
+
+    def compile(self, pattern, regex):
+        if not regex:
+            pattern = re.escape(pattern)
+        return re.compile(pattern, re.MULTILINE)
+
+    def spans(self, pattern, regex=False, start=0):
+        """Yield the start and end offsets of the non-empty matches of
+        `pattern` from offset `start` on. `pattern` is a substring or, if
+        `regex` is true, a regular expression."""
+        text = self.text
+        if not regex:
+            if not pattern:
+                return
+            i = text.find(pattern, start)
+            while i >= 0:
+                yield i, i + len(pattern)
+                i = text.find(pattern, i + len(pattern))
+            return
+        for m in self.compile(pattern, regex).finditer(text, start):
+            if m.end() > m.start():
+                yield m.start(), m.end()
+
+    def make_match(self, start, end, line):
+        node, pos = self.locate(start)
+        end_node, end_pos = self.locate(end)
+        end_line = line + self.text.count("\n", start, end)
+        return Match(start, end, node, pos, line, end_node, end_pos, end_line)
+
+    def find(self, pattern, offset=0, regex=False):
+        """Return the first match of `pattern` starting at or after `offset`,
+        continuing from the beginning of the text if there is none, or None."""
+        for start in [offset, 0]:
+            for s, e in self.spans(pattern, regex, start):
+                return self.make_match(s, e, self.text.count("\n", 0, s))
+        return None
+
+    def find_all(self, pattern, regex=False):
+        """Return all non-overlapping matches of `pattern`, in order."""
+        result = []
+        line = last = 0
+        for s, e in self.spans(pattern, regex):
+            line += self.text.count("\n", last, s)
+            last = s
+            result.append(self.make_match(s, e, line))
+        return result
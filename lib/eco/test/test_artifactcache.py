@@ -0,0 +1,93 @@
+# Copyright (c) 2012--2014 King's College London
+# Created by the Software Development Team <http://soft-dev.org/>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to
+# deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+# sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+
+
+import os, time, multiprocessing
+
+from artifactcache import ArtifactCache, make_key
+
+def test_make_key():
+    assert make_key("table", "grammar", True) == make_key("table", "grammar", True)
+    assert make_key("table", "grammar", True) != make_key("table", "grammar", False)
+    assert make_key("table", "ab", "c") != make_key("table", "a", "bc")
+    assert make_key("table", "x") != make_key("graph", "x")
+    # independent of the interpreter's (possibly randomised) string hash
+    assert make_key("table", "x") == "table-9e09fff679d46c540bc6c854aebb03cbbdb331cb"
+
+def test_get(tmpdir):
+    cache = ArtifactCache(str(tmpdir.join("cache")), 1)
+    built = []
+    def build():
+        built.append(1)
+        return {"a": [1, 2]}
+    key = make_key("test", "get")
+    assert not cache.contains(key)
+    assert cache.get(key, build) == {"a": [1, 2]}
+    assert cache.contains(key)
+    assert cache.get(key, build) == {"a": [1, 2]}
+    assert len(built) == 1
+    assert sorted(os.listdir(str(tmpdir.join("cache")))) == [".lock", key + ".art"]
+
+def test_corrupt_entry(tmpdir):
+    cache = ArtifactCache(str(tmpdir), 1)
+    key = make_key("test", "corrupt")
+    tmpdir.join(key + ".art").write("garbage")
+    assert cache.load(key) is None
+    assert not tmpdir.join(key + ".art").check()
+    assert cache.get(key, lambda: 42) == 42
+
+def test_evict(tmpdir):
+    cache = ArtifactCache(str(tmpdir), 1)
+    keys = [make_key("test", i) for i in range(4)]
+    data = "x" * (400 * 1024)
+    now = time.time()
+    for i, key in enumerate(keys[:2]):
+        cache.store(key, data)
+        os.utime(cache.path(key), (now - 100 + i, now - 100 + i))
+    # using an entry makes it the most recently used one
+    assert cache.load(keys[0]) == data
+    cache.store(keys[2], data)
+    assert cache.load(keys[1]) is None
+    assert cache.load(keys[0]) == data
+    assert cache.size() <= 1024 * 1024
+    # an entry larger than the cache is kept until the next store
+    cache.store(keys[3], data * 3)
+    assert cache.load(keys[3]) == data * 3
+    assert [e[2] for e in cache.entries()] == [cache.path(keys[3])]
+
+def build_shared(directory):
+    cache = ArtifactCache(directory, 1)
+    def build():
+        open(os.path.join(directory, "built-%s" % os.getpid()), "w").close()
+        time.sleep(0.2)
+        return "shared"
+    return cache.get(make_key("test", "shared"), build)
+
+def test_shared_between_processes(tmpdir):
+    pool = multiprocessing.Pool(4)
+    try:
+        results = pool.map(build_shared, [str(tmpdir)] * 4)
+    finally:
+        pool.close()
+        pool.join()
+    assert results == ["shared"] * 4
+    # the lock makes all but one process wait for the result
+    assert len(tmpdir.listdir(lambda p: p.basename.startswith("built-"))) == 1
@@ -22,15 +22,17 @@
 from grammars.grammars import calc, java, python, Language, sql, pythonprolog, lang_dict, phppython, pythonphp
 from treemanager import TreeManager
 from incparser.incparser import IncParser
-from inclexer.inclexer import IncrementalLexer
+from inclexer.inclexer import IncrementalLexer, IncrementalLexerCF
 from incparser.astree import BOS, EOS
-from grammar_parser.gparser import MagicTerminal
+from grammar_parser.gparser import MagicTerminal, IndentationTerminal
 from utils import KEY_UP as UP, KEY_DOWN as DOWN, KEY_LEFT as LEFT, KEY_RIGHT as RIGHT
+import searchindex
 
 from PyQt4 import QtCore
 
 import programs
 
+import re, threading
 import pytest
 slow = pytest.mark.slow
 
@@ -566,6 +568,175 @@ class Test_General:
 
         assert c.parent is cp
 
+    def test_grammar_registry(self, tmpdir):
+        from grammars.grammars import registry
+        parser1, lexer1 = calc.load()
+        parser2, lexer2 = calc.load()
+        assert parser1 is not parser2
+        assert lexer1 is lexer2
+        assert parser1.syntaxtable is parser2.syntaxtable
+
+        # a copy of the grammar file has the same content hash
+        path = tmpdir.join("calc.eco")
+        path.write(open(calc.filename, "rb").read(), "wb")
+        grm = EcoFile(calc.name, str(path), "Calc")
+        parser3, lexer3 = grm.load()
+        assert lexer3 is lexer1
+        # rewriting the file invalidates its hash and the loaded grammar
+        h = registry.content_hash(str(path))
+        path.write("changed")
+        assert registry.content_hash(str(path)) != h
+        assert registry.get(calc.name, grm.cache_key()) is None
+
+    def test_grammar_bundle(self, monkeypatch):
+        from grammars.grammars import registry
+        from grammar_parser.bootstrap import BootstrapParser
+        calc.load()
+        registry.clear()
+        def fail(*args):
+            raise AssertionError("grammar was rebuilt")
+        monkeypatch.setattr(BootstrapParser, "parse_both", fail)
+        parser, lexer = calc.load()
+        t = TreeManager()
+        t.add_parser(parser, lexer, calc.name)
+        for c in "1+2*3":
+            t.key_normal(c)
+        assert parser.last_status == True
+
+    def test_grammar_rebuild(self, tmpdir, monkeypatch):
+        from grammars.grammars import registry
+        from artifactcache import cache
+        monkeypatch.setattr(cache, "directory", str(tmpdir))
+        registry.clear()
+        grm = EcoFile(calc.name, calc.filename, "Calc")
+        parser, lexer = grm.load()
+        assert registry.graphs[calc.name] is parser.graph
+        # the table for the extended grammar is built reusing the graph
+        grm.add_alternative("E", sql)
+        parser, lexer = grm.load()
+        assert registry.graphs[calc.name] is parser.graph
+        assert 0 < parser.graph.helper.reused < parser.graph.closure_count
+        t = TreeManager()
+        t.add_parser(parser, lexer, calc.name)
+        t.import_file("1+2*3")
+        assert parser.last_status == True
+        registry.clear()
+
+    def test_lazy_until_cached(self, tmpdir, monkeypatch):
+        from grammars.grammars import registry, GrammarEntry
+        from grammar_parser.bootstrap import BootstrapParser
+        from artifactcache import cache
+        monkeypatch.setattr(cache, "directory", str(tmpdir))
+        monkeypatch.setattr(IncrementalLexerCF, "lazy_until_cached", True)
+        registry.clear()
+        # hold the build back until the lazy lexer has been used
+        done = threading.Event()
+        build = IncrementalLexerCF.build
+        def held(self, *args):
+            done.wait()
+            build(self, *args)
+        monkeypatch.setattr(IncrementalLexerCF, "build", held)
+        # nothing is cached: the language opens with a lazy lexer, and the
+        # generated one replaces it once it has been built
+        parser, lexer = calc.load()
+        assert lexer.lexer.backend == "lazy"
+        t = TreeManager()
+        t.add_parser(parser, lexer, calc.name)
+        for c in "1+2*3":
+            t.key_normal(c)
+        assert parser.last_status == True
+        assert not cache.contains(GrammarEntry.bundle_key(calc.cache_key()))
+        done.set()
+        lexer.wait_until_built()
+        assert lexer.lexer.backend == "code"
+        t.key_normal("+")
+        t.key_normal("4")
+        assert parser.last_status == True
+        # and is bundled for the next load
+        assert cache.contains(GrammarEntry.bundle_key(calc.cache_key()))
+        registry.clear()
+        def fail(*args):
+            raise AssertionError("grammar was rebuilt")
+        monkeypatch.setattr(BootstrapParser, "parse_both", fail)
+        parser, lexer = calc.load()
+        assert lexer.lexer.backend == "code"
+        registry.clear()
+
+    def test_relex_reuse(self):
+        parser, lexer = python.load()
+        t = TreeManager()
+        t.add_parser(parser, lexer, python.name)
+        t.set_font_test(7, 17)
+        for c in "if x:\r    foo = y":
+            t.key_normal(c)
+        ws = t.lines[1].node.next_term
+        while ws.lookup != "<ws>":
+            ws = ws.next_term
+        assert ws.lookahead > 0
+        t.cursor.line = 1
+        t.cursor.move_to_x(6)
+        relexed, reused = lexer.relexed, lexer.reused
+        t.key_normal("x")
+        # the whitespace looks ahead into the edited name and is relexed, but
+        # comes out unchanged and is left untouched
+        assert lexer.relexed - relexed == 2
+        assert lexer.reused - reused == 1
+        assert not ws.log.has_version(t.version)
+        assert ws.next_term.symbol.name == "foxo"
+        assert ws.next_term.log.has_version(t.version)
+        assert parser.last_status == True
+
+    def test_import_lines(self):
+        parser, lexer = python.load()
+        t = TreeManager()
+        t.add_parser(parser, lexer, python.name)
+        t.set_font_test(7, 17)
+        source = "class X:\n    def x(self):\n        pass\n\nx = X()\n"
+        t.import_file(source)
+        assert parser.last_status == True
+        assert t.export_as_text() == source
+        newlines = []
+        node = t.get_bos()
+        while node is not None:
+            if node.symbol.name == "\r":
+                newlines.append(node)
+            node = node.next_term
+        assert len(t.lines) == len(newlines) + 1
+        assert all(line.node is node for line, node in zip(t.lines, [t.get_bos()] + newlines))
+        # the nonterminals grouping the imported lines are gone
+        assert len(parser.previous_version.parent.children) == 3
+
+    def test_import_error(self):
+        parser, lexer = python.load()
+        t = TreeManager()
+        t.add_parser(parser, lexer, python.name)
+        t.set_font_test(7, 17)
+        t.import_file("x = 1 +\ny = 3\n")
+        assert parser.last_status == False
+        t.key_end()
+        t.key_normal("2")
+        assert parser.last_status == True
+        assert t.export_as_text() == "x = 1 +2\ny = 3\n"
+        assert len(parser.previous_version.parent.children) == 3
+
+    def test_plugin_dispatch(self):
+        from ip_plugins.plugin import noop
+        parser, lexer = java.load()
+        t = TreeManager()
+        t.add_parser(parser, lexer, java.name)
+        # the indentation plugin is only enabled for indentation based parsers
+        assert parser.pm.do_incparse_shift is noop
+        assert parser.pm.do_incparse_reduce is noop
+        t.import_file(" class X {}")
+        assert parser.last_status == True
+
+        parser, lexer = python.load()
+        t = TreeManager()
+        t.add_parser(parser, lexer, python.name)
+        assert parser.pm.do_incparse_shift == parser.pm.loaded[0].incparse_shift
+        t.import_file("if x:\n    y = 1")
+        assert parser.last_status == True
+
 class Test_Helper:
     def reset(self):
         self.parser.reset()
@@ -1321,6 +1492,200 @@ class Test_Languageboxes(Test_Python):
         self.treemanager.key_normal("a")
         assert self.treemanager.export_as_text() == "abc:\n    def\n    def x():\n        pass\n    a"
 
+class Test_Positions(Test_Python):
+
+    def setup_class(cls):
+        parser, lexer = pythonprolog.load()
+        cls.lexer = lexer
+        cls.parser = parser
+        cls.parser.init_ast()
+        cls.ast = cls.parser.previous_version
+        cls.treemanager = TreeManager()
+        cls.treemanager.add_parser(cls.parser, cls.lexer, pythonprolog.name)
+
+        cls.treemanager.set_font_test(7, 17) # hard coded. PyQt segfaults in test suite
+
+    def terminals(self):
+        # (node, offset, line) of every terminal in the order of the text
+        result = []
+        offset = line = 0
+        node = self.treemanager.get_bos()
+        while True:
+            if isinstance(node, EOS):
+                lbox = node.get_root().get_magicterminal()
+                if lbox is None:
+                    break
+                node = lbox.next_term
+                continue
+            if isinstance(node.symbol, MagicTerminal):
+                node = node.symbol.ast.children[0]
+                continue
+            if node.symbol.name == "\r":
+                line += 1
+            result.append((node, offset, line))
+            if not isinstance(node, BOS) and not isinstance(node.symbol, IndentationTerminal):
+                offset += len(node.symbol.name)
+            node = node.next_term
+        return result
+
+    def check(self):
+        text = self.treemanager.export_as_text()
+        ast = self.parser.previous_version
+        assert ast.parent.get_extent() == (len(text), text.count("\n"))
+        for node, offset, line in self.terminals():
+            if node.symbol.name == "\r":
+                assert node.get_offset() == (offset, line - 1)
+            else:
+                assert node.get_offset() == (offset, line)
+            assert self.treemanager.get_line_of(node) == line
+            if node.symbol.name and not isinstance(node.symbol, IndentationTerminal):
+                end = offset + len(node.symbol.name)
+                assert ast.find_node_at_pos(end) == (node, len(node.symbol.name))
+        lines = text.split("\n")
+        for i in range(len(lines)):
+            assert ast.find_line_start(i) == sum(len(l) + 1 for l in lines[:i])
+        assert ast.find_line_start(len(lines)) == len(text)
+        assert ast.find_node_at_pos(0) == (self.treemanager.get_bos(), 0)
+
+    def test_edits(self):
+        self.reset()
+        for c in "class X:\r    def x():\r        return 1\r\rx = 2":
+            self.treemanager.key_normal(c)
+            self.check()
+        self.treemanager.key_cursors(UP)
+        self.treemanager.key_cursors(UP)
+        for i in range(5):
+            self.treemanager.key_backspace()
+            self.check()
+
+    def test_languagebox(self):
+        self.reset()
+        for c in "x = 1\r":
+            self.treemanager.key_normal(c)
+        self.treemanager.add_languagebox(lang_dict["Prolog"])
+        for c in "abc.\rdef.":
+            self.treemanager.key_normal(c)
+            self.check()
+        self.treemanager.leave_languagebox()
+        for c in "\ry = 2":
+            self.treemanager.key_normal(c)
+            self.check()
+
+    def test_undo(self):
+        self.reset()
+        self.treemanager.version = 1
+        self.treemanager.last_saved_version = 1
+        for c in "x = 1\ry = 2\r":
+            self.treemanager.key_normal(c)
+            self.treemanager.undo_snapshot()
+        self.check()
+        for i in range(6):
+            self.treemanager.key_ctrl_z()
+            self.check()
+        for i in range(3):
+            self.treemanager.key_shift_ctrl_z()
+            self.check()
+
+    def test_jump_to_error(self):
+        self.reset()
+        for c in "x = 1\ry = = 2\rz = 3":
+            self.treemanager.key_normal(c)
+        assert self.parser.last_status == False
+        self.treemanager.jump_to_error(self.parser)
+        assert self.treemanager.cursor.line == 1
+        assert self.treemanager.cursor.node is self.parser.error_node
+
+class Test_Search(Test_Python):
+
+    def setup_class(cls):
+        parser, lexer = pythonprolog.load()
+        cls.lexer = lexer
+        cls.parser = parser
+        cls.parser.init_ast()
+        cls.ast = cls.parser.previous_version
+        cls.treemanager = TreeManager()
+        cls.treemanager.add_parser(cls.parser, cls.lexer, pythonprolog.name)
+
+        cls.treemanager.set_font_test(7, 17) # hard coded. PyQt segfaults in test suite
+
+    def type(self, text):
+        for c in text:
+            self.treemanager.key_normal(c)
+
+    def check(self, pattern, regex=False):
+        text = self.treemanager.export_as_text()
+        expected = re.escape(pattern) if not regex else pattern
+        expected = [(m.start(), m.end()) for m in re.finditer(expected, text)]
+        matches = self.treemanager.find_all(pattern, regex)
+        assert [(m.start, m.end) for m in matches] == expected
+        for m in matches:
+            for node, pos, offset, line in [(m.node, m.pos, m.start, m.line),
+                                            (m.end_node, m.end_pos, m.end, m.end_line)]:
+                assert node.get_offset()[0] + pos == offset
+                assert 0 < pos <= len(node.symbol.name) or offset == pos == 0
+                assert line == text.count("\n", 0, offset)
+        return matches
+
+    def test_across_tokens(self):
+        self.reset()
+        self.type("def foo():\r    return foo\r\rdef  foo(): pass")
+        assert len(self.check("def foo")) == 1
+        assert len(self.check("foo")) == 3
+        assert len(self.check(":\n    return")) == 1
+        assert len(self.check(r"def\s+foo\(\)", regex=True)) == 2
+        assert self.check("nothing") == []
+
+    def test_languagebox(self):
+        self.reset()
+        self.type("x = 1\r")
+        self.treemanager.add_languagebox(lang_dict["Prolog"])
+        self.type("abc.\rdef.")
+        self.treemanager.leave_languagebox()
+        self.type("\ry = 2")
+        assert len(self.check("1\nabc")) == 1
+        assert len(self.check("def.\ny")) == 1
+        assert len(self.check("[a-z]+\\.", regex=True)) == 2
+
+    def test_find_text(self):
+        self.reset()
+        self.type("x = 1\ry = 1\rz = 1")
+        self.treemanager.cursor_reset()
+        self.treemanager.find_text("= 1\ny")
+        start = self.treemanager.selection_start
+        end = self.treemanager.selection_end
+        assert (start.node.symbol.name, start.pos, start.line) == (" ", 1, 0)
+        assert (end.node.symbol.name, end.pos, end.line) == ("y", 1, 1)
+        assert self.treemanager.cursor == end
+        self.treemanager.find_text("1")
+        assert self.treemanager.selection_start.line == 1
+        self.treemanager.find_next()
+        assert self.treemanager.selection_start.line == 2
+        self.treemanager.find_next()
+        assert self.treemanager.selection_start.line == 0
+
+    def test_edits(self):
+        chunk_size = searchindex.CHUNK_SIZE
+        searchindex.CHUNK_SIZE = 16
+        try:
+            self.reset()
+            self.type("class X:\r    def x():\r        return 1\r\rx = 2")
+            self.check("x")
+            chunks = list(self.treemanager.search_index.chunks)
+            assert len(chunks) > 4
+            self.treemanager.key_cursors(UP)
+            self.treemanager.key_cursors(UP)
+            self.treemanager.key_end()
+            self.type(" + x")
+            assert len(self.check("x")) == 3
+            # only the changed part of the tree was indexed again
+            reused = set(self.treemanager.search_index.chunks) & set(chunks)
+            assert len(reused) > 1
+            for i in range(4):
+                self.treemanager.key_backspace()
+            assert len(self.check("x")) == 2
+        finally:
+            searchindex.CHUNK_SIZE = chunk_size
+
 class Test_Backslash(Test_Python):
 
     def test_parse(self):
@@ -2617,6 +2982,131 @@ self.key_normal('e')"""
     def foo():
         x = SELECT * FROM table"""
 
+class Test_EditBatch(Test_Python):
+
+    def setup_class(cls):
+        parser, lexer = pythonprolog.load()
+        cls.lexer = lexer
+        cls.parser = parser
+        cls.parser.init_ast()
+        cls.ast = cls.parser.previous_version
+        cls.treemanager = TreeManager()
+        cls.treemanager.add_parser(cls.parser, cls.lexer, pythonprolog.name)
+
+        cls.treemanager.set_font_test(7, 17) # hard coded. PyQt segfaults in test suite
+
+    def count_parses(self, monkeypatch):
+        parsed = []
+        inc_parse = IncParser.inc_parse
+        def counting(parser, *args):
+            parsed.append(parser)
+            return inc_parse(parser, *args)
+        monkeypatch.setattr(IncParser, "inc_parse", counting)
+        return parsed
+
+    def tokens(self):
+        node = self.treemanager.get_bos()
+        result = []
+        while node is not None:
+            result.append((node.symbol.name, node.lookup))
+            node = node.next_term
+        return result
+
+    def edit(self):
+        for c in "class X:\r    def x():\r        return 1\r":
+            self.treemanager.key_normal(c)
+        self.treemanager.key_cursors(UP)
+        self.treemanager.key_end()
+        self.treemanager.key_backspace()
+        self.treemanager.pasteText("x + 2")
+        self.treemanager.selection_start = self.treemanager.cursor.copy()
+        self.move(LEFT, 3)
+        self.treemanager.selection_end = self.treemanager.cursor.copy()
+        self.treemanager.deleteSelection()
+
+    def test_batch(self, monkeypatch):
+        self.reset()
+        self.edit()
+        expected = self.tokens()
+        status = self.parser.last_status
+
+        self.reset()
+        parsed = self.count_parses(monkeypatch)
+        version = self.treemanager.version
+        with self.treemanager.batch():
+            self.edit()
+            assert parsed == []
+            assert self.treemanager.version == version
+        assert parsed == [self.parser]
+        assert self.treemanager.version == version + 1
+        assert self.parser.last_status == status
+        assert self.tokens() == expected
+
+    def test_undo(self):
+        self.reset()
+        self.treemanager.version = 1
+        self.treemanager.last_saved_version = 1
+        for c in "x = 1":
+            self.treemanager.key_normal(c)
+        self.treemanager.undo_snapshot()
+        with self.treemanager.batch():
+            self.treemanager.pasteText("\ry = 2")
+            for c in "\rz = 3":
+                self.treemanager.key_normal(c)
+        self.treemanager.undo_snapshot()
+        assert self.treemanager.export_as_text() == "x = 1\ny = 2\nz = 3"
+        self.treemanager.key_ctrl_z()
+        assert self.treemanager.export_as_text() == "x = 1"
+        self.treemanager.key_shift_ctrl_z()
+        assert self.treemanager.export_as_text() == "x = 1\ny = 2\nz = 3"
+
+    def test_undo_in_batch(self):
+        self.reset()
+        self.treemanager.version = 1
+        self.treemanager.last_saved_version = 1
+        with self.treemanager.batch():
+            for c in "x = 1":
+                self.treemanager.key_normal(c)
+            self.treemanager.undo_snapshot()
+            with self.treemanager.batch():
+                self.treemanager.pasteText("\ry = 2")
+            self.treemanager.key_ctrl_z()
+            assert self.treemanager.export_as_text() == "x = 1"
+        assert self.parser.last_status == True
+
+    def test_languagebox(self, monkeypatch):
+        self.reset()
+        parsed = self.count_parses(monkeypatch)
+        with self.treemanager.batch():
+            for c in "x = 1\r":
+                self.treemanager.key_normal(c)
+            self.treemanager.add_languagebox(lang_dict["Prolog"])
+            for c in "abc.\rdef.":
+                self.treemanager.key_normal(c)
+            self.treemanager.leave_languagebox()
+            for c in "\ry = 2":
+                self.treemanager.key_normal(c)
+        prolog = self.treemanager.parsers[1][0]
+        # add_parser parsed the language box once already, while it was empty
+        assert parsed == [prolog, self.parser, prolog]
+        assert self.parser.last_status == True
+        assert prolog.last_status == True
+        assert self.treemanager.export_as_text() == "x = 1\nabc.\ndef.\ny = 2"
+
+    def test_inputlog(self):
+        log = "\n".join(["self.key_normal(%r)" % c for c in "def f():\r    return 1\r"] +
+                        ["self.key_backspace()", "self.key_cursors(KEY_UP, False)",
+                         "self.key_end()", "self.pasteText(' + f()')"])
+        self.reset()
+        self.treemanager.apply_inputlog(log)
+        expected = self.tokens()
+        self.reset()
+        version = self.treemanager.version
+        self.treemanager.apply_inputlog(log, batch=True)
+        assert self.treemanager.version == version + 1
+        assert self.parser.last_status == True
+        assert self.tokens() == expected
+
 class Test_Comments_Indents(Test_Python):
     def test_newline(self):
         for c in "y = 12 # blaz = 13":
@@ -2638,3 +3128,134 @@ y = 13""":
         self.treemanager.key_normal("#")
         assert self.parser.last_status == True
         
+
+class Test_Batch:
+
+    def make_document(self, path, text):
+        from jsonmanager import JsonManager
+        parser, lexer = calc.load()
+        t = TreeManager()
+        t.add_parser(parser, lexer, calc.name)
+        for c in text:
+            t.key_normal(c)
+        JsonManager().save(t.parsers[0][0].previous_version.parent, calc.name, True, str(path))
+
+    def test_export(self, tmpdir):
+        import batch
+        docs = tmpdir.mkdir("docs")
+        self.make_document(docs.join("a.eco"), "1+2")
+        self.make_document(docs.mkdir("sub").join("b.eco"), "3*4")
+        self.make_document(docs.join("c.eco"), "1+")
+        out = tmpdir.join("out")
+
+        documents = batch.find_documents([str(docs)])
+        assert [d[1] for d in documents] == ["a.eco", "c.eco", "sub/b.eco"]
+        jobs = batch.make_jobs(documents, str(out), ".txt")
+        results = batch.run_batch(jobs, processes=1)
+        assert [r.ok for r in results] == [True, False, True]
+        assert results[1].error == "syntactically invalid"
+        assert out.join("a.txt").read() == "1+2"
+        assert out.join("sub").join("b.txt").read() == "3*4"
+
+    def test_export_pool(self, tmpdir):
+        import batch
+        self.make_document(tmpdir.join("a.eco"), "1+2")
+        tmpdir.join("broken.eco").write("not a document")
+        jobs = batch.make_jobs(batch.find_documents([str(tmpdir.join("a.eco")), str(tmpdir.join("broken.eco"))]), str(tmpdir), ".out")
+        results = batch.run_batch(jobs, processes=2, preload=[calc.name])
+        assert results[0].ok
+        assert not results[1].ok
+        assert "ValueError" in results[1].error
+        assert tmpdir.join("a.out").read() == "1+2"
+
+class Test_UndoRetention(Test_Python):
+
+    def reset(self):
+        Test_Python.reset(self)
+        self.treemanager.version = 1
+        self.treemanager.last_saved_version = 1
+
+    def type_save(self, text):
+        self.treemanager.key_normal(text)
+        self.treemanager.undo_snapshot()
+
+    def compare(self, text):
+        assert self.treemanager.export_as_text("/tmp/temp.py") == text
+
+    def test_compact_history(self):
+        self.reset()
+        for text in ["x", " = ", "1", "\r", "y", " = ", "2"]:
+            self.type_save(text)
+        self.compare("x = 1\ny = 2")
+        tm = self.treemanager
+        assert tm.version == 8
+
+        report = tm.compact_history(4)
+        assert report["versions"] == 3
+        assert report["snapshots"] > 0
+        assert report["bytes"] > 0
+        assert tm.base_version == 4
+        assert min(tm.saved_parsers) == 4
+        assert min(tm.cursor.log) == 4
+        assert min(self.parser.status_by_version) == 4
+        assert tm.compact_history(3) is None
+
+        for i in range(10):
+            tm.key_ctrl_z()
+        self.compare("x = 1")
+        assert tm.version == 4
+        for i in range(10):
+            tm.key_shift_ctrl_z()
+        self.compare("x = 1\ny = 2")
+
+        tm.key_ctrl_z()
+        self.compare("x = 1\ny = ")
+        self.type_save("3")
+        self.compare("x = 1\ny = 3")
+        tm.key_ctrl_z()
+        self.compare("x = 1\ny = ")
+
+    def test_policy(self):
+        from incparser.history import RetentionPolicy
+        self.reset()
+        self.treemanager.history_policy = RetentionPolicy(max_versions=5, interval=4)
+        for c in "x = 12345\r":
+            self.type_save(c)
+        tm = self.treemanager
+        assert tm.version == 11
+        assert tm.base_version == 8 - 5 + 1
+        for i in range(20):
+            tm.key_ctrl_z()
+        self.compare("x =")
+        for i in range(20):
+            tm.key_shift_ctrl_z()
+        self.compare("x = 12345\n")
+
+class Test_ATerms:
+
+    def setup_class(cls):
+        parser, lexer = calc.load()
+        cls.treemanager = TreeManager()
+        cls.treemanager.add_parser(parser, lexer, calc.name)
+
+    def test_export(self, tmpdir):
+        from export import ATerms
+        for c in "1+2":
+            self.treemanager.key_normal(c)
+        start = self.treemanager.get_bos().parent
+        term = ATerms.export(start)
+        assert term == """Root(("''"), Startrule(WS(), E(E(T(P(INT("'1'"), WS()))), plus("'+'"), WS(), T(P(INT("'2'"), WS())))))"""
+        path = str(tmpdir.join("out.aterm"))
+        assert self.treemanager.export_aterms(path)
+        assert open(path).read() == term
+
+    def test_export_deep(self):
+        from export import ATerms
+        parser, lexer = calc.load()
+        t = TreeManager()
+        t.add_parser(parser, lexer, calc.name)
+        t.import_file("+".join(["1"] * 2000))
+        assert parser.last_status == True
+        # deeper than the recursion limit
+        term = ATerms.export(t.get_bos().parent)
+        assert term.count("INT(") == 2000
@@ -0,0 +1,137 @@
+# Copyright (c) 2012--2014 King's College London
+# Created by the Software Development Team <http://soft-dev.org/>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to
+# deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+# sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+
+
+import random
+
+from lineindex import LineIndex, MAX_ITEMS
+from treemanager import Line
+
+def make_lines(count, start=0):
+    lines = []
+    for i in range(start, start + count):
+        line = Line(i, height=1 + i % 3)
+        line.width = i % 50
+        lines.append(line)
+    return lines
+
+def check(index, expected):
+    assert len(index) == len(expected)
+    assert all(a is b for a, b in zip(index, expected))
+    assert index.height == sum(l.height for l in expected)
+    assert index.width == max([l.width for l in expected] or [0])
+
+def test_list_operations():
+    lines = make_lines(10)
+    index = LineIndex(lines)
+    check(index, lines)
+    assert index[3] is lines[3]
+    assert index[-1] is lines[-1]
+    assert index[2:5] == lines[2:5]
+    new = Line("new")
+    index.insert(4, new)
+    lines.insert(4, new)
+    check(index, lines)
+    del index[2]
+    del lines[2]
+    check(index, lines)
+    del index[1:4]
+    del lines[1:4]
+    check(index, lines)
+    index.append(new)
+    lines.append(new)
+    index.extend(make_lines(3, 100))
+    lines.extend(make_lines(3, 100))
+    assert [l.node for l in index] == [l.node for l in lines]
+    try:
+        index[len(lines)]
+    except IndexError:
+        pass
+    else:
+        assert False
+
+def test_random_edits():
+    rnd = random.Random(0)
+    lines = make_lines(1000)
+    index = LineIndex(lines)
+    for i in range(2000):
+        op = rnd.random()
+        if op < 0.5 or len(lines) < 10:
+            y = rnd.randrange(len(lines) + 1)
+            line = make_lines(1, rnd.randrange(1000))[0]
+            index.insert(y, line)
+            lines.insert(y, line)
+        elif op < 0.9:
+            y = rnd.randrange(len(lines))
+            del index[y]
+            del lines[y]
+        else:
+            start = rnd.randrange(len(lines))
+            stop = start + rnd.randrange(3 * MAX_ITEMS)
+            del index[start:stop]
+            del lines[start:stop]
+        if i % 100 == 0:
+            check(index, lines)
+    check(index, lines)
+    for y in range(0, len(lines), 7):
+        assert index[y] is lines[y]
+
+def test_heights():
+    lines = make_lines(500)
+    index = LineIndex(lines)
+    y = 0
+    for i, line in enumerate(lines):
+        assert index.height_before(i) == y
+        for dy in range(line.height):
+            assert index.find_height(y + dy) == (i, y)
+        y += line.height
+    assert index.height_before(len(lines)) == y
+    assert index.find_height(y) == (len(lines), y)
+    assert index.find_height(-5) == (0, 0)
+
+def test_set_height():
+    lines = make_lines(300)
+    index = LineIndex(lines)
+    index.set_height(200, 10)
+    # lines are replaced, not changed
+    assert lines[200].height == 1 + 200 % 3
+    assert index[200].height == 10
+    assert index[200].node == lines[200].node
+    assert index.height == sum(l.height for l in lines) - lines[200].height + 10
+    assert index.find_height(index.height_before(200) + 9)[0] == 200
+    index.set_width(5, 1000)
+    assert index.width == 1000
+
+def test_versions_share_structure():
+    lines = make_lines(1000)
+    index = LineIndex(lines)
+    saved = index.root
+    del index[500]
+    index.insert(10, Line("new"))
+    index.set_height(900, 5)
+    # the saved version is unaffected and can be restored
+    current = index.root
+    index.root = saved
+    check(index, lines)
+    index.root = current
+    assert len(index) == 1000
+    # only the chunks on the paths to the changes were copied
+    assert len(set(map(id, saved.items)) & set(map(id, current.items))) > 0
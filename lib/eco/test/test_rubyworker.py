@@ -0,0 +1,165 @@
+# Copyright (c) 2012--2014 King's College London
+# Created by the Software Development Team <http://soft-dev.org/>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to
+# deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+# sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+
+
+import os, sys, time
+
+from rubyparser.worker import ParserWorker, FAILED, find_error
+
+# Stands in for e.g. `ruby-parse`: reports the first occurrence of "error"
+# and logs the files it was run on to the file given as its first argument.
+standin = """
+import sys
+log, path = sys.argv[1:]
+with open(log, "a") as f:
+    f.write(path + "\\n")
+for i, line in enumerate(open(path).read().split("\\n")):
+    if "error" in line:
+        print("%s:%d:%d: syntax error" % (path, i + 1, line.index("error")))
+        break
+else:
+    print("Syntax OK")
+"""
+
+def make_command(tmpdir):
+    script = tmpdir.join("standin.py")
+    script.write(standin)
+    return [sys.executable, str(script), str(tmpdir.join("log"))]
+
+def parsed_files(tmpdir):
+    if not tmpdir.join("log").check():
+        return []
+    return tmpdir.join("log").read().split()
+
+def test_find_error():
+    assert find_error("Syntax OK\n", "/tmp/a.rb") is None
+    assert find_error("/tmp/a.rb:3:7: error: unexpected token\n", "/tmp/a.rb") == (3, 7)
+    # ruby -c
+    assert find_error("/tmp/a.rb: /tmp/a.rb:3: syntax error, unexpected `end'\n", "/tmp/a.rb") == (3, 0)
+    assert find_error("/tmp/a.rb:1: warning: possibly useless use of + in void context\n", "/tmp/a.rb") is None
+
+def test_parse(tmpdir, monkeypatch):
+    monkeypatch.setenv("TMPDIR", str(tmpdir))
+    worker = ParserWorker(make_command(tmpdir), delay=0)
+    worker.request(1, "x = 1\n")
+    assert worker.wait(1, 10) is None
+    worker.request(2, "x = 1\n  error\n")
+    assert worker.wait(2, 10) == (2, 2)
+    assert worker.get_result(1) is False
+    # one worker and one file for all requests
+    pid = worker.proc.pid
+    worker.request(3, "y = 2\n")
+    assert worker.wait(3, 10) is None
+    assert worker.proc.pid == pid
+    files = parsed_files(tmpdir)
+    assert len(files) == 3 and len(set(files)) == 1
+    assert os.path.dirname(files[0]) == str(tmpdir)
+    worker.close()
+    assert not os.path.exists(files[0])
+
+def test_debounce(tmpdir):
+    worker = ParserWorker(make_command(tmpdir), delay=0.5)
+    for version in range(1, 6):
+        worker.request(version, "error %d\n" % version)
+    assert worker.get_result(5) is False
+    assert worker.wait(5, 10) == (1, 0)
+    # only the last request was sent
+    assert len(parsed_files(tmpdir)) == 1
+    assert worker.get_result(4) is False
+    worker.close()
+
+def test_stale(tmpdir):
+    worker = ParserWorker(make_command(tmpdir), delay=0)
+    worker.request(1, "error\n")
+    time.sleep(0.1) # sent to the worker
+    worker.request(2, "x = 1\n")
+    assert worker.wait(2, 10) is None
+    # the answer to request 1 arrived after it had been replaced
+    assert worker.get_result(1) is False
+    assert worker.result == (2, None)
+    worker.close()
+
+def test_restart(tmpdir):
+    worker = ParserWorker(make_command(tmpdir), delay=0)
+    worker.request(1, "x = 1\n")
+    assert worker.wait(1, 10) is None
+    worker.proc.kill()
+    worker.proc.wait()
+    worker.request(2, "x = 2\n")
+    worker.wait(2, 10)
+    worker.request(3, "error\n")
+    assert worker.wait(3, 10) == (1, 0)
+    worker.close()
+
+def test_rubyparser(tmpdir):
+    from grammars.grammars import lang_dict
+    from treemanager import TreeManager
+    parser, lexer = lang_dict["Ruby"].load()
+    parser.command = " ".join(make_command(tmpdir))
+    tm = TreeManager()
+    tm.add_parser(parser, lexer, "Ruby")
+    tm.set_font_test(7, 17)
+    for c in "x = 1\rerror\r":
+        tm.key_normal(c)
+    parser.wait(10)
+    assert parser.last_status == False
+    assert parser.error_node.symbol.name == "error"
+    tm.jump_to_error(parser)
+    assert tm.cursor.line == 1
+    tm.key_backspace()
+    tm.key_backspace()
+    # not parsed yet: the status is the one of the last parsed text
+    assert parser.last_status == False
+    parser.wait(10)
+    assert parser.last_status == True
+    assert parser.error_node is None
+    parser.worker.close()
+
+def test_missing_command(tmpdir):
+    worker = ParserWorker([str(tmpdir.join("ruby-parse"))], delay=0)
+    worker.request(1, "def x(\n")
+    assert worker.wait(1, 10) == FAILED
+    # the worker keeps running instead of being restarted for every request
+    pid = worker.proc.pid
+    worker.request(2, "def x(\n")
+    assert worker.wait(2, 10) == FAILED
+    assert worker.proc.pid == pid
+    worker.close()
+
+def test_rubyparser_missing_command(tmpdir):
+    from grammars.grammars import lang_dict
+    from treemanager import TreeManager
+    parser, lexer = lang_dict["Ruby"].load()
+    parser.command = " ".join(make_command(tmpdir))
+    tm = TreeManager()
+    tm.add_parser(parser, lexer, "Ruby")
+    tm.set_font_test(7, 17)
+    for c in "error\r":
+        tm.key_normal(c)
+    parser.wait(10)
+    assert parser.last_status == False
+    parser.command = str(tmpdir.join("ruby-parse"))
+    tm.key_normal("x")
+    parser.wait(10)
+    # the failure isn't taken for a text without errors
+    assert parser.worker.get_result(parser.requested) == FAILED
+    assert parser.last_status == False
+    parser.worker.close()
@@ -22,6 +22,9 @@
 from incparser.incparser import IncParser
 from inclexer.inclexer import IncrementalLexer
 from incparser.astree import TextNode, BOS, EOS
+from incparser.history import VersionLog
+from lineindex import LineIndex
+from searchindex import SearchIndex
 from grammar_parser.gparser import Terminal, MagicTerminal, IndentationTerminal
 from PyQt4.QtGui import QApplication
 from PyQt4.QtCore import QSettings
@@ -34,7 +37,8 @@ from export.simple_language import SimpleLanguageExporter
 from export.cpython import CPythonExporter
 from utils import arrow_keys, KEY_UP, KEY_DOWN, KEY_LEFT, KEY_RIGHT
 
-import math
+import contextlib, math, sys, time, gc
+import logging
 
 class FontManager(object):
     def __init__(self):
@@ -313,19 +317,27 @@ class TreeManager(object):
     version = 1
 
     def __init__(self):
-        self.lines = []             # storage for line objects
+        self.lines = LineIndex()    # storage for line objects
         self.mainroot = None        # root node (main language)
         self.parsers = []           # stores all currently used parsers
         self.edit_rightnode = False # changes which node to select when inbetween two nodes
         self.changed = False
         self.last_search = ""
+        self.last_search_regex = False
+        self.search_index = None
         self.version = 1
         TreeManager.version = 1
         self.last_saved_version = 1
         self.savenextparse = False
-        self.saved_lines = {}
+        self.saved_lines = VersionLog()
         self.saved_parsers = {}
         self.undo_snapshots = []
+        self.base_version = 1           # oldest version undo can go back to
+        self.version_stats = {}         # version -> (time, saved nodes)
+        self.history_policy = None      # see incparser.history.RetentionPolicy
+        self.batch_depth = 0            # nesting of batch() blocks
+        self.batch_roots = []           # roots to parse when the batch ends
+        self.batch_pending = False      # edits in the batch not yet saved
 
         self.tool_data_is_dirty = False
 
@@ -579,7 +591,7 @@ class TreeManager(object):
     def find_next(self):
         self.log_input("find_next")
         if self.last_search != "":
-            self.find_text(self.last_search)
+            self.find_text(self.last_search, self.last_search_regex)
 
     def find_text_no_cursor(self, text, parent_name='funcdef'):
         # FIXME - infinite loop!
@@ -593,73 +605,45 @@ class TreeManager(object):
         self.cursor = temp
         return node
 
-    def find_text(self, text):
-        startnode = self.cursor.node
-        node = self.cursor.node.next_term
-        line = self.cursor.line
-        index = -1
-        while node is not self.cursor.node:
-            if node is startnode:
-                break
-            if isinstance(node.symbol, MagicTerminal):
-                node = node.symbol.ast.children[0]
-                continue
-            if isinstance(node, EOS):
-                root = node.get_root()
-                lbox = root.get_magicterminal()
-                if lbox:
-                    node = lbox.next_term
-                    continue
-                else:
-                    # start from beginning
-                    node = self.get_bos()
-                    line = 0
-            index = node.symbol.name.find(text)
-            if index > -1:
-                break
-
-            if node.symbol.name == "\r":
-                line += 1
-            node = node.next_term
-        if index > -1:
-            self.cursor.line = line
-            self.cursor.node = node
-            self.cursor.pos = index
+    def get_search_index(self):
+        """Return the index of the document's text, brought up to date."""
+        root = self.get_bos().parent
+        if self.search_index is None or self.search_index.root is not root:
+            self.search_index = SearchIndex(root)
+        self.search_index.refresh()
+        return self.search_index
+
+    def find_all(self, text, regex=False):
+        """Return all matches of `text` in the document, a substring or, if
+        `regex` is true, a regular expression, as searchindex.Match objects.
+        Matches can span several tokens and language boxes."""
+        return self.get_search_index().find_all(text, regex)
+
+    def find_text(self, text, regex=False):
+        """Select the next match of `text` after the cursor, continuing from
+        the beginning of the document if there is none."""
+        index = self.get_search_index()
+        offset = self.cursor.node.get_offset()[0] + self.cursor.pos
+        match = index.find(text, offset, regex)
+        if match is not None:
+            self.cursor.node = match.node
+            self.cursor.pos = match.pos
+            self.cursor.line = match.line
             self.selection_start = self.cursor.copy()
-            self.cursor.pos += len(text)
+            self.cursor.node = match.end_node
+            self.cursor.pos = match.end_pos
+            self.cursor.line = match.end_line
             self.selection_end = self.cursor.copy()
         self.last_search = text
+        self.last_search_regex = regex
 
     def jump_to_error(self, parser):
-        bos = parser.previous_version.parent.children[0]
-        eos = parser.previous_version.parent.children[-1]
-        node = bos
-        while node is not eos:
-            if node is parser.error_node:
-                break
-            node = node.next_term
-
-        # get linenode
-        linenode = node
-        while True:
-            if isinstance(linenode, BOS):
-                break
-            if linenode is None:
-                break
-            if linenode.symbol.name == "\r":
-                break
-            linenode = self.cursor.find_previous_visible(linenode)
-
-        # get line number
-        linenr = 0
-        for line in self.lines:
-            if linenode is None:
-                break
-            if line.node is linenode:
-                break
-            linenr += 1
+        root = parser.previous_version.parent
+        eos = root.children[-1]
+        node = parser.error_node
+        if node is None or node.deleted or node.get_root() is not root:
+            node = eos
 
-        self.cursor.line = linenr
         self.cursor.node = node
         self.cursor.pos = 0
         if node is eos:
@@ -672,6 +656,7 @@ class TreeManager(object):
         if isinstance(node.symbol, MagicTerminal):
             self.cursor.node = self.cursor.find_previous_visible(node)
             self.cursor.pos = len(self.cursor.node.symbol.name)
+        self.cursor.line = self.get_line_of(self.cursor.node)
         self.selection_start = self.cursor.copy()
         self.selection_end = self.cursor.copy()
 
@@ -679,6 +664,7 @@ class TreeManager(object):
 
     def key_shift_ctrl_z(self):
         self.log_input("key_shift_ctrl_z")
+        self.flush_batch()
         try:
             i = self.undo_snapshots.index(self.version)
             if i == len(self.undo_snapshots) - 1:
@@ -694,14 +680,12 @@ class TreeManager(object):
 
     def get_max_version(self):
         root = self.get_bos().parent
-        maxversion = 0
-        for (key, version) in root.log.keys():
-            maxversion = max(maxversion, version)
-        return maxversion
+        return max(0, root.log.max_version())
 
     def key_ctrl_z(self):
         self.log_input("key_ctrl_z")
-        if len(self.undo_snapshots) == 0 and self.get_max_version() > 1:
+        self.flush_batch()
+        if len(self.undo_snapshots) == 0 and self.get_max_version() > self.base_version:
             self.undo_snapshots.append(self.version)
         if not self.undo_snapshots:
             return
@@ -713,7 +697,7 @@ class TreeManager(object):
         except ValueError:
             return
         if i == 0:
-            undo_amount = self.version - 1
+            undo_amount = self.version - self.base_version
         else:
             undo_amount = self.undo_snapshots[i] - self.undo_snapshots[i-1]
         for i in range(undo_amount):
@@ -770,12 +754,13 @@ class TreeManager(object):
 
     def clean_versions(self, version):
         # clean linenumbers
-        for key in self.saved_lines.keys():
-            if key > version:
-                del self.saved_lines[key]
+        self.saved_lines.delete_from(version)
         for key in self.saved_parsers.keys():
             if key > version:
                 del self.saved_parsers[key]
+        for key in self.version_stats.keys():
+            if key > version:
+                del self.version_stats[key]
         self.cursor.clean_versions(version)
         for i in range(len(self.undo_snapshots)):
             if self.undo_snapshots[i] > version:
@@ -800,46 +785,24 @@ class TreeManager(object):
                     node = self.pop_lookahead(node)
 
     def delete_versions_from(self, node, version):
-        for (key, v) in node.log.keys():
-            if v > version:
-                del node.log[(key, v)]
+        node.log.delete_from(version)
 
     def save_lines(self):
-        # check if lines have changed
-        lines = self.get_lines_from_version(self.version)
-        if len(lines) != len(self.lines):
-            self.saved_lines[self.version] = list(self.lines)
-            return
-
-        # check if nodes are different (e.g. we could delete and reinsert a line between saves)
-        for i in range(len(lines)):
-            if lines[i] is not self.lines[i]:
-                self.saved_lines[self.version] = list(self.lines)
-                return
+        # the line index shares its structure between versions, so saving it
+        # only stores its root, which stays the same as long as no line changed
+        if self.saved_lines.get(self.version) is not self.lines.root:
+            self.saved_lines.set(self.version, self.lines.root)
 
     def get_lines_from_version(self, version):
-        version = self.version
-        while True:
-            if version == -1:
-                return []
-            try:
-                l = self.saved_lines[version]
-                break
-            except KeyError:
-                version -= 1
-        return l
+        lines = LineIndex()
+        lines.root = self.saved_lines.get(version)
+        return lines
 
     def load_lines(self):
-        version = self.version
-        while True:
-            if version == 0:
-                return
-            try:
-                l = self.saved_lines[version]
-                break
-            except KeyError:
-                version -= 1
-        self.lines = list(l) # copy, otherwise saved list will be mutated
+        i = self.saved_lines.find(self.version)
+        if i < 0 or self.saved_lines.versions[i] == 0:
+            return
+        self.lines.root = self.saved_lines.values[i]
 
     def save_parsers(self):
         self.saved_parsers[self.version] = list(self.parsers)
@@ -851,6 +814,7 @@ class TreeManager(object):
         self.save_lines()
         self.save_parsers()
         self.cursor.save(self.version)
+        saved = 0
         for l in self.parsers:
             parser = l[0]
             parser.save_status(self.version)
@@ -860,6 +824,7 @@ class TreeManager(object):
             bos.save(self.version)
             eos = root.children[-1]
             eos.save(self.version)
+            saved += 3
             node = self.pop_lookahead(bos)
             while True:
                 if isinstance(node, EOS):
@@ -867,10 +832,80 @@ class TreeManager(object):
                     break
                 if node.has_changes():
                     node.save(self.version)
+                    saved += 1
                     if len(node.children) > 0:
                         node = node.children[0]
                         continue
                 node = self.pop_lookahead(node)
+        self.version_stats[self.version] = (time.time(), saved)
+
+    def enforce_history_policy(self):
+        policy = self.history_policy
+        if policy is None or not policy.due(self.version):
+            return None
+        stats = [(v, t, n) for v, (t, n) in sorted(self.version_stats.iteritems()) if v <= self.version]
+        base = policy.base_version(self.version, stats, time.time())
+        return self.compact_history(base)
+
+    def compact_history(self, base):
+        """Squash all versions before `base` into `base`, which becomes the
+        oldest version that can be restored by undo. Returns a dict with the
+        number of squashed versions and node snapshots, and an estimate of the
+        reclaimed memory in bytes (not counting nodes that are only referenced
+        by squashed versions and can now be garbage collected)."""
+        if base <= self.base_version or base > self.version:
+            return None
+        report = {"versions": base - self.base_version, "snapshots": 0, "bytes": 0}
+
+        # the node logs of all nodes that may still be restored
+        roots = [l[0].previous_version.parent for l in self.parsers]
+        for version, parsers in self.saved_parsers.iteritems():
+            if version >= base:
+                roots.extend([l[0].previous_version.parent for l in parsers])
+        seen = set()
+        todo = roots
+        while todo:
+            node = todo.pop()
+            if id(node) in seen:
+                continue
+            seen.add(id(node))
+            dropped = node.log.squash(base)
+            if dropped:
+                kept = node.log.values[0][0]
+                lists = set()
+                for snapshot in dropped:
+                    report["bytes"] += sys.getsizeof(snapshot) + 12 # version and list slot
+                    if snapshot[0] is not kept and id(snapshot[0]) not in lists:
+                        lists.add(id(snapshot[0]))
+                        report["bytes"] += sys.getsizeof(snapshot[0])
+                report["snapshots"] += len(dropped)
+            todo.extend(node.children)
+            for snapshot in node.log.values:
+                todo.extend(snapshot[0])
+
+        for lines in self.saved_lines.squash(base):
+            report["bytes"] += sys.getsizeof(lines)
+        parsers = set()
+        for key in self.saved_parsers.keys():
+            if key < base:
+                for l in self.saved_parsers.pop(key):
+                    parsers.add(l[0])
+        for l in self.parsers:
+            parsers.add(l[0])
+        for parser in parsers:
+            for d in [getattr(parser, "status_by_version", {}), getattr(parser, "errornode_by_version", {})]:
+                for key in d.keys():
+                    if key < base:
+                        del d[key]
+        for d in [self.cursor.log, self.version_stats]:
+            for key in d.keys():
+                if key < base:
+                    del d[key]
+        self.undo_snapshots = [v for v in self.undo_snapshots if v >= base]
+        self.base_version = base
+        logging.info("Squashed %s versions (%s node snapshots, ~%s KiB) into version %s",
+                     report["versions"], report["snapshots"], report["bytes"] // 1024, base)
+        return report
 
     def key_home(self, shift=False):
         self.log_input("key_home", str(shift))
@@ -1314,6 +1349,7 @@ class TreeManager(object):
         node = self.cursor.node
         if text.startswith(node.symbol.name):
             node.symbol.name = text
+            node.invalidate_extent()
             self.cursor.pos = len(text)
         else:
             self.pasteText(text)
@@ -1498,13 +1534,22 @@ class TreeManager(object):
         text = text.replace("\n","\r")
         parser = self.parsers[0][0]
         lexer = self.parsers[0][1]
-        # lex text into tokens
-        bos = parser.previous_version.parent.children[0]
-        new = TextNode(Terminal(text))
-        bos.insert_after(new)
-        lexer.relex_import(new, self.version+1)
-        self.rescan_linebreaks(0)
-        self.reparse(bos)
+        # Lexing and parsing a file creates millions of objects and frees
+        # hardly any, so the cyclic garbage collector would only walk the
+        # growing tree again and again
+        gc_enabled = gc.isenabled()
+        gc.disable()
+        try:
+            # lex text into tokens
+            bos = parser.previous_version.parent.children[0]
+            new = TextNode(Terminal(text))
+            bos.insert_after(new)
+            newlines = lexer.relex_import(new, self.version+1)
+            self.lines.extend(Line(node) for node in newlines)
+            self.reparse(bos)
+        finally:
+            if gc_enabled:
+                gc.enable()
         self.undo_snapshot()
         self.changed = True
         return
@@ -1670,6 +1715,14 @@ class TreeManager(object):
                 f.write(text)
                 return text
 
+    def get_line_of(self, node):
+        """Return the number of the line containing `node`."""
+        line = node.get_offset()[1]
+        if node.symbol.name == "\r":
+            # line breaks start their line
+            line += 1
+        return line
+
     def export_as_text(self, path=None):
         node = self.lines[0].node # first node
         text = []
@@ -1700,9 +1753,8 @@ class TreeManager(object):
     def export_aterms(self, path):
         start = self.get_bos().parent
         with open(path, "w") as f:
-            text = ATerms.export(start)
-            f.write(text)
-            return text
+            ATerms.export(start, f)
+        return True
 
     def relex(self, node):
         if node is None:
@@ -1721,19 +1773,70 @@ class TreeManager(object):
             self.reparse(self.get_bos(), True)
 
     def reparse(self, node, changed=True):
+        if self.batch_depth > 0:
+            # parsed and saved when the batch ends
+            self.batch_pending = True
+            root = node.get_root()
+            if changed and not any(r is root for r in self.batch_roots):
+                self.batch_roots.append(root)
+            return
+        self.parse_and_save([node.get_root()] if changed else [])
+
+    def parse_and_save(self, roots):
+        """Parse the trees with the given roots and save the result as a new
+        version."""
         if self.version < self.get_max_version():
             # we changed stuff after one or more undos
             # later versions are void -> delete
             self.clean_versions(self.version)
             self.last_saved_version = self.version
-        if changed:
-            root = node.get_root()
+        for root in roots:
             parser = self.get_parser(root)
-            parser.inc_parse()
+            if parser is not None: # language boxes may be deleted in a batch
+                parser.inc_parse()
         self.save_current_version()
         TreeManager.version = self.version
 
+    @contextlib.contextmanager
+    def batch(self):
+        """Make all edits inside the block one change:
+
+            with tm.batch():
+                tm.pasteText(...)
+                ...
+
+        Every edit is still relexed right away, and the lines are updated,
+        so that the following edits see the tokens and lines they expect.
+        But parsing and saving a version is left to the end of the block,
+        where every tree that was changed is parsed once and a single
+        version is saved, which undo reverts as a whole. Until then the
+        parsers' status doesn't reflect the edits. Batches can be nested.
+        Undo snapshots, undo and redo inside a batch first finish the edits
+        made so far."""
+        self.batch_depth += 1
+        try:
+            yield self
+        finally:
+            self.batch_depth -= 1
+            if self.batch_depth == 0:
+                self.flush_batch()
+
+    def flush_batch(self):
+        """Parse and save the edits of the current batch made so far."""
+        if not self.batch_pending:
+            return
+        roots = self.batch_roots
+        depth = self.batch_depth
+        self.batch_roots = []
+        self.batch_pending = False
+        self.batch_depth = 0
+        try:
+            self.parse_and_save(roots)
+        finally:
+            self.batch_depth = depth
+
     def undo_snapshot(self):
+        self.flush_batch()
         if self.undo_snapshots and self.undo_snapshots[-1] == self.version:
             # Snapshot already taken (this can happen in fuzzy tests where
             # undo_snapshot is called without any changes)
@@ -1742,20 +1845,36 @@ class TreeManager(object):
 
     def save_current_version(self):
         self.log_input("save_current_version")
+        if self.batch_depth > 0:
+            self.batch_pending = True
+            return
         self.version += 1
         self.save()
         TreeManager.version = self.version
+        self.enforce_history_policy()
 
     def full_reparse(self):
         for p in self.parsers:
             p[0].reparse()
 
-    def apply_inputlog(self, inputlog):
+    def apply_inputlog(self, inputlog, batch=False):
+        """Replay an input log (see log_input). If `batch` is true, the whole
+        log is applied as one batch (see batch)."""
+        if batch:
+            with self.batch():
+                self.apply_inputlog(inputlog)
+            return
+        # logs repeat the same few lines over and over: compile each once
+        codes = {}
         for l in inputlog.split("\n"):
             l = l.replace("\r", "\\r")
             if l.startswith("#"):
                 continue
-            try:
-                eval(l) # expressions
-            except SyntaxError:
-                exec(l) # statements
+            code = codes.get(l)
+            if code is None:
+                try:
+                    code = compile(l, "<inputlog>", "eval") # expressions
+                except SyntaxError:
+                    code = compile(l, "<inputlog>", "exec") # statements
+                codes[l] = code
+            eval(code)